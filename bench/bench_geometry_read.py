@@ -0,0 +1,91 @@
+import time
+
+import click
+import numpy as np
+from osgeo import ogr
+from shapely import wkt
+
+from changegen.db import feature_geometry
+
+"""
+bench_geometry_read.py
+
+Benchmarks reading OGR feature geometries into shapely: the WKT round
+trip (ExportToWkt + wkt.loads) that changegen used to do, against WKB
+(db.feature_geometry).
+
+Every feature of <source> is read <copies> times, so the inputs
+are sized like the source (e.g. test/data/test_line.geojson, ten
+trails of up to several hundred vertices). The largest coordinate
+error of the WKT round trip is also reported (the WKB path is exact).
+
+    python bench/bench_geometry_read.py --source test/data/test_line.geojson
+
+"""
+
+
+def _features(source):
+    ds = ogr.Open(source)
+    layer = ds.GetLayer()
+    features = [f for f in layer]
+    return ds, features
+
+
+def _read_wkt(features):
+    return [wkt.loads(f.GetGeometryRef().ExportToWkt()) for f in features]
+
+
+def _read_wkb(features):
+    return [feature_geometry(f) for f in features]
+
+
+def _time(f, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _max_error(geoms, exact):
+    """Returns the largest coordinate difference between <geoms> and <exact>
+    (LineStrings)."""
+    return max(
+        np.abs(np.asarray(g.coords) - np.asarray(e.coords)).max()
+        for g, e in zip(geoms, exact)
+    )
+
+
+@click.command()
+@click.option("--source", help="OGR-readable file of features.", required=True)
+@click.option(
+    "--copies",
+    help="Number of times each feature is read.",
+    type=int,
+    default=1000,
+    show_default=True,
+)
+@click.option("--repeat", type=int, default=3, show_default=True)
+def main(source, copies, repeat):
+    ds, features = _features(source)
+    features = features * copies
+    n_vertices = sum(f.GetGeometryRef().GetPointCount() for f in features) // copies
+
+    wkt_t, wkt_geoms = _time(_read_wkt, features, repeat=repeat)
+    wkb_t, wkb_geoms = _time(_read_wkb, features, repeat=repeat)
+
+    click.echo(
+        f"{'features':>8} {'vertices':>9} {'wkt (us/feature)':>17} "
+        f"{'wkb (us/feature)':>17} {'speedup':>8} {'wkt max error':>14}"
+    )
+    click.echo(
+        f"{len(features):>8} {n_vertices:>9} "
+        f"{wkt_t / len(features) * 1e6:>17.1f} {wkb_t / len(features) * 1e6:>17.1f} "
+        f"{wkt_t / wkb_t:>7.1f}x {_max_error(wkt_geoms, wkb_geoms):>14.2e}"
+    )
+
+
+if __name__ == "__main__":
+    main()
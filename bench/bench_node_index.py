@@ -0,0 +1,128 @@
+import math
+import random
+import time
+
+import click
+import rtree
+
+from changegen.changewriter import Node
+from changegen.nodeindex import NodeIndex
+
+"""
+bench_node_index.py
+
+Benchmarks snapping vertices to intersection Nodes: rtree with obj=
+(as changegen used to build it, queried once per vertex) against the
+bulk-loaded NodeIndex (queried for all vertices at once, like
+_snap_to_nodes).
+
+Random intersection Nodes are scattered over a 1 x 1 degree extent,
+and random vertices are snapped to the nearest Node within
+--tolerance. Both indexes must snap to the same Nodes.
+
+    python bench/bench_node_index.py --n_nodes 1000 --n_nodes 100000
+
+Requires rtree (no longer a changegen dependency).
+
+"""
+
+
+def _legacy_rtree(nodes, tolerance):
+    """The rtree index with pickled Nodes, for comparison."""
+    rt = rtree.index.Index()
+    for position, node in enumerate(nodes):
+        rt.insert(
+            position,
+            (
+                node.lon - tolerance,
+                node.lat - tolerance,
+                node.lon + tolerance,
+                node.lat + tolerance,
+            ),
+            obj=node,
+        )
+    return rt
+
+
+def _query_rtree(rt, xs, ys, tolerance):
+    snapped = []
+    for x, y in zip(xs, ys):
+        hits = [
+            (math.hypot(hit.object.lon - x, hit.object.lat - y), hit.id)
+            for hit in rt.intersection((x, y, x, y), objects=True)
+        ]
+        hits = [hit for hit in hits if hit[0] < tolerance]
+        snapped.append(min(hits)[1] if hits else -1)
+    return snapped
+
+
+def _query_node_index(index, xs, ys, tolerance):
+    return list(index.nearest_within(xs, ys, tolerance))
+
+
+def _time(f, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+@click.command()
+@click.option(
+    "--n_nodes",
+    help="Number of intersection Nodes in each benchmarked index.",
+    multiple=True,
+    type=int,
+    default=[1000, 10000, 100000],
+    show_default=True,
+)
+@click.option(
+    "--n_queries",
+    help="Number of vertices snapped with each index.",
+    type=int,
+    default=20000,
+    show_default=True,
+)
+@click.option(
+    "--tolerance",
+    help="Snapping distance (degrees).",
+    type=float,
+    default=0.001,
+    show_default=True,
+)
+@click.option("--repeat", type=int, default=3, show_default=True)
+def main(n_nodes, n_queries, tolerance, repeat):
+    random.seed(0)
+    click.echo(
+        f"{'nodes':>8} {'rtree build (s)':>16} {'index build (s)':>16} "
+        f"{'rtree q/s':>11} {'index q/s':>11} {'speedup':>8}"
+    )
+    for n in n_nodes:
+        nodes = [
+            Node(id=-i, version=1, lat=random.random(), lon=random.random(), tags=[])
+            for i in range(1, n + 1)
+        ]
+        xs = [random.random() for _ in range(n_queries)]
+        ys = [random.random() for _ in range(n_queries)]
+
+        rtree_build_t, rt = _time(_legacy_rtree, nodes, tolerance, repeat=repeat)
+        index_build_t, index = _time(NodeIndex.from_nodes, nodes, repeat=repeat)
+
+        rtree_t, rtree_hits = _time(_query_rtree, rt, xs, ys, tolerance, repeat=repeat)
+        index_t, index_hits = _time(
+            _query_node_index, index, xs, ys, tolerance, repeat=repeat
+        )
+        assert rtree_hits == index_hits, "Snapped Nodes differ."
+
+        click.echo(
+            f"{n:>8} {rtree_build_t:>16.3f} {index_build_t:>16.3f} "
+            f"{n_queries / rtree_t:>11.0f} {n_queries / index_t:>11.0f} "
+            f"{rtree_t / index_t:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os
+import random
+import tempfile
+import time
+
+import click
+import osmium
+
+from changegen.generator import _get_way_node_map
+
+"""
+bench_way_node_map.py
+
+Benchmarks Way -> Node lookups (`_get_way_node_map`) against
+the size of the source extract.
+
+Extracts of increasing size are synthesized by tiling the source
+extract <scale> times with offset IDs, so every extract has the same
+feature density as the source. The same number of Way IDs is looked
+up in each extract. Block-parallel lookups are timed for each
+--workers value.
+
+    python bench/bench_way_node_map.py --osmsrc test/data/osmdata.osm.pbf
+
+"""
+
+
+def _legacy_way_node_map(osm, way_idlist):
+    """The per-way Python callback implementation, for comparison."""
+
+    class _wayFilter(osmium.SimpleHandler):
+        def __init__(self, ids):
+            super(_wayFilter, self).__init__()
+            self.ids = set(ids)
+            self.node_map = {}
+
+        def way(self, w):
+            if str(w.id) in self.ids:
+                self.node_map[str(w.id)] = [str(n.ref) for n in w.nodes]
+
+    _filter = _wayFilter(way_idlist)
+    _filter.apply_file(osm)
+    return _filter.node_map
+
+
+def _as_dict(way_node_map):
+    return {str(k): [str(n) for n in way_node_map[k]] for k in way_node_map}
+
+
+def _tile_extract(osm, scale, outfile):
+    """Writes <scale> copies of <osm> to <outfile>. IDs are renumbered
+    densely (like `osmium renumber`) and offset for each copy so that
+    they don't collide. Returns the list of Way IDs in the new file."""
+    idmaps = {}
+    for entity, key in [
+        (osmium.osm.NODE, "n"),
+        (osmium.osm.WAY, "w"),
+        (osmium.osm.RELATION, "r"),
+    ]:
+        source_ids = sorted(o.id for o in osmium.FileProcessor(osm, entity))
+        idmaps[key] = {_id: idx + 1 for idx, _id in enumerate(source_ids)}
+
+    def _ref(key, _id, copy):
+        return idmaps[key].get(_id, 0) + copy * len(idmaps[key])
+
+    way_ids = []
+    writer = osmium.SimpleWriter(outfile)
+    # PBF files are expected to be sorted by type, then ID.
+    for entity in [osmium.osm.NODE, osmium.osm.WAY, osmium.osm.RELATION]:
+        for copy in range(scale):
+            for o in osmium.FileProcessor(osm, entity):
+                if o.is_node():
+                    writer.add_node(o.replace(id=_ref("n", o.id, copy)))
+                elif o.is_way():
+                    way_ids.append(_ref("w", o.id, copy))
+                    writer.add_way(
+                        o.replace(
+                            id=way_ids[-1],
+                            nodes=[_ref("n", n.ref, copy) for n in o.nodes],
+                        )
+                    )
+                else:
+                    writer.add_relation(
+                        o.replace(
+                            id=_ref("r", o.id, copy),
+                            members=[
+                                (m.type, _ref(m.type, m.ref, copy), m.role)
+                                for m in o.members
+                            ],
+                        )
+                    )
+    writer.close()
+    return way_ids
+
+
+def _time(f, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+@click.command()
+@click.option("--osmsrc", help="Source OSM PBF File path", required=True)
+@click.option(
+    "--scale",
+    help="Number of copies of <osmsrc> in each benchmarked extract.",
+    multiple=True,
+    type=int,
+    default=[1, 2, 4, 8],
+    show_default=True,
+)
+@click.option(
+    "--n_ids",
+    help="Number of Way IDs to look up in each extract.",
+    type=int,
+    default=1000,
+    show_default=True,
+)
+@click.option(
+    "--workers",
+    help="Number of processes for block-parallel lookups.",
+    multiple=True,
+    type=int,
+    default=[],
+)
+@click.option("--repeat", type=int, default=3, show_default=True)
+def main(osmsrc, scale, n_ids, workers, repeat):
+    random.seed(0)
+    click.echo(
+        f"{'scale':>5} {'size (MB)':>10} {'ways':>10} "
+        f"{'legacy (s)':>11} {'filtered (s)':>13} {'speedup':>8}"
+        + "".join(f" {f'{w} workers (s)':>14}" for w in workers)
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for s in scale:
+            extract = os.path.join(tmpdir, f"extract_{s}.osm.pbf")
+            way_ids = _tile_extract(osmsrc, s, extract)
+            wanted = [str(i) for i in random.sample(way_ids, min(n_ids, len(way_ids)))]
+
+            legacy_t, legacy = _time(
+                _legacy_way_node_map, extract, wanted, repeat=repeat
+            )
+            filtered_t, filtered = _time(
+                _get_way_node_map, extract, wanted, repeat=repeat
+            )
+            assert legacy == _as_dict(filtered), "Way->Node maps differ."
+
+            parallel_ts = []
+            for w in workers:
+                parallel_t, parallel = _time(
+                    _get_way_node_map, extract, wanted, w, repeat=repeat
+                )
+                assert legacy == _as_dict(parallel), "Way->Node maps differ."
+                parallel_ts.append(parallel_t)
+
+            click.echo(
+                f"{s:>5} {os.path.getsize(extract) / 1e6:>10.1f} {len(way_ids):>10} "
+                f"{legacy_t:>11.3f} {filtered_t:>13.3f} {legacy_t / filtered_t:>7.1f}x"
+                + "".join(f" {t:>14.3f}" for t in parallel_ts)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,32 @@
+import json
 import logging
 import math
 import os
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 
 import click
-import psycopg2 as psy
 
 from . import PACKAGE_NAME
+from .generator import _get_way_node_map
+from .generator import _intersecting_ids
+from .generator import _query_intersections
 from .generator import generate_changes
 from .generator import generate_deletions
+from .generator import IdAllocator
+from .session import clear_detached
+from .session import Session
+from .shards import boundary_nodes_path
+from .shards import merge_changes
+from .shards import plan_shards
+from .shards import read_manifest
+from .shards import write_manifest
+from .sourceindex import build_index
+from .sourceindex import open_index
+from .tiles import grid_cells
 from .util import setup_logging
 
 
@@ -24,6 +41,14 @@ Provides main changegen CLI-based entrypoint.
 
 
 def _get_max_ids(source_extract):
+    # use the source index, if there's a current one
+    source_index = open_index(source_extract)
+    if source_index is not None:
+        ids = source_index.get_max_ids()
+        source_index.close()
+        if ids is not None:
+            return ids
+
     # get the max ID from source extract using osmium
     ## first ensure that osmium exists
     try:
@@ -39,135 +64,399 @@ def _get_max_ids(source_extract):
         )
         raise e
 
-    ids = {}
-    for idtype in ["data.maxid.ways", "data.maxid.nodes", "data.maxid.relations"]:
-        proc = subprocess.Popen(
-            f"osmium fileinfo -e -g {idtype} --no-progress {source_extract}",
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+    # a single `osmium fileinfo` run reports all max IDs
+    proc = subprocess.Popen(
+        f"osmium fileinfo -e -j --no-progress {source_extract}",
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    out, err = proc.communicate()
+    if err or proc.returncode != 0:
+        raise subprocess.CalledProcessError(-1, "osmium", "Error in osmium.")
+    maxids = json.loads(out)["data"]["maxid"]
+    return {idtype: int(maxids[idtype]) for idtype in ["ways", "nodes", "relations"]}
+
+
+def _scan_source_extract(source_extract, way_idlist, workers=1):
+    """
+    Resolves everything needed from the source extract for a run:
+    the max OSM IDs and the Node IDs for all Ways in <way_idlist>.
+
+    The max IDs are read by `osmium fileinfo` (see _get_max_ids) in a
+    thread while the Ways are decoded, each once per run instead of once
+    per table and ID type.
+
+    <workers> processes are used to decode the source extract
+    (see generator._get_way_node_map).
+
+    Returns a Future for the dictionary of max IDs (see _get_max_ids)
+    and the way -> node map (see generator._get_way_node_map).
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        max_ids = pool.submit(_get_max_ids, source_extract)
+        logging.info(
+            f"Retrieving existing Node IDs for {len(way_idlist)} ways (file: {source_extract})"
+        )
+        way_node_map = _get_way_node_map(source_extract, way_idlist, workers=workers)
+    return max_ids, way_node_map
+
+
+def _get_run_way_ids(
+    tables,
+    existing,
+    deletions,
+    modify_only,
+    session,
+    self_intersections=False,
+    bbox=None,
+    tile_size=None,
+):
+    """
+    Collects, up front, the IDs of all existing Ways a run will need
+    Node IDs for: modified Ways in <tables> (if <modify_only>), Ways in
+    <existing> intersecting each of <tables>, and Ways in <deletions>.
+    If <bbox> is provided, only Ways in <tables> and <existing> owned by
+    <bbox> are included (see db.bbox_filter). The database is read
+    through <session> (a Session).
+
+    The intersecting Ways are those of the intersections of each of
+    <tables> (with <existing>, and with itself if <self_intersections>),
+    which are read once here and reused by generate_changes. With
+    <tile_size>, generate_changes reads intersections one tile at a
+    time instead, so only the intersecting ids are read here
+    (see db.OGRDBReader.intersecting_ids).
+
+    Returns a dictionary of table : intersections (see
+    generator._query_intersections, None with <tile_size>), a list of
+    lists of ids for each of <deletions>, and a set of all way ids.
+    """
+    db = session.db_reader
+    way_ids = set()
+    if modify_only:
+        for table in tables:
+            way_ids.update(db.get_all_ids_for_layer(table, bbox=bbox))
+
+    intersections = {}
+    for table in tables:
+        if tile_size is not None:
+            intersections[table] = None
+            for other in existing:
+                way_ids.update(db.intersecting_ids(table, other, bbox=bbox))
+            continue
+        intersections[table] = _query_intersections(
+            table, existing, db, self=self_intersections, bbox=bbox
         )
-        if proc.stderr.read():
-            raise subprocess.CalledProcessError(-1, "osmium", "Error in osmium.")
-        ids[idtype.split(".")[-1]] = int(proc.stdout.read().strip())
-    return ids
+        for isects in intersections[table][: len(existing)]:
+            way_ids.update(_intersecting_ids(isects))
+
+    deletion_way_ids = [session.get_deletion_way_ids(table) for table in deletions]
+    way_ids.update(chain.from_iterable(deletion_way_ids))
+
+    return intersections, deletion_way_ids, way_ids
+
+
+def _check_id_collisions(max_ids, id_offset, no_collisions):
+    """
+    Warns (or exits, if <no_collisions>) if new IDs starting at
+    <id_offset> may collide with existing OSM IDs.
+    <max_ids> is a Future for the max IDs (see _scan_source_extract).
+    """
+    try:
+        ids = max_ids.result()
+        if any([id_offset < id for id in ids.values()]):
+            _log_text = f"Chosen ID offset {id_offset} may cause collisions with existing OSM IDs (max IDs: {ids})."
+            if no_collisions:
+                logging.fatal(_log_text)
+                sys.exit(-1)
+            else:
+                logging.warning(_log_text)
+    except subprocess.CalledProcessError:
+        logging.error("Error checking existing OSM max ids.")
 
 
-def _get_db_tables(suffix, dbname, dbport, dbuser, dbpass, dbhost):
-    c = psy.connect(
-        dbname=dbname, host=dbhost, user=dbuser, password=dbpass, port=dbport
+def _parse_max_nodes_per_way(max_nodes_per_way):
+    if str(max_nodes_per_way).lower() == "none":
+        max_nodes_per_way = math.inf
+    elif max_nodes_per_way == None:
+        max_nodes_per_way = 2000
+    return max_nodes_per_way
+
+
+def _session(kwargs):
+    """Returns the Session (see changegen.session) of a run
+    described by <kwargs> (CLI arguments)."""
+    return Session(
+        kwargs["dbname"],
+        kwargs["dbport"],
+        kwargs["dbuser"],
+        kwargs["dbpass"] if kwargs["dbpass"] != "" else None,
+        kwargs["dbhost"],
+        transform_srid=4326 if kwargs.get("server_reproject") else None,
+        cursor_batch_size=kwargs.get("cursor_batch_size"),
+        sources=kwargs["source"],
     )
-    cur = c.cursor()
-    _q = (
-        "SELECT table_name from information_schema.tables "
-        f"where table_name LIKE '%{suffix}'"
+
+
+_table_worker_id_allocator = None
+_table_worker_session = None
+
+
+def _init_table_worker(id_allocator, session):
+    global _table_worker_id_allocator, _table_worker_session
+    _table_worker_id_allocator = id_allocator
+    # a forked worker inherits the parent's open connection,
+    # so it opens its own instead (see Session.detach)
+    clear_detached()
+    session.detach()
+    _table_worker_session = session
+
+
+def _generate_table_changes(args, kwargs):
+    """Runs generate_changes for one table in a worker process,
+    with the run's shared IdAllocator and the worker's Session."""
+    return generate_changes(
+        *args,
+        id_allocator=_table_worker_id_allocator,
+        db_reader=_table_worker_session.db_reader,
+        **kwargs,
     )
-    cur.execute(_q)
-    ans = cur.fetchall()
-    c.close()
-    return [a[0] for a in ans]
 
 
-@click.command()
-@click.option("-d", "--debug", help="Enable verbose logging.", is_flag=True)
-@click.option(
-    "-s",
-    "--suffix",
-    help=(
-        "Suffix for DB tables containing newly-added features."
-        " Can be passed multiple times for multiple suffixes."
-    ),
-    default=["_new"],
-    show_default=True,
-    multiple=True,
+class _DefaultCommandGroup(click.Group):
+    """
+    click.Group that invokes <default_command> when the first
+    argument isn't a subcommand, so that
+    `changegen [OPTIONS] [DBNAME] ...` keeps working.
+    """
+
+    def __init__(self, *args, default_command=None, **kwargs):
+        super(_DefaultCommandGroup, self).__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] != "--help":
+            args = [self.default_command] + args
+        return super(_DefaultCommandGroup, self).parse_args(ctx, args)
+
+
+def _with_options(options):
+    """Applies a list of click option/argument decorators to a command."""
+
+    def decorator(f):
+        for option in reversed(options):
+            f = option(f)
+        return f
+
+    return decorator
+
+
+_DEBUG_OPTION = click.option(
+    "-d", "--debug", help="Enable verbose logging.", is_flag=True
 )
-@click.option(
-    "--deletions",
-    help=(
-        "Name of table containing OSM IDs for which <delete> tags "
-        " should be created in the resulting changefile. Table must "
-        " contain <osm_id> column. Can be passed multiple times."
+
+# Options describing a run, shared by `generate` and `plan`.
+_RUN_OPTIONS = [
+    click.option(
+        "-s",
+        "--suffix",
+        help=(
+            "Suffix for DB tables containing newly-added features."
+            " Can be passed multiple times for multiple suffixes."
+        ),
+        default=["_new"],
+        show_default=True,
+        multiple=True,
     ),
-    multiple=True,
-    default=[],
-)
-@click.option(
-    "-e",
-    "--existing",
-    help=(
-        "Table of geometries to use when determining whether existing"
-        " features must be altered to include linestring intersections."
+    click.option(
+        "--deletions",
+        help=(
+            "Name of table containing OSM IDs for which <delete> tags "
+            " should be created in the resulting changefile. Table must "
+            " contain <osm_id> column. Can be passed multiple times."
+        ),
+        multiple=True,
+        default=[],
     ),
-    multiple=True,
-    default=[],
-)
-@click.option(
-    "-m",
-    "--modify_meta",
-    help=(
-        "Create <modify> tags in changefile, instead of create nodes "
-        "for all tables specified by --suffix. Only applies to "
-        "Ways with with modified metadata, not geometries (see full help)."
+    click.option(
+        "-e",
+        "--existing",
+        help=(
+            "Table of geometries to use when determining whether existing"
+            " features must be altered to include linestring intersections."
+        ),
+        multiple=True,
+        default=[],
     ),
-    is_flag=True,
-)
-@click.option("-o", "-outdir", help="Directory to output change files to.", default=".")
-@click.option("--compress", help="gzip-compress xml output", is_flag=True)
-@click.option("--neg_id", help="use negative ids for new OSM elements", is_flag=True)
-@click.option(
-    "--id_offset",
-    help="Integer value to start generating IDs from.",
-    type=int,
-    default=0,
-    show_default=True,
-)
-@click.option(
-    "--no_collisions",
-    help="Stop execution if the chosen ID offset "
-    "will cause collisions with existing OSM ids."
-    " (requires osmium).",
-    is_flag=True,
-)
-@click.option(
-    "--self",
-    "-si",
-    help=(
-        "Check for and add intersections among newly-added features. "
-        "It is strongly adviseable to create a geometry index on "
-        "new geometry tables' geometry column before using this option."
+    click.option(
+        "-m",
+        "--modify_meta",
+        help=(
+            "Create <modify> tags in changefile, instead of create nodes "
+            "for all tables specified by --suffix. Only applies to "
+            "Ways with with modified metadata, not geometries (see full help)."
+        ),
+        is_flag=True,
     ),
-    is_flag=True,
-)
-@click.option(
-    "--max_nodes_per_way",
+    click.option("--compress", help="gzip-compress xml output", is_flag=True),
+    click.option(
+        "--neg_id", help="use negative ids for new OSM elements", is_flag=True
+    ),
+    click.option(
+        "--id_offset",
+        help="Integer value to start generating IDs from.",
+        type=int,
+        default=0,
+        show_default=True,
+    ),
+    click.option(
+        "--no_collisions",
+        help="Stop execution if the chosen ID offset "
+        "will cause collisions with existing OSM ids."
+        " (requires osmium).",
+        is_flag=True,
+    ),
+    click.option(
+        "--self",
+        "-si",
+        help=(
+            "Check for and add intersections among newly-added features. "
+            "It is strongly adviseable to create a geometry index on "
+            "new geometry tables' geometry column before using this option."
+        ),
+        is_flag=True,
+    ),
+    click.option(
+        "--max_nodes_per_way",
+        help=(
+            "Number of nodes allowed per way. Default 2000."
+            " If a way exceeds this value "
+            " it will be subdivided into smaller ways. Pass `none` for no limit."
+        ),
+        default="2000",
+    ),
+    click.option(
+        "--hstore_tags",
+        help=(
+            "Specify Postgres hstore column to obtain tags from, "
+            "in addition to table columns. "
+            "This column should contain a hstore, and the keys will be compared "
+            "to existing columns. Column key values will take "
+            "precedence over values in the hstore if duplicates are found. "
+            "Note that this column name will apply to both source tables "
+            "and intersection tables. "
+        ),
+        default=None,
+        show_default=True,
+    ),
+    click.option("--osmsrc", help="Source OSM PBF File path", required=True),
+]
+
+# Options for local processing (parallelism and memory use),
+# shared by `generate` and `run-shard`.
+_WORKER_OPTIONS = [
+    click.option(
+        "--osm_workers",
+        help=(
+            "Number of processes used to decode --osmsrc when "
+            "retrieving existing Way nodes."
+        ),
+        type=int,
+        default=1,
+        show_default=True,
+    ),
+    click.option(
+        "--workers",
+        help="Number of processes used to process features in each table.",
+        type=int,
+        default=1,
+        show_default=True,
+    ),
+    click.option(
+        "--tile_size",
+        help=(
+            "Process each table in tiles of this size (in units of the "
+            "table's CRS), so that memory use depends on the density of "
+            "features rather than the size of the table. "
+            "By default each table is processed at once."
+        ),
+        type=float,
+        default=None,
+    ),
+    click.option(
+        "--server_reproject",
+        help=(
+            "Reproject geometries to EPSG:4326 in PostGIS (ST_Transform) "
+            "as they are read, instead of in Python."
+        ),
+        is_flag=True,
+    ),
+    click.option(
+        "--cursor_batch_size",
+        help=(
+            "Stream features through a server-side cursor (requires "
+            "psycopg2), fetching this many rows at a time, instead of "
+            "through OGR's PostgreSQL driver."
+        ),
+        type=int,
+        default=None,
+    ),
+    click.option(
+        "--arrow_batch_size",
+        help=(
+            "Read and process features in Arrow batches of this many "
+            "features (requires GDAL >= 3.6 and pyarrow; only with "
+            "--workers 1), instead of one OGR feature at a time."
+        ),
+        type=int,
+        default=None,
+    ),
+]
+
+_SOURCE_OPTION = click.option(
+    "--source",
     help=(
-        "Number of nodes allowed per way. Default 2000."
-        " If a way exceeds this value "
-        " it will be subdivided into smaller ways. Pass `none` for no limit."
+        "Read tables from the layers of this file (GeoPackage, FlatGeobuf, "
+        "GeoParquet or any other OGR-readable format) instead of the "
+        "database. Can be repeated."
     ),
-    default="2000",
+    multiple=True,
 )
+
+_DB_ARGUMENTS = [
+    click.argument("dbname", default=os.environ.get("PGDATABASE", "conflate")),
+    click.argument("dbport", default=os.environ.get("PGPORT", "15432")),
+    click.argument("dbuser", default=os.environ.get("PGUSER", "postgres")),
+    click.argument("dbhost", default=os.environ.get("PGHOST", "localhost")),
+    click.argument("dbpass", default=os.environ.get("PGPASSWORD", "")),
+]
+
+
+@click.group(cls=_DefaultCommandGroup, default_command="generate")
+def main():
+    """
+    Create osmchange files from an imposm-based PostGIS database
+    after a spatial conflation workflow.
+
+    Runs `generate` unless another command is given.
+    """
+
+
+@main.command()
+@_with_options([_DEBUG_OPTION] + _RUN_OPTIONS + _WORKER_OPTIONS)
+@click.option("-o", "-outdir", help="Directory to output change files to.", default=".")
 @click.option(
-    "--hstore_tags",
+    "--table_workers",
     help=(
-        "Specify Postgres hstore column to obtain tags from, "
-        "in addition to table columns. "
-        "This column should contain a hstore, and the keys will be compared "
-        "to existing columns. Column key values will take "
-        "precedence over values in the hstore if duplicates are found. "
-        "Note that this column name will apply to both source tables "
-        "and intersection tables. "
+        "Number of tables (matched by --suffix) processed concurrently, "
+        "each in its own process."
     ),
-    default=None,
+    type=int,
+    default=1,
     show_default=True,
 )
-@click.option("--osmsrc", help="Source OSM PBF File path", required=True)
-@click.argument("dbname", default=os.environ.get("PGDATABASE", "conflate"))
-@click.argument("dbport", default=os.environ.get("PGPORT", "15432"))
-@click.argument("dbuser", default=os.environ.get("PGUSER", "postgres"))
-@click.argument("dbhost", default=os.environ.get("PGHOST", "localhost"))
-@click.argument("dbpass", default=os.environ.get("PGPASSWORD", ""))
-def main(*args: tuple, **kwargs: dict):
+@_with_options([_SOURCE_OPTION] + _DB_ARGUMENTS)
+def generate(*args: tuple, **kwargs: dict):
     """
     Create osmchange file describing changes to an imposm-based PostGIS
     database after a spatial conflation workflow.
@@ -190,50 +479,98 @@ def main(*args: tuple, **kwargs: dict):
     behavior with a --delete table for that).
     --modify_meta is not compatible with intersection detection. Creation of
     modify nodes is only compatible with linestring features.
+
+    If a current source index exists for --osmsrc (see `changegen index`),
+    existing Way nodes and max IDs are read from it instead of --osmsrc.
     """
     setup_logging(debug=kwargs["debug"])
     logging.debug(f"Args: {kwargs}")
 
+    # One Session (database connection, layer metadata and
+    # deletion ids) is shared by all tables of the run.
+    session = _session(kwargs)
+    new_tables = session.get_tables(kwargs["suffix"])
+
+    max_nodes_per_way = _parse_max_nodes_per_way(kwargs["max_nodes_per_way"])
+    if kwargs["modify_meta"] and kwargs["existing"]:
+        raise RuntimeError("--modify_meta cannot be used with --existing.")
+
+    # Resolve all existing Ways this run needs in one pass over the
+    # source extract, rather than once per table.
+    intersections, deletion_way_ids, way_ids = _get_run_way_ids(
+        new_tables,
+        kwargs["existing"],
+        kwargs["deletions"],
+        kwargs["modify_meta"],
+        session,
+        self_intersections=kwargs["self"],
+        tile_size=kwargs["tile_size"],
+    )
+    max_ids, way_node_map = _scan_source_extract(
+        kwargs["osmsrc"], way_ids, workers=kwargs["osm_workers"]
+    )
+
     # Check for ID collisions and warn
-    try:
-        ids = _get_max_ids(kwargs["osmsrc"])
-        if any([kwargs["id_offset"] < id for id in ids.values()]):
-            _log_text = f"Chosen ID offset {kwargs['id_offset']} may cause collisions with existing OSM IDs (max IDs: {ids})."
-            if kwargs["no_collisions"]:
-                logging.fatal(_log_text)
-                sys.exit(-1)
-            else:
-                logging.warning(_log_text)
-    except subprocess.CalledProcessError:
-        logging.error("Error checking existing OSM max ids.")
+    _check_id_collisions(max_ids, kwargs["id_offset"], kwargs["no_collisions"])
 
-    new_tables = []
-    for suffix in kwargs["suffix"]:
-        new_tables.extend(
-            _get_db_tables(
-                suffix,
+    # All tables share one ID space, so that new IDs are unique across
+    # all change files of this run.
+    id_allocator = IdAllocator(kwargs["id_offset"])
+    table_changes = [
+        (
+            (
+                table,
+                kwargs["existing"],
+                kwargs["deletions"],
                 kwargs["dbname"],
                 kwargs["dbport"],
                 kwargs["dbuser"],
-                kwargs["dbpass"],
+                kwargs["dbpass"] if kwargs["dbpass"] != "" else None,
                 kwargs["dbhost"],
-            )
+                kwargs["osmsrc"],
+                os.path.join(str(kwargs["o"]), f"{table}.osc"),
+            ),
+            dict(
+                compress=kwargs["compress"],
+                neg_id=kwargs["neg_id"],
+                self_intersections=kwargs["self"],
+                max_nodes_per_way=int(max_nodes_per_way),
+                modify_only=kwargs["modify_meta"],
+                hstore_column=kwargs["hstore_tags"],
+                way_node_map=way_node_map,
+                intersections=intersections[table],
+                deletion_way_ids=deletion_way_ids,
+                workers=kwargs["workers"],
+                tile_size=kwargs["tile_size"],
+                arrow_batch_size=kwargs["arrow_batch_size"],
+            ),
         )
-    logging.info(f"Found tables in db: {new_tables}")
-
-    max_nodes_per_way = kwargs["max_nodes_per_way"]
-    if str(max_nodes_per_way).lower() == "none":
-        max_nodes_per_way = math.inf
-    elif max_nodes_per_way == None:
-        max_nodes_per_way = 2000
-    if kwargs["modify_meta"] and kwargs["existing"]:
-        raise RuntimeError("--modify_meta cannot be used with --existing.")
+        for table in new_tables
+    ]
+    if kwargs["table_workers"] > 1:
+        with ProcessPoolExecutor(
+            max_workers=kwargs["table_workers"],
+            initializer=_init_table_worker,
+            initargs=(id_allocator, session),
+        ) as pool:
+            for result in [
+                pool.submit(_generate_table_changes, args, table_kwargs)
+                for args, table_kwargs in table_changes
+            ]:
+                result.result()
+    else:
+        for args, table_kwargs in table_changes:
+            generate_changes(
+                *args,
+                id_allocator=id_allocator,
+                db_reader=session.db_reader,
+                **table_kwargs,
+            )
 
-    for table in new_tables:
-        generate_changes(
+    for i, table in enumerate(kwargs["deletions"]):
+        generate_deletions(
             table,
-            kwargs["existing"],
-            kwargs["deletions"],
+            "osm_id",
             kwargs["dbname"],
             kwargs["dbport"],
             kwargs["dbuser"],
@@ -242,27 +579,240 @@ def main(*args: tuple, **kwargs: dict):
             kwargs["osmsrc"],
             os.path.join(str(kwargs["o"]), f"{table}.osc"),
             compress=kwargs["compress"],
-            neg_id=kwargs["neg_id"],
-            id_offset=kwargs["id_offset"],
-            self_intersections=kwargs["self"],
-            max_nodes_per_way=int(max_nodes_per_way),
-            modify_only=kwargs["modify_meta"],
-            hstore_column=kwargs["hstore_tags"],
+            way_node_map=way_node_map,
+            deletion_way_ids=deletion_way_ids[i],
+            db_reader=session.db_reader,
         )
 
-    for table in kwargs["deletions"]:
+
+@main.command()
+@_with_options([_DEBUG_OPTION] + _RUN_OPTIONS)
+@click.option(
+    "--shard_size",
+    help=(
+        "Size of the grid cells each table is split into, in units of "
+        "the table's CRS. By default each table is a single shard."
+    ),
+    type=float,
+    default=None,
+)
+@click.option(
+    "--ids_per_shard",
+    help="Number of new IDs reserved for each shard.",
+    type=int,
+    default=100000000,
+    show_default=True,
+)
+@click.option(
+    "--manifest",
+    help="Path to write the manifest to.",
+    default="changegen-manifest.json",
+    show_default=True,
+)
+@_with_options([_SOURCE_OPTION] + _DB_ARGUMENTS)
+def plan(*args: tuple, **kwargs: dict):
+    """
+    Split a run into shards, described by a manifest.
+
+    Takes the same options as `generate`. Each table matched by --suffix
+    is split into a grid of --shard_size cells; each shard owns the
+    features whose bounding box centre is within its cell, and a
+    disjoint range of new IDs (starting at --id_offset).
+
+    Shards are generated independently with `run-shard` (on any machine
+    with access to the database and --osmsrc), and their change files
+    combined with `merge`.
+    """
+    setup_logging(debug=kwargs["debug"])
+    session = _session(kwargs)
+    new_tables = session.get_tables(kwargs["suffix"])
+
+    table_cells = {}
+    for table in new_tables:
+        if kwargs["shard_size"] is None:
+            table_cells[table] = [None]
+        else:
+            table_cells[table] = grid_cells(
+                session.db_reader.get_layer_extent(table), kwargs["shard_size"]
+            )
+    shards = plan_shards(
+        table_cells,
+        kwargs["deletions"],
+        kwargs["id_offset"],
+        kwargs["ids_per_shard"],
+    )
+
+    options = {
+        k: kwargs[k]
+        for k in [
+            "deletions",
+            "existing",
+            "modify_meta",
+            "compress",
+            "neg_id",
+            "no_collisions",
+            "self",
+            "max_nodes_per_way",
+            "hstore_tags",
+            "osmsrc",
+        ]
+    }
+    write_manifest(kwargs["manifest"], options, shards)
+    logging.info(f"Wrote {len(shards)} shards to {kwargs['manifest']}")
+
+
+@main.command("run-shard")
+@_with_options([_DEBUG_OPTION] + _WORKER_OPTIONS)
+@click.option(
+    "--manifest",
+    help="Manifest written by `plan`.",
+    default="changegen-manifest.json",
+    show_default=True,
+)
+@click.option("--shard", help="Index of the shard to run.", type=int, required=True)
+@click.option(
+    "-o", "-outdir", help="Directory to output the shard's change file to.", default="."
+)
+@click.option(
+    "--osmsrc",
+    help="Source OSM PBF File path, if not the path in the manifest.",
+    default=None,
+)
+@_with_options([_SOURCE_OPTION] + _DB_ARGUMENTS)
+def run_shard(*args: tuple, **kwargs: dict):
+    """
+    Generate the change file for one shard of a manifest (see `plan`).
+    """
+    setup_logging(debug=kwargs["debug"])
+    manifest = read_manifest(kwargs["manifest"])
+    options = manifest["options"]
+    shard = manifest["shards"][kwargs["shard"]]
+    osmsrc = kwargs["osmsrc"] or options["osmsrc"]
+    dbpass = kwargs["dbpass"] if kwargs["dbpass"] != "" else None
+    outfile = os.path.join(str(kwargs["o"]), shard["output"])
+    logging.info(f"Running shard {kwargs['shard']}: {shard}")
+    session = _session(kwargs)
+
+    if shard["kind"] == "deletions":
         generate_deletions(
-            table,
+            shard["table"],
             "osm_id",
             kwargs["dbname"],
             kwargs["dbport"],
             kwargs["dbuser"],
-            kwargs["dbpass"] if kwargs["dbpass"] != "" else None,
+            dbpass,
             kwargs["dbhost"],
-            kwargs["osmsrc"],
-            os.path.join(str(kwargs["o"]), f"{table}.osc"),
-            compress=kwargs["compress"],
+            osmsrc,
+            outfile,
+            compress=options["compress"],
+            db_reader=session.db_reader,
         )
+        return
+
+    deletions = options["deletions"] if shard["deletions"] else []
+    intersections, deletion_way_ids, way_ids = _get_run_way_ids(
+        [shard["table"]],
+        options["existing"],
+        deletions,
+        options["modify_meta"],
+        session,
+        self_intersections=options["self"],
+        bbox=shard["bbox"],
+        tile_size=kwargs["tile_size"],
+    )
+    max_ids, way_node_map = _scan_source_extract(
+        osmsrc, way_ids, workers=kwargs["osm_workers"]
+    )
+    _check_id_collisions(max_ids, shard["id_offset"], options["no_collisions"])
+
+    generate_changes(
+        shard["table"],
+        options["existing"],
+        deletions,
+        kwargs["dbname"],
+        kwargs["dbport"],
+        kwargs["dbuser"],
+        dbpass,
+        kwargs["dbhost"],
+        osmsrc,
+        outfile,
+        compress=options["compress"],
+        neg_id=options["neg_id"],
+        self_intersections=options["self"],
+        max_nodes_per_way=int(_parse_max_nodes_per_way(options["max_nodes_per_way"])),
+        modify_only=options["modify_meta"],
+        hstore_column=options["hstore_tags"],
+        way_node_map=way_node_map,
+        intersections=intersections[shard["table"]],
+        deletion_way_ids=deletion_way_ids,
+        workers=kwargs["workers"],
+        id_allocator=IdAllocator(shard["id_offset"], shard["id_limit"]),
+        bbox=shard["bbox"],
+        tile_size=kwargs["tile_size"],
+        db_reader=session.db_reader,
+        arrow_batch_size=kwargs["arrow_batch_size"],
+        boundary_nodes_file=boundary_nodes_path(outfile),
+    )
+
+
+@main.command()
+@_with_options([_DEBUG_OPTION])
+@click.option(
+    "--manifest",
+    help="Manifest written by `plan`.",
+    default="changegen-manifest.json",
+    show_default=True,
+)
+@click.option(
+    "--shards_dir",
+    help=(
+        "Directory containing the change files "
+        "(and boundary node lists) of all shards."
+    ),
+    default=".",
+)
+@click.option("-o", "-outdir", help="Directory to output change files to.", default=".")
+def merge(*args: tuple, **kwargs: dict):
+    """
+    Combine the change files of all shards of a manifest (see `plan`)
+    into one change file per table, like `generate` produces.
+    """
+    setup_logging(debug=kwargs["debug"])
+    manifest = read_manifest(kwargs["manifest"])
+
+    table_outputs = {}
+    for shard in manifest["shards"]:
+        table_outputs.setdefault(shard["table"], []).append(
+            os.path.join(str(kwargs["shards_dir"]), shard["output"])
+        )
+    for table, paths in table_outputs.items():
+        outfile = os.path.join(str(kwargs["o"]), f"{table}.osc")
+        logging.info(f"Merging {len(paths)} shards into {outfile}")
+        merge_changes(paths, outfile, compress=manifest["options"]["compress"])
+
+
+@main.command()
+@_with_options([_DEBUG_OPTION])
+@click.option("--osmsrc", help="Source OSM PBF File path", required=True)
+def index(*args: tuple, **kwargs: dict):
+    """
+    Build or refresh the source index for --osmsrc.
+
+    The index is stored next to the source extract and contains the
+    nodes of every Way and the max OSM IDs in the extract (max IDs
+    require osmium). `generate` uses it automatically for as long as
+    the source extract is unchanged.
+    """
+    setup_logging(debug=kwargs["debug"])
+
+    def _get_max_ids_or_none(source_extract):
+        try:
+            return _get_max_ids(source_extract)
+        except subprocess.CalledProcessError:
+            logging.error("Error checking existing OSM max ids; not indexing them.")
+            return None
+
+    build_index(kwargs["osmsrc"], get_max_ids=_get_max_ids_or_none)
 
 
 if __name__ == "__main__":
@@ -9,6 +9,7 @@ from collections import namedtuple
 from shutil import copyfile
 from shutil import copyfileobj
 
+import numpy as np
 from lxml import etree
 
 """
@@ -25,12 +26,19 @@ Data Types:
     Way (namedtuple): id, version, nds (array of Node ids [ints]),
         tags (array of Tags)
 
+Node coordinates are degrees. They are compared and hashed as
+fixed-point integers at OSM's resolution of 1e-7 degrees (see fixed),
+and written as decimal strings at that resolution.
+
 Classes:
     OSMChangeWriter: writes XML changefile
 
 Functions:
     write_osm_object: _private_ helper function to write osm object to
     OSMChangeWriter.
+    fixed: degrees to fixed-point integer coordinates.
+    fixed_array: array of degrees to fixed-point integer coordinates.
+    format_coordinate: coordinate to decimal string.
 
 """
 
@@ -44,6 +52,32 @@ Way = namedtuple("Way", "id, version, nds, tags")
 Relation = namedtuple("Relation", "id, version, members, tags")
 RelationMember = namedtuple("RelationMember", "ref, type, role")
 
+# fixed-point coordinates are in units of 1e-7 degrees
+COORDINATE_SCALE = 10**7
+
+
+def fixed(degrees):
+    """Returns <degrees> (a number or decimal string)
+    as an integer number of 1e-7 degrees."""
+    return round(float(degrees) * COORDINATE_SCALE)
+
+
+def fixed_array(degrees):
+    """Returns an int64 array of <degrees> (array-like) in 1e-7 degrees."""
+    return np.rint(np.asarray(degrees, dtype=float) * COORDINATE_SCALE).astype(np.int64)
+
+
+def format_coordinate(value):
+    """Returns the decimal string of coordinate <value>. Floats are
+    written at a resolution of 1e-7 degrees, without trailing zeros;
+    anything else (e.g. a string read from a change file) as is."""
+    if not isinstance(value, float):
+        return str(value)
+    value = fixed(value)
+    sign = "-" if value < 0 else ""
+    whole, frac = divmod(abs(value), COORDINATE_SCALE)
+    return f"{sign}{whole}.{frac:07d}".rstrip("0").rstrip(".")
+
 
 def write_osm_object(osm, writer):
     """Writes an OSM object (Node, Way)
@@ -63,6 +97,9 @@ def write_osm_object(osm, writer):
             attrs.pop("nds")
         if hasattr(osm, "members"):
             attrs.pop("members")
+        for k in ("lat", "lon"):
+            if k in attrs:
+                attrs[k] = format_coordinate(attrs[k])
         attrs = {k: str(attrs[k]) for k in attrs.keys()}
 
         with writer.element(objtype, **attrs):
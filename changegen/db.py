@@ -1,7 +1,11 @@
+import copy
+import functools
 import logging
 import warnings
+from collections import namedtuple
 
 from osgeo import ogr
+from shapely import wkb
 
 
 def hstore_as_dict(hstore_str):
@@ -25,8 +29,106 @@ def hstore_as_dict(hstore_str):
         return {}
 
 
+def feature_geometry(feature):
+    """
+    Returns the geometry of OGR <feature> as a shapely geometry,
+    or None if it has none. Geometries are read as WKB, which (unlike
+    a WKT round trip) is fast and keeps full coordinate precision.
+    """
+    # features streamed by pgcursor.CursorDBReader carry their WKB
+    if hasattr(feature, "wkb"):
+        return wkb.loads(feature.wkb) if feature.wkb is not None else None
+    geometry = feature.GetGeometryRef()
+    if not geometry:
+        return None
+    return wkb.loads(bytes(geometry.ExportToWkb()))
+
+
+# Stand-in for unbounded sides of a bbox in spatial index (&&) filters.
+_UNBOUNDED = 1e15
+# Number of ids per query in OGRDBReader.get_features_by_ids.
+FETCH_BATCH_SIZE = 5000
+# Number of features per Arrow record batch (see OGRDBReader.get_layer_batches).
+ARROW_BATCH_SIZE = 10000
+
+# A point where a feature of a new layer intersects a feature of an
+# intersecting layer (see OGRDBReader.intersections). <owners> are the
+# bounding box centres [(n_x, n_y), (o_x, o_y)] of the two features,
+# or None.
+Intersection = namedtuple(
+    "Intersection", ["x", "y", "new_fid", "intersecting_id", "owned", "owners"]
+)
+
+
+def bbox_filter(bbox, geometry_field, srid):
+    """
+    Returns an SQL condition selecting rows whose <geometry_field>
+    is *owned* by <bbox> ([minx, miny, maxx, maxy] in the CRS with EPSG
+    code <srid>): the centre of the geometry's bounding box lies within
+    <bbox>. Lower bounds are inclusive and upper bounds exclusive, and a
+    side of None is unbounded, so a grid of bboxes assigns every
+    geometry to exactly one bbox.
+    """
+    minx, miny, maxx, maxy = bbox
+    cx = f"(ST_XMin({geometry_field}) + ST_XMax({geometry_field})) / 2"
+    cy = f"(ST_YMin({geometry_field}) + ST_YMax({geometry_field})) / 2"
+
+    # the centre is within bbox only if the geometry overlaps it,
+    # which can use the spatial index.
+    envelope = ", ".join(
+        repr(float(v if v is not None else default))
+        for v, default in [
+            (minx, -_UNBOUNDED),
+            (miny, -_UNBOUNDED),
+            (maxx, _UNBOUNDED),
+            (maxy, _UNBOUNDED),
+        ]
+    )
+    conditions = [f"{geometry_field} && ST_MakeEnvelope({envelope}, {srid})"]
+    for value, condition in [
+        (minx, f"{cx} >= {{}}"),
+        (miny, f"{cy} >= {{}}"),
+        (maxx, f"{cx} < {{}}"),
+        (maxy, f"{cy} < {{}}"),
+    ]:
+        if value is not None:
+            conditions.append(condition.format(repr(float(value))))
+    return "(" + " AND ".join(conditions) + ")"
+
+
+def _cached(method):
+    """
+    Caches the results of OGRDBReader <method> by its arguments, for
+    layer metadata that doesn't change during a run. Results are shared
+    by all callers, so they must not be modified.
+    """
+
+    @functools.wraps(method)
+    def cached_method(self, *args, **kwargs):
+        key = repr((method.__name__, args, sorted(kwargs.items())))
+        if key not in self._cache:
+            self._cache[key] = method(self, *args, **kwargs)
+        return self._cache[key]
+
+    return cached_method
+
+
 class OGRDBReader(object):
-    """Read features from PostGIS database via OGR."""
+    """
+    Read features from PostGIS database via OGR.
+
+    If <transform_srid> is provided, geometries of features returned by
+    get_layer_iter, get_feature_by_id and intersections are reprojected
+    to it in PostGIS (ST_Transform) rather than returned in the CRS of
+    their layer (see get_geometry_epsg). Bounding boxes and intersection
+    owners are still in the CRS of the layer.
+
+    Layer metadata (fields, EPSG codes, extents and feature counts) is
+    read once per OGRDBReader (and its clones).
+
+    An OGRDBReader's connection must only be used by one thread at a
+    time; use clone to query from several threads.
+    """
 
     def _get_layer_fields(layer):
         featureDefinition = layer.GetLayerDefn()
@@ -36,13 +138,23 @@ class OGRDBReader(object):
             fieldNames.append(featureDefinition.GetFieldDefn(j).GetNameRef())
         return fieldNames
 
-    def __init__(self, dbname, dbport, dbuser, dbpass=None, dbhost="localhost"):
+    def __init__(
+        self,
+        dbname,
+        dbport,
+        dbuser,
+        dbpass=None,
+        dbhost="localhost",
+        transform_srid=None,
+    ):
         super(OGRDBReader, self).__init__()
         self.dbname = dbname
         self.dbport = dbport
         self.dbuser = dbuser
         self.dbpass = dbpass
         self.dbhost = dbhost
+        self.transform_srid = transform_srid
+        self._cache = {}
 
         self.conn_str = (
             f"PG: user={self.dbuser} port={self.dbport} "
@@ -52,6 +164,19 @@ class OGRDBReader(object):
         logging.debug(f"Opening PostGIS DB connection: {self.conn_str}")
         self.data = ogr.Open(self.conn_str, True)
 
+    def clone(self):
+        """Returns a new OGRDBReader with its own connection to the same
+        database (e.g. to run queries from another thread), sharing
+        this OGRDBReader's layer metadata cache."""
+        reader = copy.copy(self)
+        logging.debug(f"Opening PostGIS DB connection: {self.conn_str}")
+        reader.data = ogr.Open(self.conn_str, True)
+        return reader
+
+    def _get_layer(self, layer):
+        """Returns the ogr.Layer named layer."""
+        return self.data.GetLayerByName(layer)
+
     def get_layers(self):
         """Return available layers from db connection."""
         if self.data.GetLayerCount() < 1:
@@ -65,16 +190,110 @@ class OGRDBReader(object):
             ]
         ]
 
+    def get_tables(self, suffix):
+        """Returns the names of all tables ending in <suffix>."""
+        # like intersecting_ids, no geometries are returned.
+        _q = (
+            "SELECT table_name from information_schema.tables "
+            f"where table_name LIKE '%{suffix}'"
+        )
+        logging.debug(f"Executing SQL: {_q}")
+        tables = []
+        _r = self.data.ExecuteSQL(_q)
+        _t = _r.GetNextFeature()
+        while _t:
+            tables.append(_t.GetFieldAsString(0))
+            _t = _r.GetNextFeature()
+        self.data.ReleaseResultSet(_r)
+        return tables
+
+    @_cached
     def get_layer_epsg(self, layer):
-        _l = self.data.GetLayerByName(layer)
+        _l = self._get_layer(layer)
         return _l.GetSpatialRef().GetAttrValue("AUTHORITY", 1)
 
-    def get_num_features(self, layer):
-        _l = self.data.GetLayerByName(layer)
-        return _l.GetFeatureCount()
+    @_cached
+    def get_fid_column(self, layer):
+        """Returns the name of the FID (primary key) column of layer."""
+        return self._get_layer(layer).GetFIDColumn()
+
+    def get_geometry_epsg(self, layer):
+        """Returns the EPSG code of geometries returned for layer
+        (<transform_srid> if provided)."""
+        if self.transform_srid is not None:
+            return str(self.transform_srid)
+        return self.get_layer_epsg(layer)
 
-    def get_feature_by_id(self, layer, id, id_field):
-        _q = f"SELECT * from {layer} WHERE {layer}.{id_field} = {id}"
+    def _geometry_sql(self, geometry):
+        """Wraps SQL expression <geometry> in ST_Transform if
+        geometries are reprojected in PostGIS."""
+        if self.transform_srid is None:
+            return geometry
+        return f"ST_Transform({geometry}, {int(self.transform_srid)})"
+
+    def _columns_sql(self, layer, geometry_field):
+        """Returns the SQL select list of all columns of layer,
+        with <geometry_field> reprojected (see _geometry_sql)."""
+        if self.transform_srid is None:
+            return "*"
+        # the FID column is selected too, so features keep their FIDs
+        fields = [
+            f'{layer}."{f}"'
+            for f in [self.get_fid_column(layer)] + self.get_layer_fields(layer)
+            if f
+        ]
+        geometry = self._geometry_sql(f"{layer}.{geometry_field}")
+        return ", ".join(fields + [f"{geometry} AS {geometry_field}"])
+
+    def _bbox_sql(self, layer, bbox, geometry_field="geometry"):
+        """Returns the bbox_filter condition for features of layer
+        owned by <bbox>, or None if <bbox> is None."""
+        if bbox is None:
+            return None
+        return bbox_filter(
+            bbox, f"{layer}.{geometry_field}", self.get_layer_epsg(layer)
+        )
+
+    def _select_features(self, layer, where=None, geometry_field="geometry"):
+        """Return generator over features in layer matching
+        the SQL condition <where> (all features if None)."""
+        _q = f"SELECT {self._columns_sql(layer, geometry_field)} FROM {layer}"
+        if where is not None:
+            _q += f" WHERE {where}"
+        logging.debug(f"Executing SQL: {_q}")
+        _r = self.data.ExecuteSQL(_q)
+        _f = _r.GetNextFeature()
+        while _f:
+            yield _f
+            _f = _r.GetNextFeature()
+        self.data.ReleaseResultSet(_r)
+
+    @_cached
+    def get_layer_extent(self, layer):
+        """Returns the extent of layer as [minx, miny, maxx, maxy]."""
+        _l = self._get_layer(layer)
+        minx, maxx, miny, maxy = _l.GetExtent()
+        return [minx, miny, maxx, maxy]
+
+    @_cached
+    def get_num_features(self, layer, bbox=None, geometry_field="geometry"):
+        """Returns the number of features in layer
+        (only those owned by <bbox> if provided, see bbox_filter)."""
+        _l = self._get_layer(layer)
+        if bbox is None:
+            return _l.GetFeatureCount()
+        _l.SetAttributeFilter(
+            bbox_filter(bbox, geometry_field, self.get_layer_epsg(layer))
+        )
+        n_features = _l.GetFeatureCount()
+        _l.SetAttributeFilter(None)
+        return n_features
+
+    def get_feature_by_id(self, layer, id, id_field, geometry_field="geometry"):
+        _q = (
+            f"SELECT {self._columns_sql(layer, geometry_field)} from {layer} "
+            f"WHERE {layer}.{id_field} = {id}"
+        )
         _r = self.data.ExecuteSQL(_q)
         if len(_r) > 1:
             warnings.warn(
@@ -82,11 +301,57 @@ class OGRDBReader(object):
             )
         return _r.GetNextFeature()
 
-    def get_all_ids_for_layer(self, layer, id_fieldname="osm_id"):
+    def get_features_by_ids(
+        self,
+        layer,
+        ids,
+        id_field,
+        geometry_field="geometry",
+        batch_size=FETCH_BATCH_SIZE,
+    ):
+        """
+        Return generator over the features in layer whose <id_field> is
+        one of <ids> (str), in the order of <ids>. Features are fetched
+        <batch_size> ids per query (= ANY(...)) rather than one query
+        per id (see get_feature_by_id).
+
+        Ids without a feature are skipped; if an id has more than one,
+        only the first is returned.
+        """
+        ids = list(ids)
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start : start + batch_size]
+            id_array = ",".join(f'"{id}"' for id in batch)
+            features = {}
+            for _f in self._select_features(
+                layer,
+                f"{layer}.{id_field} = ANY('{{{id_array}}}')",
+                geometry_field=geometry_field,
+            ):
+                _id = _f.GetFieldAsString(_f.GetFieldIndex(id_field))
+                if _id in features:
+                    warnings.warn(
+                        f"More than one ID match for {id_field}:{_id} (layer: {layer})"
+                    )
+                else:
+                    features[_id] = _f
+
+            for id in batch:
+                if id in features:
+                    yield features[id]
+                else:
+                    logging.warning(f"No match for {id_field}:{id} (layer: {layer})")
+
+    def get_all_ids_for_layer(
+        self, layer, id_fieldname="osm_id", bbox=None, geometry_field="geometry"
+    ):
         """
-        Retrieves all unique values of `id_fieldname` within `layer`.
+        Retrieves all unique values of `id_fieldname` within `layer`
+        (only for features owned by `bbox` if provided, see bbox_filter).
         """
         id_query = f"SELECT distinct {id_fieldname} FROM {layer}"
+        if bbox is not None:
+            id_query += f" WHERE {bbox_filter(bbox, geometry_field, self.get_layer_epsg(layer))}"
 
         logging.debug(f"Executing SQL: {id_query}")
         queryLayer = self.data.ExecuteSQL(id_query)
@@ -108,6 +373,8 @@ class OGRDBReader(object):
         intersecting_id_field="osm_id",
         ids=False,
         distance_buffer=5,
+        bbox=None,
+        owners=False,
     ):
         """
         Retrieves intersections between new_layer and intersecting_layer.
@@ -115,84 +382,242 @@ class OGRDBReader(object):
         Actually returns the nearest points on new_layer features that are within
         <distance_buffer> from features in intersecting_geometry_field
 
-        if ids = True, optionally returns a list of feature IDs from the intersecting layer`
+        Each intersection is returned with the FID of the new_layer feature
+        and the <intersecting_id_field> of the intersecting_layer feature
+        it was found on, so that the intersections of a feature can be
+        looked up without a spatial search. A point where a new feature
+        intersects several features is returned once for each.
+
+        if ids = True, also returns a list of feature IDs from intersecting_layer
         that represent the intersecting features in intersecting_layer
         with intersections to features in new_layer.
 
-        returns ogr.Layer
+        if <bbox> is provided, only intersections involving a feature
+        (from either layer) owned by <bbox> are returned (see bbox_filter),
+        and only ids of intersecting features owned by <bbox>
+        (intersections with features owned by <bbox> have owned = True).
+
+        if <owners> is true, each intersection also has the bounding box
+        centres of the two intersecting features (owners), i.e. where the
+        features are owned (see bbox_filter).
+
+        A feature never intersects an identical geometry (e.g. itself,
+        if new_layer is intersecting_layer).
+
+        Points are in the CRS of get_geometry_epsg(new_layer).
+
+        returns list of Intersection, and a list of str if ids = True.
         """
+        new_fid_field = self.get_fid_column(new_layer)
+        if not new_fid_field:
+            raise ValueError(f"{new_layer} has no FID (primary key) column.")
 
-        # get geometries for all close linestrings
+        # For each feature in new_layer, the features of intersecting_layer
+        # within distance_buffer (LATERAL, so each is an index scan).
         intersection_query = (
-            "SELECT distinct intersection FROM ("
-            "	SELECT                                                    "
-            "	   ST_ClosestPoint(n.{new_geometry_field}, o.{intersecting_geometry_field}) as intersection,"
-            "      n.{new_geometry_field} as ngeom                        "
-            "	FROM                                                      "
-            "	   {new_layer} AS n                                       "
-            "	RIGHT JOIN {intersecting_layer} AS o                      "
-            "   ON not st_equals(n.geometry, o.geometry) "
-            "	AND st_dwithin(n.geometry, o.geometry, {distance_buffer:.9f})"
-            ") isects "
-            "WHERE isects.ngeom is not NULL                                 "
+            "SELECT DISTINCT {closest_point} AS intersection, "
+            "n.{new_fid_field} AS new_fid, "
+            "o.{intersecting_id_field}::text AS intersecting_id, "
+            "{owned} AS owned{owner_columns} "
+            "FROM {new_layer} AS n "
+            "CROSS JOIN LATERAL ("
+            "SELECT o.{intersecting_geometry_field}, o.{intersecting_id_field} "
+            "FROM {intersecting_layer} AS o "
+            "WHERE ST_DWithin("
+            "n.{new_geometry_field}, o.{intersecting_geometry_field}, "
+            "{distance_buffer:.9f}) "
+            "AND NOT n.{new_geometry_field} = o.{intersecting_geometry_field}"
+            ") AS o"
+            "{bbox_condition}"
         )
 
-        # get ids for all intersecting features in intersecting_layer
-        id_query = (
-            "SELECT distinct o.{intersecting_id_field} FROM "
-            "{intersecting_layer} o "
-            "inner join {new_layer} n "
-            "on st_dwithin(n.{new_geometry_field}, o.{intersecting_geometry_field}, {distance_buffer:.5f}) "
+        srid = self.get_layer_epsg(new_layer)
+        bbox_condition, owned = "", "TRUE"
+        if bbox is not None:
+            owned = bbox_filter(bbox, f"o.{intersecting_geometry_field}", srid)
+            bbox_condition = (
+                f" WHERE {bbox_filter(bbox, f'n.{new_geometry_field}', srid)}"
+                f" OR {owned}"
+            )
+        owner_columns = ""
+        if owners:
+            owner_columns = "".join(
+                f", (ST_{d}Min({g}) + ST_{d}Max({g})) / 2 AS {alias}_{d.lower()}"
+                for alias, g in [
+                    ("n", f"n.{new_geometry_field}"),
+                    ("o", f"o.{intersecting_geometry_field}"),
+                ]
+                for d in ["X", "Y"]
+            )
+        closest_point = self._geometry_sql(
+            f"ST_ClosestPoint(n.{new_geometry_field}, o.{intersecting_geometry_field})"
         )
-
         this_intersection_query = intersection_query.format(
+            closest_point=closest_point,
             new_layer=new_layer,
             intersecting_layer=intersecting_layer,
             new_geometry_field=new_geometry_field,
             intersecting_geometry_field=intersecting_geometry_field,
+            new_fid_field=new_fid_field,
+            intersecting_id_field=intersecting_id_field,
             distance_buffer=distance_buffer,
+            bbox_condition=bbox_condition,
+            owned=owned,
+            owner_columns=owner_columns,
         )
         logging.debug(f"Executing SQL: {this_intersection_query}")
         queryLayer = self.data.ExecuteSQL(this_intersection_query)
 
-        # extract ids from db query
-        idlist = None
+        # split rows into intersections and ids of (owned) intersecting features
+        intersections, idlist = [], {}
+        _f = queryLayer.GetNextFeature()
+        while _f:
+            _g = _f.GetGeometryRef()
+            _owners = None
+            if owners:
+                _owners = [
+                    (_f.GetFieldAsDouble(f"{a}_x"), _f.GetFieldAsDouble(f"{a}_y"))
+                    for a in ["n", "o"]
+                ]
+            intersection = Intersection(
+                x=_g.GetX(),
+                y=_g.GetY(),
+                new_fid=_f.GetFieldAsInteger64("new_fid"),
+                intersecting_id=_f.GetFieldAsString("intersecting_id"),
+                owned=bool(_f.GetFieldAsInteger("owned")),
+                owners=_owners,
+            )
+            intersections.append(intersection)
+            if intersection.owned:
+                idlist[intersection.intersecting_id] = None
+            _f = queryLayer.GetNextFeature()
+        self.data.ReleaseResultSet(queryLayer)
+
         if ids:
-            idlist = []
-            this_id_query = id_query.format(
-                new_layer=new_layer,
-                intersecting_layer=intersecting_layer,
-                intersecting_id_field=intersecting_id_field,
-                new_geometry_field=new_geometry_field,
-                intersecting_geometry_field=intersecting_geometry_field,
-                distance_buffer=distance_buffer,
+            return intersections, list(idlist)
+        return intersections
+
+    def intersecting_ids(
+        self,
+        new_layer,
+        intersecting_layer,
+        new_geometry_field="geometry",
+        intersecting_geometry_field="geometry",
+        intersecting_id_field="osm_id",
+        distance_buffer=5,
+        bbox=None,
+    ):
+        """
+        Retrieves a list of feature IDs from intersecting_layer that
+        represent the features in intersecting_layer within
+        <distance_buffer> of features in new_layer (see intersections).
+
+        if <bbox> is provided, only features of intersecting_layer
+        owned by <bbox> are included (see bbox_filter).
+
+        returns list of str
+        """
+        # get ids for all intersecting features in intersecting_layer
+        id_query = (
+            "SELECT DISTINCT o.{intersecting_id_field} "
+            "FROM {intersecting_layer} AS o "
+            "WHERE EXISTS ("
+            "SELECT 1 FROM {new_layer} AS n "
+            "WHERE ST_DWithin("
+            "n.{new_geometry_field}, o.{intersecting_geometry_field}, "
+            "{distance_buffer:.9f}) "
+            "AND NOT n.{new_geometry_field} = o.{intersecting_geometry_field}"
+            ") "
+        )
+        this_id_query = id_query.format(
+            new_layer=new_layer,
+            intersecting_layer=intersecting_layer,
+            intersecting_id_field=intersecting_id_field,
+            new_geometry_field=new_geometry_field,
+            intersecting_geometry_field=intersecting_geometry_field,
+            distance_buffer=distance_buffer,
+        )
+        if bbox is not None:
+            this_id_query += "AND " + bbox_filter(
+                bbox,
+                f"o.{intersecting_geometry_field}",
+                self.get_layer_epsg(intersecting_layer),
             )
-            # this is a hack - using ogr for this SQL but there's
-            # no geometries being returned.
-            # cleaner would be psycopg2 but we already have an
-            # open db connection via OGR
-            logging.debug(f"Executing SQL: {this_id_query}")
+        # this is a hack - using ogr for this SQL but there's
+        # no geometries being returned.
+        # cleaner would be psycopg2 but we already have an
+        # open db connection via OGR
+        logging.debug(f"Executing SQL: {this_id_query}")
 
-            idLayer = self.data.ExecuteSQL(this_id_query)
+        idlist = []
+        idLayer = self.data.ExecuteSQL(this_id_query)
+        _id = idLayer.GetNextFeature()
+        while _id:
+            idlist.append(_id.GetFieldAsString(0))
             _id = idLayer.GetNextFeature()
-            while _id:
-                idlist.append(_id.GetFieldAsString(0))
-                _id = idLayer.GetNextFeature()
-
-        if idlist:
-            return queryLayer, idlist
-        else:
-            return queryLayer
+        return idlist
 
+    @_cached
     def get_layer_fields(self, layer):
         """Get field names from layer"""
-        layer = self.data.GetLayerByName(layer)
+        layer = self._get_layer(layer)
         return OGRDBReader._get_layer_fields(layer)
 
-    def get_layer_iter(self, layer):
-        """Return generator over features in layer"""
-        l = self.data.GetLayerByName(layer)
+    def get_layer_iter(self, layer, bbox=None, geometry_field="geometry"):
+        """Return generator over features in layer
+        (only those owned by <bbox> if provided, see bbox_filter)."""
+        if self.transform_srid is not None:
+            yield from self._select_features(
+                layer,
+                self._bbox_sql(layer, bbox, geometry_field),
+                geometry_field=geometry_field,
+            )
+            return
+
+        l = self._get_layer(layer)
+        if bbox is not None:
+            l.SetAttributeFilter(
+                bbox_filter(bbox, geometry_field, self.get_layer_epsg(layer))
+            )
         f = l.GetNextFeature()
         while f:
             yield f
             f = l.GetNextFeature()
+        if bbox is not None:
+            l.SetAttributeFilter(None)
+
+    @_cached
+    def get_arrow_columns(self, layer):
+        """Returns the names of the FID and geometry (WKB) columns
+        of Arrow batches of layer (see get_layer_batches)."""
+        _l = self._get_layer(layer)
+        return (
+            _l.GetFIDColumn() or "OGC_FID",
+            _l.GetGeometryColumn() or "wkb_geometry",
+        )
+
+    def get_layer_batches(
+        self, layer, bbox=None, geometry_field="geometry", batch_size=ARROW_BATCH_SIZE
+    ):
+        """
+        Return generator over pyarrow RecordBatches of up to <batch_size>
+        features in layer (only those owned by <bbox> if provided, see
+        bbox_filter), read through GDAL's Arrow stream interface
+        (GDAL >= 3.6, requires pyarrow) instead of one ogr.Feature at a
+        time. Batches have a column for the FID, for each field and for
+        the geometry as WKB (see get_arrow_columns).
+
+        Geometries are in the CRS of layer, even if <transform_srid>
+        is provided.
+        """
+        l = self._get_layer(layer)
+        if bbox is not None:
+            l.SetAttributeFilter(
+                bbox_filter(bbox, geometry_field, self.get_layer_epsg(layer))
+            )
+        try:
+            stream = l.GetArrowStreamAsPyArrow([f"MAX_FEATURES_IN_BATCH={batch_size}"])
+            yield from stream
+        finally:
+            if bbox is not None:
+                l.SetAttributeFilter(None)
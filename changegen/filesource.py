@@ -0,0 +1,475 @@
+import copy
+import logging
+import warnings
+
+import numpy as np
+import shapely
+from osgeo import gdal
+from osgeo import ogr
+
+from .db import _cached
+from .db import ARROW_BATCH_SIZE
+from .db import FETCH_BATCH_SIZE
+from .db import Intersection
+from .db import OGRDBReader
+
+"""
+filesource.py
+
+Reading of features from local files instead of a PostGIS database.
+
+OGRFileReader reads the layers of GeoPackage, FlatGeobuf, GeoParquet
+(or any other OGR-readable) files with the interface of
+db.OGRDBReader, so runs can use conflated layers before (or without)
+loading them into PostGIS. Queries that OGRDBReader runs in PostGIS
+(ownership by bounding boxes, intersections) are computed locally:
+intersections with a shapely STRtree over the candidate features.
+
+Classes:
+    OGRFileReader: OGRDBReader reading the layers of local files.
+
+"""
+
+# SQLite memory map size (bytes) for GeoPackages, see OGRFileReader.
+GPKG_MMAP_SIZE = 1 << 30
+
+
+def _owned(bbox, bounds):
+    """Returns whether each of <bounds> (an array of minx, miny, maxx,
+    maxy rows) is owned by <bbox> (see db.bbox_filter)."""
+    minx, miny, maxx, maxy = bbox
+    cx = (bounds[:, 0] + bounds[:, 2]) / 2
+    cy = (bounds[:, 1] + bounds[:, 3]) / 2
+    owned = np.ones(len(bounds), dtype=bool)
+    if minx is not None:
+        owned &= cx >= minx
+    if miny is not None:
+        owned &= cy >= miny
+    if maxx is not None:
+        owned &= cx < maxx
+    if maxy is not None:
+        owned &= cy < maxy
+    return owned
+
+
+def _extent(bounds):
+    """Returns the extent (minx, miny, maxx, maxy) of <bounds>
+    (an array of minx, miny, maxx, maxy rows), or None if empty."""
+    if len(bounds) == 0:
+        return None
+    return (
+        bounds[:, 0].min(),
+        bounds[:, 1].min(),
+        bounds[:, 2].max(),
+        bounds[:, 3].max(),
+    )
+
+
+class OGRFileReader(OGRDBReader):
+    """
+    Read features from local files via OGR, with the interface of
+    OGRDBReader. Every layer of every file in <sources> is a table
+    (a FlatGeobuf or GeoParquet file has one layer, named after the
+    file; a GeoPackage has one per table). Layer names must be unique.
+
+    GeoPackages are read through SQLite's memory-mapped I/O (up to
+    GPKG_MMAP_SIZE bytes). Other formats are read through OGR's own
+    file I/O.
+
+    Features have the FIDs OGR assigns them; the FID of a format
+    without a FID column can be used as an id field named "FID" (see
+    get_fid_column). Features have a single geometry, so geometry
+    field arguments are ignored. Geometries are always returned in the
+    CRS of their layer (there is no <transform_srid>).
+
+    Ownership by bounding boxes (see db.bbox_filter) uses the
+    envelopes of all features of a layer, which are read once.
+    """
+
+    def __init__(self, sources, transform_srid=None):
+        if transform_srid is not None:
+            raise ValueError(
+                "Geometries read from files can't be reprojected in PostGIS."
+            )
+        self.sources = list(sources)
+        self.transform_srid = None
+        self._cache = {}
+        self._open()
+
+    def _open(self):
+        """Opens all <sources>, and finds their layers by name."""
+        self.datasets, self.layers = [], {}
+        pragma = gdal.GetConfigOption("OGR_SQLITE_PRAGMA")
+        gdal.SetThreadLocalConfigOption(
+            "OGR_SQLITE_PRAGMA", pragma or f"mmap_size={GPKG_MMAP_SIZE}"
+        )
+        try:
+            for source in self.sources:
+                logging.debug(f"Opening source file: {source}")
+                data = ogr.Open(source, False)
+                if data is None:
+                    raise ValueError(f"Could not open {source}.")
+                self.datasets.append(data)
+                for i in range(data.GetLayerCount()):
+                    layer = data.GetLayer(i)
+                    if layer.GetName() in self.layers:
+                        raise ValueError(
+                            f"Layer {layer.GetName()} is in more than one source."
+                        )
+                    self.layers[layer.GetName()] = layer
+        finally:
+            gdal.SetThreadLocalConfigOption("OGR_SQLITE_PRAGMA", None)
+
+    def clone(self):
+        """Returns a new OGRFileReader with its own handles on the same
+        files (e.g. to read from another thread), sharing this
+        OGRFileReader's layer metadata cache."""
+        reader = copy.copy(self)
+        reader._open()
+        return reader
+
+    def _get_layer(self, layer):
+        try:
+            return self.layers[layer]
+        except KeyError:
+            raise ValueError(f"No layer named {layer} in {self.sources}.")
+
+    def get_layers(self):
+        """Return available layers from all sources."""
+        if len(self.layers) < 1:
+            raise ValueError("No layers found.")
+        return list(self.layers)
+
+    def get_tables(self, suffix):
+        """Returns the names of all layers ending in <suffix>."""
+        return [name for name in self.layers if name.endswith(suffix)]
+
+    @_cached
+    def get_layer_epsg(self, layer):
+        srs = self._get_layer(layer).GetSpatialRef().Clone()
+        if srs.GetAuthorityCode(None) is None:
+            srs.AutoIdentifyEPSG()
+        return srs.GetAuthorityCode(None)
+
+    @_cached
+    def get_fid_column(self, layer):
+        """Returns the name of the FID column of layer
+        ("FID" if the format has none)."""
+        return self._get_layer(layer).GetFIDColumn() or "FID"
+
+    def _feature_id(self, layer, feature, id_field):
+        """Returns the value of <id_field> of <feature> (of layer) as str."""
+        if id_field == self.get_fid_column(layer):
+            return str(feature.GetFID())
+        return feature.GetFieldAsString(feature.GetFieldIndex(id_field))
+
+    def _features(self, layer, rect=None):
+        """Return generator over all features in layer (only those
+        intersecting <rect>, [minx, miny, maxx, maxy], if provided)."""
+        l = self._get_layer(layer)
+        if rect is not None:
+            l.SetSpatialFilterRect(*rect)
+        l.ResetReading()
+        try:
+            f = l.GetNextFeature()
+            while f:
+                yield f
+                f = l.GetNextFeature()
+        finally:
+            if rect is not None:
+                l.SetSpatialFilter(None)
+
+    @_cached
+    def _envelopes(self, layer):
+        """Returns the FIDs and bounds (minx, miny, maxx, maxy rows)
+        of all features of layer with a geometry, as numpy arrays."""
+        fids, bounds = [], []
+        for f in self._features(layer):
+            geometry = f.GetGeometryRef()
+            if not geometry or geometry.IsEmpty():
+                continue
+            minx, maxx, miny, maxy = geometry.GetEnvelope()
+            fids.append(f.GetFID())
+            bounds.append((minx, miny, maxx, maxy))
+        return np.array(fids, dtype=np.int64), np.array(bounds).reshape(-1, 4)
+
+    def _owned_fids(self, layer, bbox):
+        """Returns the FIDs of the features of layer owned by <bbox>
+        (see db.bbox_filter), and their extent (None if there are none).
+        Every owned feature intersects the extent."""
+        fids, bounds = self._envelopes(layer)
+        owned = _owned(bbox, bounds)
+        return fids[owned], _extent(bounds[owned])
+
+    @_cached
+    def get_num_features(self, layer, bbox=None, geometry_field="geometry"):
+        """Returns the number of features in layer
+        (only those owned by <bbox> if provided, see bbox_filter)."""
+        if bbox is None:
+            return self._get_layer(layer).GetFeatureCount()
+        return len(self._owned_fids(layer, bbox)[0])
+
+    def get_layer_iter(self, layer, bbox=None, geometry_field="geometry"):
+        """Return generator over features in layer
+        (only those owned by <bbox> if provided, see bbox_filter)."""
+        if bbox is None:
+            yield from self._features(layer)
+            return
+        owned, rect = self._owned_fids(layer, bbox)
+        if rect is None:
+            return
+        owned = set(owned.tolist())
+        for f in self._features(layer, rect):
+            if f.GetFID() in owned:
+                yield f
+
+    def get_feature_by_id(self, layer, id, id_field, geometry_field="geometry"):
+        return next(iter(self.get_features_by_ids(layer, [str(id)], id_field)), None)
+
+    def _id_filter(self, layer, id_field, ids):
+        """Returns an OGR SQL attribute filter for the features of layer
+        whose <id_field> is one of <ids> (str). Ids that aren't valid
+        values of a numeric <id_field> are left out."""
+        if id_field == self.get_fid_column(layer):
+            field_type = ogr.OFTInteger64
+        else:
+            defn = self._get_layer(layer).GetLayerDefn()
+            field_type = defn.GetFieldDefn(defn.GetFieldIndex(id_field)).GetType()
+
+        values = []
+        for id in ids:
+            if field_type in (ogr.OFTInteger, ogr.OFTInteger64, ogr.OFTReal):
+                try:
+                    number = int(id) if field_type != ogr.OFTReal else float(id)
+                except ValueError:
+                    continue
+                values.append(repr(number))
+            else:
+                values.append("'" + id.replace("'", "''") + "'")
+        if len(values) == 0:
+            # OGR SQL has no empty IN ()
+            return "0 = 1"
+        return f'"{id_field}" IN ({", ".join(values)})'
+
+    def get_features_by_ids(
+        self,
+        layer,
+        ids,
+        id_field,
+        geometry_field="geometry",
+        batch_size=FETCH_BATCH_SIZE,
+    ):
+        """
+        Return generator over the features in layer whose <id_field> is
+        one of <ids> (str), in the order of <ids>, like
+        OGRDBReader.get_features_by_ids. Features are fetched <batch_size>
+        ids at a time with an attribute filter (<id_field> IN (...)),
+        which OGR evaluates (in SQLite, with its indexes, for GeoPackages).
+        """
+        ids = list(ids)
+        l = self._get_layer(layer)
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start : start + batch_size]
+            features = {}
+            l.SetAttributeFilter(self._id_filter(layer, id_field, batch))
+            try:
+                for _f in self._features(layer):
+                    _id = self._feature_id(layer, _f, id_field)
+                    if _id in features:
+                        warnings.warn(
+                            f"More than one ID match for {id_field}:{_id} (layer: {layer})"
+                        )
+                    else:
+                        features[_id] = _f
+            finally:
+                l.SetAttributeFilter(None)
+
+            for id in batch:
+                if id in features:
+                    yield features[id]
+                else:
+                    logging.warning(f"No match for {id_field}:{id} (layer: {layer})")
+
+    def get_all_ids_for_layer(
+        self, layer, id_fieldname="osm_id", bbox=None, geometry_field="geometry"
+    ):
+        """
+        Retrieves all unique values of `id_fieldname` within `layer`
+        (only for features owned by `bbox` if provided, see bbox_filter).
+        """
+        return list(
+            dict.fromkeys(
+                self._feature_id(layer, f, id_fieldname)
+                for f in self.get_layer_iter(layer, bbox=bbox)
+            )
+        )
+
+    def _geometries(self, layer, id_field, rect=None):
+        """Returns the FIDs, <id_field> values (str) and shapely
+        geometries of the features of layer with a geometry (only those
+        intersecting <rect> if provided), as numpy arrays."""
+        fids, ids, wkbs = [], [], []
+        for f in self._features(layer, rect):
+            geometry = f.GetGeometryRef()
+            if not geometry or geometry.IsEmpty():
+                continue
+            fids.append(f.GetFID())
+            ids.append(self._feature_id(layer, f, id_field))
+            wkbs.append(bytes(geometry.ExportToWkb()))
+        return (
+            np.array(fids, dtype=np.int64),
+            np.array(ids, dtype=object),
+            shapely.from_wkb(np.array(wkbs, dtype=object)),
+        )
+
+    def intersections(
+        self,
+        new_layer,
+        intersecting_layer,
+        new_geometry_field="geometry",
+        intersecting_geometry_field="geometry",
+        intersecting_id_field="osm_id",
+        ids=False,
+        distance_buffer=5,
+        bbox=None,
+        owners=False,
+    ):
+        """
+        Computes intersections between features of new_layer and
+        features of intersecting_layer, like OGRDBReader.intersections,
+        with a shapely STRtree over the features of intersecting_layer.
+
+        With <bbox>, only features within <distance_buffer> of the
+        features owned by <bbox> (in either layer) are read.
+
+        returns list of Intersection, and a list of str if ids = True.
+        """
+        rect, new_owned, other_owned = None, None, None
+        if bbox is not None:
+            new_owned, new_rect = self._owned_fids(new_layer, bbox)
+            other_owned, other_rect = self._owned_fids(intersecting_layer, bbox)
+            rects = np.array([r for r in [new_rect, other_rect] if r is not None])
+            if len(rects) == 0:
+                return ([], []) if ids else []
+            minx, miny, maxx, maxy = _extent(rects)
+            rect = (
+                minx - distance_buffer,
+                miny - distance_buffer,
+                maxx + distance_buffer,
+                maxy + distance_buffer,
+            )
+
+        new_fids, _, new_geoms = self._geometries(
+            new_layer, self.get_fid_column(new_layer), rect
+        )
+        other_fids, other_ids, other_geoms = self._geometries(
+            intersecting_layer, intersecting_id_field, rect
+        )
+
+        # pairs within distance_buffer, except identical geometries
+        n, o = shapely.STRtree(other_geoms).query(
+            new_geoms, predicate="dwithin", distance=distance_buffer
+        )
+        distinct = ~shapely.equals_exact(new_geoms[n], other_geoms[o], tolerance=0)
+        n, o = n[distinct], o[distinct]
+
+        owned = np.ones(len(o), dtype=bool)
+        if bbox is not None:
+            owned = np.isin(other_fids[o], other_owned)
+            involved = owned | np.isin(new_fids[n], new_owned)
+            n, o, owned = n[involved], o[involved], owned[involved]
+
+        # the points of new features closest to intersecting features
+        points = shapely.get_coordinates(
+            shapely.get_point(shapely.shortest_line(new_geoms[n], other_geoms[o]), 0)
+        ).tolist()
+        centres = None
+        if owners:
+            new_bounds = shapely.bounds(new_geoms[n])
+            other_bounds = shapely.bounds(other_geoms[o])
+            centres = np.hstack(
+                [
+                    (new_bounds[:, :2] + new_bounds[:, 2:]) / 2,
+                    (other_bounds[:, :2] + other_bounds[:, 2:]) / 2,
+                ]
+            ).tolist()
+
+        # like SELECT DISTINCT
+        intersections, idlist = {}, {}
+        for i in range(len(n)):
+            _owners = None
+            if owners:
+                _owners = [tuple(centres[i][:2]), tuple(centres[i][2:])]
+            intersection = Intersection(
+                x=points[i][0],
+                y=points[i][1],
+                new_fid=int(new_fids[n[i]]),
+                intersecting_id=other_ids[o[i]],
+                owned=bool(owned[i]),
+                owners=_owners,
+            )
+            key = intersection._replace(owners=tuple(_owners or []))
+            intersections.setdefault(key, intersection)
+            if intersection.owned:
+                idlist[intersection.intersecting_id] = None
+
+        if ids:
+            return list(intersections.values()), list(idlist)
+        return list(intersections.values())
+
+    def intersecting_ids(
+        self,
+        new_layer,
+        intersecting_layer,
+        new_geometry_field="geometry",
+        intersecting_geometry_field="geometry",
+        intersecting_id_field="osm_id",
+        distance_buffer=5,
+        bbox=None,
+    ):
+        """
+        Retrieves a list of feature IDs from intersecting_layer that
+        represent the features in intersecting_layer within
+        <distance_buffer> of features in new_layer (see intersections).
+
+        if <bbox> is provided, only features of intersecting_layer
+        owned by <bbox> are included (see bbox_filter).
+
+        returns list of str
+        """
+        return self.intersections(
+            new_layer,
+            intersecting_layer,
+            intersecting_id_field=intersecting_id_field,
+            ids=True,
+            distance_buffer=distance_buffer,
+            bbox=bbox,
+        )[1]
+
+    def get_layer_batches(
+        self, layer, bbox=None, geometry_field="geometry", batch_size=ARROW_BATCH_SIZE
+    ):
+        """
+        Return generator over pyarrow RecordBatches of up to <batch_size>
+        features in layer (only those owned by <bbox> if provided, see
+        bbox_filter), like OGRDBReader.get_layer_batches.
+        """
+        l = self._get_layer(layer)
+        owned = None
+        if bbox is not None:
+            owned, rect = self._owned_fids(layer, bbox)
+            if rect is None:
+                return
+            l.SetSpatialFilterRect(*rect)
+        fid_column = self.get_arrow_columns(layer)[0]
+        try:
+            stream = l.GetArrowStreamAsPyArrow([f"MAX_FEATURES_IN_BATCH={batch_size}"])
+            for batch in stream:
+                if owned is not None:
+                    batch = batch.filter(
+                        np.isin(batch.column(fid_column).to_numpy(), owned)
+                    )
+                yield batch
+        finally:
+            if bbox is not None:
+                l.SetSpatialFilter(None)
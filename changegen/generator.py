@@ -1,22 +1,27 @@
 import logging
 import sys
 from collections import Counter
+from collections import defaultdict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from datetime import datetime
 from itertools import chain
+from multiprocessing import Value
+from threading import local
 
+import numpy as np
 import ogr
 import osmium
 import pyproj
-import rtree
+import shapely
 import shapely.geometry as sg
-from numpy import argmax
-from numpy import argsort
-from numpy import cumsum
-from numpy import zeros
-from shapely import wkt
+from shapely import wkb
 from shapely.ops import nearest_points
-from shapely.ops import transform
 from tqdm import tqdm
 
+from .changewriter import fixed_array
 from .changewriter import Node
 from .changewriter import OSMChangeWriter
 from .changewriter import Relation
@@ -25,69 +30,107 @@ from .changewriter import Tag
 from .changewriter import Way
 from .db import hstore_as_dict
 from .db import OGRDBReader
+from .nodeindex import NodeIndex
+from .pbf import get_way_node_map as _get_way_node_map_parallel
+from .reproject import reprojected_features
+from .reproject import transformer as _transformer
+from .sourceindex import open_index
+from .tiles import clip_bbox
+from .tiles import owns
+from .tiles import SharedNodes
+from .tiles import TileGrid
+from .waynodes import WayNodeMap
 
 WGS84 = pyproj.CRS("EPSG:4326")
 WEBMERC = pyproj.CRS("EPSG:3857")
-COORDINATE_PRECISION = 6
 WAY_POINT_THRESHOLD = 1500
-
-
-def _get_way_node_map(osm, way_idlist):
-    """Returns a dictionary of osm_id : [node_ids]
+# Number of features per unit of work when processing features in parallel.
+FEATURE_CHUNK_SIZE = 500
+# Number of IDs reserved from an IdAllocator at a time.
+ID_BLOCK_SIZE = 10000
+# Distance (degrees) within which an intersection Node is on a feature.
+INTERSECTION_TOLERANCE = 0.0001
+# Number of intersection queries run concurrently (one connection each).
+INTERSECTION_QUERY_WORKERS = 4
+# Normalized locations along a linestring closer than this are equal
+# (see _get_point_insertion_indices).
+LOCATION_EPSILON = 1e-12
+
+
+def _get_way_node_map(osm, way_idlist, workers=1):
+    """Returns a WayNodeMap of osm_id : [node_ids]
     for all Ways specified with way_idlist
     from an osm.pbf file.
+
+    Only Ways are decoded from <osm> and the ID filter is applied
+    inside libosmium, so Python only sees the Ways that were asked for.
+
+    If a current source index exists for <osm> (see `changegen index`),
+    Ways are read from the index instead. Otherwise, if <workers> > 1,
+    ranges of PBF blocks are decoded in <workers> processes.
     """
+    ids = {int(i) for i in way_idlist}
+    if len(ids) == 0:
+        return WayNodeMap()
 
-    class _wayFilter(osmium.SimpleHandler):
-        def __init__(self, ids):
-            super(_wayFilter, self).__init__()
-            self.ids = set(ids)
-            self.node_map = {}
+    source_index = open_index(osm)
+    if source_index is not None:
+        node_map = source_index.get_way_node_map(ids)
+        source_index.close()
+        return node_map
 
-        def way(self, w):
-            if str(w.id) in self.ids:
-                self.node_map[str(w.id)] = [str(n.ref) for n in w.nodes]
+    if workers > 1:
+        return _get_way_node_map_parallel(osm, ids, workers)
 
-    _filter = _wayFilter(way_idlist)
-    _filter.apply_file(osm)
-    return _filter.node_map
+    ways = osmium.FileProcessor(osm, osmium.osm.WAY).with_filter(
+        osmium.filter.IdFilter(ids)
+    )
+    return WayNodeMap.from_ways((w.id, (n.ref for n in w.nodes)) for w in ways)
 
 
-def _nodes_for_intersections(ilayer, idgen):
+def _nodes_for_intersections(intersections, epsg, idgen, shared_nodes=None):
     """
-    Produces a Node for each point in
-    ilayer.
+    Produces a Node for each intersection in
+    intersections.
 
-    ilayer is an ogr.Layer
+    intersections is a list of db.Intersection, with points
+    in the CRS with EPSG code <epsg>
     idgen is a generator/iterator yielding ids
+    if shared_nodes (a tiles.SharedNodes) is provided, Nodes are taken
+    from it (intersections must have owners, see db.intersections).
+    Intersections at the same point (with the same owners) share a Node.
     Returns a list.
     """
 
-    if len(ilayer) == 0:
+    if len(intersections) == 0:
         return []
 
-    ilayer_epsg = ilayer.GetSpatialRef().GetAttrValue("AUTHORITY", 1)
-    ilayer_reproject = pyproj.Transformer.from_crs(
-        pyproj.CRS(f"EPSG:{ilayer_epsg}"), WGS84, always_xy=True
-    ).transform
-
-    nodes = []
-    _f = ilayer.GetNextFeature()
-    while _f:
-        _f_geom = transform(
-            ilayer_reproject, wkt.loads(_f.GetGeometryRef().ExportToWkt())
-        )
-        nodes.append(
-            Node(
+    # collect all distinct points, then reproject them at once
+    points = {}
+    for isect in intersections:
+        key = (isect.x, isect.y) + tuple(isect.owners or [])
+        points.setdefault(key, isect)
+    lons = np.array([isect.x for isect in points.values()], dtype=float)
+    lats = np.array([isect.y for isect in points.values()], dtype=float)
+    transformer = _transformer(epsg)
+    if transformer is not None:
+        lons, lats = transformer.transform(lons, lats)
+
+    nodes = {}
+    for (key, isect), lon, lat in zip(points.items(), lons.tolist(), lats.tolist()):
+        if shared_nodes is not None:
+            nodes[key] = shared_nodes.node(lon, lat, isect.owners, idgen)
+        else:
+            nodes[key] = Node(
                 id=next(idgen),
                 version="1",
-                lat=_f_geom.y,
-                lon=_f_geom.x,
+                lat=lat,
+                lon=lon,
                 tags=[],  # maybe remove
             )
-        )
-        _f = ilayer.GetNextFeature()
-    return nodes
+    return [
+        nodes[(isect.x, isect.y) + tuple(isect.owners or [])] for isect in intersections
+    ]
 
 
 def _get_deleted_way_ids(table, db, idfield="osm_id"):
@@ -96,66 +139,272 @@ def _get_deleted_way_ids(table, db, idfield="osm_id"):
     return [_f.GetFieldAsString(_f.GetFieldIndex(idfield)) for _f in deletions_iter]
 
 
-def _generate_intersection_db(layer, others, db, idgen, self=False):
+def _concurrent_intersections(db, queries, workers=INTERSECTION_QUERY_WORKERS):
+    """
+    Yields the result of db.intersections(**kwargs) for each kwargs in
+    <queries>, in order.
+
+    Queries are run concurrently by up to <workers> threads, each with
+    its own connection (see db.OGRDBReader.clone), so the database
+    server runs them at the same time. Each result is yielded as soon
+    as it and all results before it have arrived.
+    """
+    if len(queries) < 2 or workers < 2:
+        for kwargs in queries:
+            yield db.intersections(**kwargs)
+        return
+
+    connections = local()
+
+    def _intersections(kwargs):
+        if not hasattr(connections, "db"):
+            connections.db = db.clone()
+        return connections.db.intersections(**kwargs)
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(queries))) as pool:
+        yield from pool.map(_intersections, queries)
+
+
+def _query_intersections(
+    layer,
+    others,
+    db,
+    self=False,
+    bbox=None,
+    query_workers=INTERSECTION_QUERY_WORKERS,
+):
+    """
+    Returns the intersections between all features in <layer> and
+    in each of <others> layers in db, and, if <self> is true, among
+    features in <layer>: a list of lists of db.Intersection, one for
+    each table in others, followed by the self intersections (if any).
+
+    if <bbox> is provided, only intersections involving features
+    owned by <bbox> are included (see db.bbox_filter).
+
+    Intersections are read with their owners, so that Nodes on tile
+    edges can be shared between tiles (see tiles.SharedNodes).
+
+    the intersection queries for all <others> (and <layer>, if <self>)
+    are run concurrently by up to <query_workers> connections
+    (see _concurrent_intersections).
     """
-    Returns an rtree spatial index containing Nodes
-    representing intersections between all features
-    in <layer> and in all <others> layers in db.
+    queries = [
+        dict(new_layer=layer, intersecting_layer=other, bbox=bbox, owners=True)
+        for other in others
+    ]
+    if self:
+        queries.append(
+            dict(
+                new_layer=layer,
+                intersecting_layer=layer,
+                intersecting_id_field=db.get_fid_column(layer),
+                bbox=bbox,
+                owners=True,
+            )
+        )
+    return list(_concurrent_intersections(db, queries, workers=query_workers))
+
+
+def _intersecting_ids(intersections):
+    """Returns the ids of the (owned) intersecting features of
+    <intersections>, in order, as returned by db.intersections(ids=True)."""
+    return list(dict.fromkeys(i.intersecting_id for i in intersections if i.owned))
+
+
+def _generate_intersection_db(
+    layer,
+    others,
+    db,
+    idgen,
+    self=False,
+    bbox=None,
+    shared_nodes=None,
+    query_workers=INTERSECTION_QUERY_WORKERS,
+    intersections=None,
+):
+    """
+    Returns Nodes representing intersections between all features
+    in <layer> and in all <others> layers in db, and a FeatureNodes
+    assigning them to the features they were found on.
 
     if <self> is true, also include intersections
     among features in <layer>.
 
     idgen is an iterator yielding unique ids
 
-    returns a list of nodes and the rtree containing them,
+    if <intersections> (see _query_intersections) is provided, they are
+    used instead of being queried with <bbox> and <query_workers>.
+
+    if <bbox> is provided, only intersections involving features
+    owned by <bbox> are included (see db.bbox_filter).
+
+    if <shared_nodes> (a tiles.SharedNodes) is provided, Nodes for
+    intersections shared with other tiles are taken from it.
+
+    returns a list of nodes, the FeatureNodes of <layer> and <others>,
     and a list of lists of intersecting ids for each
     table in others for modifying those intersecting ways.
 
     """
-    nodes = []
-    idlists = []
-    for other in others:
-        ilayer, idlist = db.intersections(
-            new_layer=layer,
-            intersecting_layer=other,
-            ids=True,
+    if intersections is None:
+        intersections = _query_intersections(
+            layer, others, db, self=self, bbox=bbox, query_workers=query_workers
         )
-        if ilayer:
-            nodes.extend(_nodes_for_intersections(ilayer, idgen))
-            idlists.append(idlist)
-
-    if self:
-        ilayer = db.intersections(new_layer=layer, intersecting_layer=layer, ids=False)
-        if ilayer:
-            nodes.extend(_nodes_for_intersections(ilayer, idgen))
+    nodes = {}
+    # (node id, fid of a feature in <layer>, osm id of a Way in <others>)
+    assignments = []
+    idlists = []
+    epsg = db.get_geometry_epsg(layer)
+    # results are merged in the order of <others>, so Node ids
+    # don't depend on which query finished first.
+    for isects in intersections[: len(others)]:
+        for isect, node in zip(
+            isects, _nodes_for_intersections(isects, epsg, idgen, shared_nodes)
+        ):
+            nodes.setdefault(node.id, node)
+            assignments.append((node.id, isect.new_fid, isect.intersecting_id))
+        idlists.append(_intersecting_ids(isects))
+
+    # the self intersections, if any, are the last ones
+    for isects in intersections[len(others) :]:
+        for isect, node in zip(
+            isects, _nodes_for_intersections(isects, epsg, idgen, shared_nodes)
+        ):
+            nodes.setdefault(node.id, node)
+            assignments.append((node.id, isect.new_fid, None))
+            assignments.append((node.id, int(isect.intersecting_id), None))
+    nodes = list(nodes.values())
 
     # ensure no duplicate intersection nodes, which can happen
     # in the case of self intersections (e.g. where new features
     # are split using existing features, so they both intersect
     # with new features and existing features).
-    # Dictionary trick explained here: https://stackoverflow.com/a/51635247
+    # Nodes are duplicates if their fixed-point coordinates are equal;
+    # like a dictionary of coordinates : Node, the last duplicate is
+    # kept, in the position of the first (and replaces the others
+    # in the FeatureNodes).
+    survivors = {}
     if len(nodes) > 0:
         logging.info(f"{len(nodes)} intersection nodes found.")
-    nodes = {
-        (round(n.lat, COORDINATE_PRECISION), round(n.lon, COORDINATE_PRECISION)): n
-        for n in nodes
-    }.values()
-    if len(nodes) > 0:
+        keys = _coordinate_keys([n.lon for n in nodes], [n.lat for n in nodes])
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        last = np.zeros(len(first), dtype=np.intp)
+        np.maximum.at(last, inverse.ravel(), np.arange(len(nodes)))
+        survivors = {n.id: nodes[last[g]] for n, g in zip(nodes, inverse.ravel())}
+        nodes = [nodes[i] for i in last[np.argsort(first)]]
         logging.info(f"{len(nodes)} intersection nodes after duplicate removal.")
 
-    rt = rtree.index.Index()
-    for node in nodes:
-        rt.insert(
-            node.id,
-            (
-                node.lon - 0.001,
-                node.lat - 0.001,
-                node.lon + 0.001,
-                node.lat + 0.001,
-            ),  # left, bottom, right, top
-            obj=node,
-        )
-    return nodes, rt, idlists
+    feature_nodes = FeatureNodes()
+    for node_id, fid, osm_id in assignments:
+        feature_nodes.add(survivors[node_id], fid=fid, osm_id=osm_id)
+
+    return nodes, feature_nodes, idlists
+
+
+def _coordinate_keys(lons, lats):
+    """Returns an int64 key for each coordinate (<lons>[i], <lats>[i]),
+    equal for coordinates with equal fixed-point (1e-7 degree) values."""
+    lons, lats = fixed_array(lons), fixed_array(lats)
+    return (lats << 32) | (lons & 0xFFFFFFFF)
+
+
+class FeatureNodes(object):
+    """
+    The intersection Nodes of each feature, as assigned by the
+    intersection query (see db.intersections): Nodes of features of the
+    new table by FID, and of existing Ways by OSM id. Each feature has
+    its Nodes in the order they were assigned, without duplicates, so
+    no spatial search is needed to find them.
+
+    All Nodes share one NodeIndex (see index), built on first use,
+    for snapping vertices to a feature's Nodes (see _snap_to_nodes).
+    """
+
+    def __init__(self):
+        super(FeatureNodes, self).__init__()
+        self.by_fid = defaultdict(dict)
+        self.by_osm_id = defaultdict(dict)
+        self.positions = {}  # node id : position in index
+        self._index = None
+
+    @property
+    def index(self):
+        """NodeIndex of all Nodes, in the order of <positions>."""
+        if self._index is None:
+            nodes = {}
+            for assigned in chain(self.by_fid.values(), self.by_osm_id.values()):
+                nodes.update(assigned)
+            self._index = NodeIndex.from_nodes(nodes.values())
+            self.positions = {node_id: i for i, node_id in enumerate(nodes)}
+        return self._index
+
+    def add(self, node, fid=None, osm_id=None):
+        """Assigns <node> to the new feature <fid> and/or
+        the existing Way <osm_id> (if provided)."""
+        self._index = None
+        if fid is not None:
+            self.by_fid[int(fid)][node.id] = node
+        if osm_id is not None:
+            self.by_osm_id[str(osm_id)][node.id] = node
+
+    def for_feature(self, fid):
+        """Returns the intersection Nodes of the new feature with FID <fid>."""
+        return list(self.by_fid.get(int(fid), {}).values())
+
+    def for_way(self, osm_id):
+        """Returns the intersection Nodes of the existing Way <osm_id>."""
+        return list(self.by_osm_id.get(str(osm_id), {}).values())
+
+
+def _boundary_node_ids(intersections, n_others, feature_nodes, bbox):
+    """
+    Returns the ids of the Nodes (assigned in <feature_nodes>) of the
+    <intersections> (see _query_intersections, with <n_others> other
+    layers) that involve a feature not owned by <bbox>. The bbox owning
+    that feature finds the same intersections and creates its own
+    Nodes for them (see changegen.shards).
+    """
+    node_ids = set()
+    for query, isects in enumerate(intersections):
+        for isect in isects:
+            if all(owns(bbox, x, y) for x, y in isect.owners):
+                continue
+            if query < n_others:
+                other = feature_nodes.by_osm_id.get(str(isect.intersecting_id), {})
+            else:
+                other = feature_nodes.by_fid.get(int(isect.intersecting_id), {})
+            new = feature_nodes.by_fid.get(int(isect.new_fid), {})
+            node_ids.update(new.keys() & other.keys())
+    return node_ids
+
+
+def _snap_to_nodes(xs, ys, nodes, feature_nodes=None, tolerance=INTERSECTION_TOLERANCE):
+    """For each point (xs[i], ys[i]), returns the position in <nodes>
+    of the nearest Node closer than <tolerance> to it, or -1.
+
+    If <feature_nodes> (the FeatureNodes <nodes> were taken from) is
+    provided, its index is queried instead of building one for <nodes>.
+    """
+    if len(nodes) == 0:
+        return np.full(len(xs), -1, dtype=np.int64)
+    if feature_nodes is None:
+        return NodeIndex.from_nodes(nodes).nearest_within(xs, ys, tolerance)
+
+    index = feature_nodes.index
+    among = np.array([feature_nodes.positions[n.id] for n in nodes], dtype=np.int64)
+    nearest = index.nearest_within(xs, ys, tolerance, among=among)
+    # positions in the index -> positions in <nodes>
+    by_position = np.argsort(among)
+    local = by_position[
+        np.clip(np.searchsorted(among[by_position], nearest), 0, len(among) - 1)
+    ]
+    return np.where(nearest >= 0, local, -1)
+
+
+def _on_geometry(nodes, geom, tolerance=INTERSECTION_TOLERANCE):
+    """Returns the <nodes> within <tolerance> of <geom>."""
+    return [n for n in nodes if geom.distance(sg.Point(n.lon, n.lat)) < tolerance]
 
 
 def _id_gen(id_offset, neg_id):
@@ -166,6 +415,46 @@ def _id_gen(id_offset, neg_id):
         id = (id + 1) if not neg_id else (id - 1)
 
 
+class IdAllocator(object):
+    """
+    Hands out disjoint blocks of IDs, starting at <id_offset>.
+
+    Blocks are reserved from a counter in shared memory, so a single
+    IdAllocator can be shared by processes (pass it to them when they
+    are created, e.g. as a ProcessPoolExecutor initializer argument)
+    that all generate IDs for the same run.
+
+    Blocks are of ID magnitudes (see _id_gen for negative IDs).
+    If <id_limit> is provided, IDs are restricted to [id_offset, id_limit).
+    """
+
+    def __init__(self, id_offset=0, id_limit=None):
+        super(IdAllocator, self).__init__()
+        self.next_id = Value("q", id_offset)
+        self.id_limit = id_limit
+
+    def reserve(self, n):
+        """Reserves a block of <n> IDs and returns the first."""
+        with self.next_id.get_lock():
+            start = self.next_id.value
+            if self.id_limit is not None and start + n > self.id_limit:
+                raise RuntimeError(
+                    f"ID range exhausted: cannot reserve {n} IDs "
+                    f"from {start} (limit: {self.id_limit})."
+                )
+            self.next_id.value += n
+        return start
+
+
+def _allocated_id_gen(allocator, neg_id, block_size=ID_BLOCK_SIZE):
+    """generator for sequential IDs within blocks
+    reserved from IdAllocator <allocator>"""
+    while True:
+        ids = _id_gen(allocator.reserve(block_size), neg_id)
+        for _ in range(block_size):
+            yield next(ids)
+
+
 def _generate_tags_from_feature(feature, fields, hstore_column=None, exclude=[]):
     """returns list of tags given layer fields and a feature containing
     fields. Will not produce a tag for any field name in <exclude>.
@@ -205,54 +494,175 @@ def _generate_tags_from_feature(feature, fields, hstore_column=None, exclude=[])
     return tags
 
 
-def _get_point_insertion_index(linestring, point):
-    """Returns the index at which <point>
+def _field_string(value):
+    """Returns <value> (a Python value of an Arrow column) formatted
+    like ogr.Feature.GetFieldAsString formats it, for common types."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float):
+        return f"{value:.15g}"
+    if isinstance(value, datetime):
+        return value.strftime("%Y/%m/%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.strftime("%Y/%m/%d")
+    return str(value)
+
+
+def _generate_tags_from_batch(columns, fields, n_rows, hstore_column=None):
+    """returns a list of tags (see _generate_tags_from_feature) for
+    each of <n_rows> rows of <columns>, a dictionary of field name :
+    list of field values as strings."""
+    tag_fields = [f for f in fields if f != hstore_column]
+    if len(tag_fields) > 0:
+        tags = [
+            [Tag(key=f, value=v) for f, v in zip(tag_fields, values)]
+            for values in zip(*[columns[f] for f in tag_fields])
+        ]
+    else:
+        tags = [[] for _ in range(n_rows)]
+
+    if hstore_column:
+        existing_keys = set(fields)
+        for row_tags, hstore_str in zip(tags, columns[hstore_column]):
+            try:
+                hstore_content = hstore_as_dict(hstore_str)
+            except ValueError:
+                logging.error(f'!! Error parsing hstore column "{hstore_column}".')
+                continue
+            for key, value in hstore_content.items():
+                if key not in existing_keys:
+                    row_tags.append(Tag(key=key, value=value))
+
+    return tags
+
+
+def _get_point_insertion_indices(linestring, points, return_locations=False):
+    """Returns the indices at which each of <points>
     should be inserted in a linestring .
 
     linestring: shapely.geometry.LineString
-    point: shapely.geometry.Point
+    points: sequence of shapely.geometry.Point, or of (x, y)
 
          N N+1
          | |
-         | |
-         v v
-    -----+*+------
+    o----o-x--o------o
+           |
+           |
           |
           |
 
-    returns integer
+    Each index is computed against the original <linestring>
+    (i.e. not accounting for the other points being inserted).
+
+    returns numpy array of integers, or (indices, locations) if
+    <return_locations>, where locations are the normalized positions
+    of <points> along <linestring>.
     """
+    ls_pts = np.asarray(linestring.coords, dtype=float)[:, :2]
+    pts = np.asarray(
+        [(p.x, p.y) if isinstance(p, sg.Point) else p[:2] for p in points],
+        dtype=float,
+    ).reshape(-1, 2)
+    if len(pts) == 0:
+        empty = np.zeros(0, dtype=np.intp)
+        return (empty, np.zeros(0)) if return_locations else empty
+
+    # compute each constituent point's % along total length in <linestring>:
+    # cumulative sum of pairwise distances, divided by total length
+    seg_lengths = np.hypot(*np.diff(ls_pts, axis=0).T)
+    ls_pts_cumulative = np.zeros(len(ls_pts))
+    np.cumsum(seg_lengths, out=ls_pts_cumulative[1:])
+    total_ls_length = ls_pts_cumulative[-1]
+    if total_ls_length == 0:
+        indices = np.full(len(pts), len(ls_pts) - 1, dtype=np.intp)
+        return (indices, np.zeros(len(pts))) if return_locations else indices
+    ls_pts_fractional = ls_pts_cumulative / total_ls_length
+
+    # at what % along <linestring> should each point be inserted?
+    interpolated_ptlocs = shapely.line_locate_point(
+        linestring, shapely.points(pts), normalized=True
+    )
 
-    # at what % along <linestring> should <point> be inserted?
-    interpolated_ptloc = linestring.project(point, normalized=True)
+    # insertion index is the smallest index in <ls_pts_fractional>
+    # at which the fractional location of a point is less than
+    # the fractional location of an existing point in <linestring>,
+    # or len(ls_pts) - 1 if there is none. Points located on a vertex
+    # (up to rounding between shapely's lengths and ours) go after it.
+    indices = np.minimum(
+        np.searchsorted(
+            ls_pts_fractional, interpolated_ptlocs + LOCATION_EPSILON, side="right"
+        ),
+        len(ls_pts) - 1,
+    )
+    return (indices, interpolated_ptlocs) if return_locations else indices
 
-    # compute each constituent point's % along total length in <linestring>
-    total_ls_length = 0
-    ls_pts = list(linestring.coords)
-    ls_pts_distances = zeros(len(ls_pts))
-    for pt_idx in range(len(ls_pts) - 1):
-        pointwise_dist = sg.Point(*ls_pts[pt_idx]).distance(
-            sg.Point(*ls_pts[pt_idx + 1])
-        )
-        # distance of pt_idx + 1 from pt_idx
-        ls_pts_distances[pt_idx + 1] = pointwise_dist
-        # accumulate pointwise_dist into total length
-        total_ls_length += pointwise_dist
 
-    # compute fractional distance along line for each point
-    # need cumulative sum of pairwise distances
-    # divide each cumulative sum by total length
-    ls_pts_fractional = cumsum(ls_pts_distances) / total_ls_length
+def _merge_intersection_nodes(coords, node_ids, add_nodes):
+    """Merge <add_nodes> (Nodes) into <node_ids>, the Node IDs
+    of the vertices <coords> of a linestring.
 
-    # insertion index is the smallest index in <ls_pts_fractional>
-    # at which the fractional location of <point> is less than
-    # the fractional index of any existing point in <linestring>.
+    Every Node is projected onto the original linestring once;
+    the Nodes are then merged into <node_ids> in order of their
+    position along it in a single pass.
+
+    If a Node already exists on the linestring (i.e. it has the
+    same coordinates as the vertex next to its insertion point, e.g.
+    if two trails intersect exactly at an endpoint), it replaces
+    that vertex's Node to maintain connectivity.
+
+    returns (new list of Node IDs, dict of replaced Node ID -> new Node ID)
+    """
+    node_ids = list(node_ids)
+    if len(add_nodes) == 0:
+        return node_ids, {}
+    if len(coords) < 2:
+        logging.warning("Malformed linestring found.")
+        return node_ids, {}
+
+    add_pts = [(n.lon, n.lat) for n in add_nodes]
+    indices, locations = _get_point_insertion_indices(
+        sg.LineString(coords), add_pts, return_locations=True
+    )
+
+    # compare fixed-point coordinates of each Node with the
+    # vertices before and at its insertion point
+    vertex_keys = _coordinate_keys(*np.asarray(coords, dtype=float)[:, :2].T)
+    vertex_keys = vertex_keys[: len(node_ids)]
+    node_keys = _coordinate_keys(*np.asarray(add_pts, dtype=float).T)
+    replace_at = np.full(len(add_nodes), -1)
+    if len(vertex_keys) > 0:
+        prev_v = np.clip(indices - 1, 0, len(vertex_keys) - 1)
+        at_v = np.minimum(indices, len(vertex_keys) - 1)
+        at_match = (indices < len(vertex_keys)) & (vertex_keys[at_v] == node_keys)
+        prev_match = (
+            (indices >= 1)
+            & (indices - 1 < len(vertex_keys))
+            & (vertex_keys[prev_v] == node_keys)
+        )
+        replace_at[at_match] = at_v[at_match]
+        replace_at[prev_match] = prev_v[prev_match]
+
+    replacements = {}
+    insertions = []
+    for n, idx, loc, v in zip(add_nodes, indices, locations, replace_at):
+        if v >= 0:
+            replacements[v] = n.id
+        else:
+            insertions.append((idx, loc, n.id))
+    insertions.sort()
+
+    merged = []
+    ins = 0
+    for v, node_id in enumerate(node_ids):
+        while ins < len(insertions) and insertions[ins][0] == v:
+            merged.append(insertions[ins][2])
+            ins += 1
+        merged.append(replacements.get(v, node_id))
+    merged.extend(i[2] for i in insertions[ins:])
 
-    insertion_locations = interpolated_ptloc < ls_pts_fractional
-    # np.argmax returns the first index where <insertion_locations>
-    # is True, unless all elements of the array are False
-    # (in which case the insertion is at idx  = len(ls_pts) -1 )
-    return argmax(insertion_locations) if any(insertion_locations) else len(ls_pts) - 1
+    return merged, {node_ids[v]: n_id for v, n_id in replacements.items()}
 
 
 def _make_ways(nds, tags, idgen, node_limit=2000, closed=False):
@@ -304,72 +714,27 @@ def _make_ways(nds, tags, idgen, node_limit=2000, closed=False):
     return ways
 
 
-def _modify_existing_way(way_geom, way_id, nodes, tags, intersection_db):
+def _modify_existing_way(way_geom, way_id, nodes, tags, intersection_nodes):
     """
-    Create a new Way with id <way_id> made up of <nodes> and containing <tags>.
+    Create a new Way with id <way_id> made up of <nodes> (a sequence of
+    Node IDs, e.g. from a WayNodeMap) and containing <tags>.
 
-    All nodes in intersection_db that intersect with <way_geom> will be added
-    to the Way and the nodelist at the index they're nearest to.
+    All <intersection_nodes> (the Way's Nodes, see FeatureNodes) that
+    intersect with <way_geom> will be added to the Way and the nodelist
+    at the index they're nearest to.
 
     Returns <Way>
     """
-    new_nodes = nodes.copy()
+    new_nodes = list(nodes)
     way_geom_pts = list(way_geom.coords)
     if len(way_geom_pts) > WAY_POINT_THRESHOLD:
         logging.warning(
             f"There are {len(way_geom_pts)} in the linestring, which is greater than the threshold ({WAY_POINT_THRESHOLD})."
         )
 
-    add_nodes = [
-        n
-        for n in [
-            _n.object
-            for _n in intersection_db.intersection(
-                way_geom.buffer(0.01).bounds, objects=True
-            )
-        ]
-        if way_geom.intersects(sg.Point(n.lon, n.lat).buffer(0.0001))
-    ]
-
-    for n in add_nodes:
+    add_nodes = _on_geometry(intersection_nodes, way_geom)
 
-        # ensure at least 2 nodes in linestring
-        if len(way_geom_pts) < 2:
-            logging.warning("Malformed linestring found.")
-            continue
-
-        _g = sg.LineString(way_geom_pts)
-        idx = _get_point_insertion_index(_g, sg.Point(n.lon, n.lat))
-        ip_x, ip_y = way_geom_pts[idx]
-        # there's a special case here where the intersection point already exists
-        # on geom (e.g. if two trails intersect exactly at the endpoint of geom)
-        #
-        # to maintain connectivity we need to replace that Node in Geom
-        # with n
-        if round(  # if geom[idx] and add_node are the same
-            n.lat, COORDINATE_PRECISION
-        ) == round(ip_y, COORDINATE_PRECISION) and round(
-            n.lon, COORDINATE_PRECISION
-        ) == round(
-            ip_x, COORDINATE_PRECISION
-        ):
-
-            try:
-                del new_nodes[idx]  # avoid duplicating existing Node n
-                del way_geom_pts[idx]
-            except IndexError as e:
-                logging.warning(
-                    "Out of bounds error in Node removal. Does the intersection db have duplicates? "
-                )
-
-            new_nodes.insert(idx, n.id)
-            way_geom_pts.insert(idx, (n.lon, n.lat))
-
-        else:
-            # just add the node id to the Way, because it doesn't
-            # already exist in the linestring.
-            new_nodes.insert(idx, n.id)
-            way_geom_pts.insert(idx, (n.lon, n.lat))
+    new_nodes, _ = _merge_intersection_nodes(way_geom_pts, new_nodes, add_nodes)
 
     # If this is a long linestring we need to split it into many ways maybe
     # ways = _make_ways(node_ids_for_way, tags, idgen, node_limit=2000)
@@ -399,18 +764,19 @@ def _generate_ways_and_nodes(
     geom,
     idgen,
     tags,
-    intersection_db,
+    intersection_nodes,
     nodes=None,
     way_id=None,
     max_nodes_per_way=2000,
     closed=False,
+    feature_nodes=None,
 ):
     """produce way and node objects for a geometry,
     using generator idgen to assign IDs. Adds tags
     to Way.
 
-    if intersection_db is provided, all nodes in db that
-    intersect with geom will be  added to the resulting Way
+    all <intersection_nodes> (the feature's Nodes, see FeatureNodes)
+    that intersect with geom will be added to the resulting Way
     at the index they're nearest to.
 
     any nodes added in add_nodes are NOT returned in
@@ -420,71 +786,36 @@ def _generate_ways_and_nodes(
     the `nd` ref of the first node to the end of the
     `nds` list of the newly-created Way.
 
+    if `feature_nodes` (the FeatureNodes <intersection_nodes> were
+    taken from) is provided, its index is used (see _snap_to_nodes).
+
     """
     nodes = []
     node_ids_for_way = []
-    for (x, y) in geom.coords:
-        this_point = sg.Point(x, y)
-
-        # don't create a new node if there's already one in the intersection DB
-        potential_inodes = [
-            (n, this_point.distance(sg.Point(n.lon, n.lat)))
-            for n in [
-                _n.object
-                for _n in intersection_db.intersection(
-                    this_point.buffer(0.001).bounds, objects=True
-                )
-            ]
-            if sg.Point(n.lon, n.lat).within(this_point.buffer(0.0001))
-        ]
-        sorted_inodes = sorted(potential_inodes, key=lambda x: x[1])
-
-        if len(potential_inodes) > 0:
-            node_ids_for_way.append(sorted_inodes[0][0].id)
+    xs, ys = geom.coords.xy
+    # don't create a new node if there's already an intersection node
+    # (snap every vertex to its nearest intersection node at once)
+    snapped = _snap_to_nodes(xs, ys, intersection_nodes, feature_nodes)
+    for x, y, inode in zip(xs, ys, snapped):
+        if inode >= 0:
+            node_ids_for_way.append(intersection_nodes[inode].id)
         else:
             # make a new node
             _id = next(idgen)
             node_ids_for_way.append(_id)
             nodes.append(Node(id=_id, lat=y, lon=x, version=1, tags=[]))
 
+    snapped_ids = set(node_ids_for_way)
     add_nodes = [
-        n
-        for n in [
-            _n.object for _n in intersection_db.intersection(geom.bounds, objects=True)
-        ]
-        if sg.Point(n.lon, n.lat).intersects(geom) and n.id not in node_ids_for_way
+        n for n in _on_geometry(intersection_nodes, geom) if n.id not in snapped_ids
     ]
 
-    for n in add_nodes:
-        ls_points = [(_n.lon, _n.lat) for _n in nodes]
-        if len(ls_points) < 2:
-            logging.warning("Malformed linestring found.")
-            continue  # skip linestrings that are not linestrings
-        _tmp_ls = sg.LineString(ls_points)
-        idx = _get_point_insertion_index(_tmp_ls, sg.Point(n.lon, n.lat))
-        ip_x, ip_y = list(_tmp_ls.coords)[idx]
-        # there's a special case here where the intersection point already exists
-        # on geom (e.g. if two trails intersect exactly at the endpoint of geom)
-        #
-        # to maintain connectivity we need to replace that Node in Geom
-        # with n
-
-        if sg.Point(n.lon, n.lat).almost_equals(
-            sg.Point(ip_x, ip_y), COORDINATE_PRECISION
-        ):
-            try:
-                del nodes[idx]  # avoid duplicating existing Node n
-            except IndexError as e:
-                logging.warning(
-                    f"Out of bounds error in Node removal. Does the intersection db have duplicates? {len(add_nodes)} idx: {idx}, {len(nodes)}, {len(list(geom.coords))}"
-                )
-
-            node_ids_for_way[idx] = n.id
-
-        else:
-            # just add the node id to the Way, because it doesn't
-            # already exist in the linestring.
-            node_ids_for_way.insert(idx, n.id)
+    node_ids_for_way, replaced = _merge_intersection_nodes(
+        list(geom.coords), node_ids_for_way, add_nodes
+    )
+    if replaced:
+        # avoid duplicating Nodes that were replaced by an intersection Node
+        nodes = [n for n in nodes if n.id not in replaced]
 
     # If this is a long linestring we need to split it into many ways maybe
     ways = _make_ways(
@@ -493,6 +824,476 @@ def _generate_ways_and_nodes(
     return ways, nodes
 
 
+def _changes_for_feature(
+    wgs84_geom,
+    feat_tags,
+    ids,
+    intersection_nodes,
+    existing_id=None,
+    existing_nodes_for_ways=None,
+    max_nodes_per_way=2000,
+    modify_only=False,
+    feature_nodes=None,
+):
+    """
+    Produce the Nodes, Ways and Relations representing a single feature
+    with geometry <wgs84_geom> (reprojected to WGS84, see reproject) and
+    <feat_tags>, using generator <ids> to assign IDs. <intersection_nodes>
+    are the feature's intersection Nodes, from <feature_nodes>
+    (a FeatureNodes, if provided).
+
+    If modify_only is true, the feature's existing OSM element <existing_id>
+    is modified instead (Ways keep their existing Node IDs from
+    <existing_nodes_for_ways>).
+
+    returns lists of nodes, ways, and relations.
+    """
+    new_nodes = []
+    new_ways = []
+    new_relations = []
+
+    if isinstance(wgs84_geom, sg.MultiLineString) or isinstance(
+        wgs84_geom, sg.MultiPolygon
+    ):
+        raise NotImplementedError("Multi geometries not supported.")
+    if isinstance(wgs84_geom, sg.Point):
+        if modify_only:
+            new_nodes.append(
+                Node(
+                    id=existing_id,
+                    version=2,
+                    lat=wgs84_geom.y,
+                    lon=wgs84_geom.x,
+                    tags=[tag for tag in feat_tags if tag.key != "osm_id"],
+                )
+            )
+        else:
+            new_nodes.append(
+                Node(
+                    id=next(ids),
+                    version=1,
+                    lat=wgs84_geom.y,
+                    lon=wgs84_geom.x,
+                    tags=feat_tags,
+                )
+            )
+
+    elif isinstance(wgs84_geom, sg.LineString):
+        ## NOTE that modify_only does not support modifying geometries.
+        if modify_only:
+            new_ways.append(
+                Way(
+                    id=existing_id,
+                    version=2,
+                    nds=existing_nodes_for_ways[existing_id],
+                    tags=[tag for tag in feat_tags if tag.key != "osm_id"],
+                )
+            )
+        else:  # not modifying, just creating
+            ways, nodes = _generate_ways_and_nodes(
+                wgs84_geom,
+                ids,
+                feat_tags,
+                intersection_nodes,
+                max_nodes_per_way=max_nodes_per_way,
+                feature_nodes=feature_nodes,
+            )
+            new_nodes.extend(nodes)
+            new_ways.extend(ways)
+    elif isinstance(wgs84_geom, sg.Polygon):
+        ## If we're taking all features to be newly-created (~modify_only)
+        ## we need to create ways and nodes for that feature.
+        ## IF we're only modifying existing features with features
+        ## in the table, we just create a new Way with existing ID and nodes and new tags.
+
+        ## NOTE that modify_only does not support modifying geometries.
+        if modify_only:
+            new_ways.append(
+                Way(
+                    id=existing_id,
+                    version=2,
+                    nds=existing_nodes_for_ways[existing_id],
+                    tags=[tag for tag in feat_tags if tag.key != "osm_id"],
+                )
+            )
+        else:  # not modifying, just creating
+            # simple polygons can be treated like Ways.
+            if len(wgs84_geom.interiors) == 0:
+                ways, nodes = _generate_ways_and_nodes(
+                    wgs84_geom.exterior,
+                    ids,
+                    feat_tags,
+                    intersection_nodes,
+                    max_nodes_per_way=max_nodes_per_way,
+                    feature_nodes=feature_nodes,
+                    closed=True,
+                )
+                new_nodes.extend(nodes)
+                new_ways.extend(ways)
+                # !! In some cases when the outer ring of the Polygon
+                # is longer than max_nodes_per_way, we create a Relation
+                # to represent that way.
+                if len(ways) > 1:
+                    new_relations.append(
+                        _generate_relation_for_ways(
+                            ways,
+                            ids,
+                            ways[0].tags + [Tag("type", "multipolygon")],
+                        )
+                    )
+            else:  # more complex polygons (w/ holes) need to be Relations
+                outer_ways, outer_nodes = _generate_ways_and_nodes(
+                    # no tags on these ways, they belong on the relation
+                    wgs84_geom.exterior,
+                    ids,
+                    [],
+                    intersection_nodes,
+                    max_nodes_per_way=max_nodes_per_way,
+                    feature_nodes=feature_nodes,
+                    closed=True,
+                )
+                inner_ways, inner_nodes = [], []
+                for hole in wgs84_geom.interiors:
+                    _ways, _nodes = _generate_ways_and_nodes(
+                        # no tags on any of these Ways
+                        hole,
+                        ids,
+                        [],
+                        intersection_nodes,
+                        max_nodes_per_way=max_nodes_per_way,
+                        feature_nodes=feature_nodes,
+                        closed=True,
+                    )
+                    inner_ways.extend(_ways)
+                    inner_nodes.extend(_nodes)
+                # Build relation
+                members = [
+                    RelationMember(ref=w.id, type="way", role="outer")
+                    for w in outer_ways
+                ]
+                members.extend(
+                    [
+                        RelationMember(ref=w.id, type="way", role="inner")
+                        for w in inner_ways
+                    ]
+                )
+                # add 'multipolygon' tag (even though it's not.)
+                # https://wiki.openstreetmap.org/wiki/Relation:multipolygon#One_outer_and_one_inner_ring
+                feat_tags.append(Tag(key="type", value="multipolygon"))
+                relation = Relation(
+                    id=next(ids),
+                    version="1",
+                    members=members,
+                    tags=feat_tags,  # original polygon tags on relation
+                )
+                new_ways.extend(outer_ways + inner_ways)
+                new_nodes.extend(outer_nodes + inner_nodes)
+                new_relations.append(relation)
+
+    else:
+        raise RuntimeError(f"{type(wgs84_geom)} is not LineString or Polygon")
+
+    return new_nodes, new_ways, new_relations
+
+
+def _write_feature_changes(change_writer, nodes, ways, relations, modify_only=False):
+    """Write the Nodes, Ways and Relations for a single feature to change_writer."""
+    if len(ways) > 0 or len(nodes) > 0:
+        if modify_only:
+            change_writer.add_modify(ways)
+            change_writer.add_modify(nodes)
+        else:
+            change_writer.add_create(nodes + ways)
+    if len(relations) > 0:
+        change_writer.add_create(relations)
+
+
+def _changes_for_features(
+    feature_iter,
+    layer_fields,
+    transformer,
+    ids,
+    feature_nodes,
+    existing_nodes_for_ways,
+    hstore_column=None,
+    max_nodes_per_way=2000,
+    modify_only=False,
+):
+    """
+    Yields (nodes, ways, relations) for every feature in <feature_iter>
+    (see _changes_for_feature), reprojecting geometries with <transformer>
+    in batches. The intersection Nodes of each feature are looked up
+    in <feature_nodes> (a FeatureNodes) by FID. Features that can't be
+    processed are logged and yield no changes.
+    """
+    for feature, wgs84_geom in reprojected_features(feature_iter, transformer):
+        try:  # want to log but skip most feature-level exceptions
+            # skip null geometries
+            if wgs84_geom is None:
+                logging.debug(f"feature {feature.GetFID()} has no geometry")
+                yield [], [], []
+                continue
+
+            # compute intersections + extract tags
+            feat_tags = _generate_tags_from_feature(
+                feature, layer_fields, hstore_column=hstore_column
+            )
+            existing_id = None
+            if modify_only:
+                existing_id = feature.GetFieldAsString(feature.GetFieldIndex("osm_id"))
+
+            yield _changes_for_feature(
+                wgs84_geom,
+                feat_tags,
+                ids,
+                feature_nodes.for_feature(feature.GetFID()),
+                existing_id=existing_id,
+                existing_nodes_for_ways=existing_nodes_for_ways,
+                max_nodes_per_way=max_nodes_per_way,
+                modify_only=modify_only,
+                feature_nodes=feature_nodes,
+            )
+
+        except Exception as e:
+            logging.warning(
+                f"Exception encountered processing a feature. [exception={repr(e)} fid={feature.GetFID()}]"
+            )
+            yield [], [], []
+
+
+def _changes_for_batches(
+    batches,
+    arrow_columns,
+    layer_fields,
+    transformer,
+    ids,
+    feature_nodes,
+    existing_nodes_for_ways,
+    hstore_column=None,
+    max_nodes_per_way=2000,
+    modify_only=False,
+):
+    """
+    Yields (nodes, ways, relations) for every feature in <batches>
+    (pyarrow RecordBatches, see db.OGRDBReader.get_layer_batches),
+    like _changes_for_features. <arrow_columns> are the names of the
+    FID and geometry columns of the batches. Tags are derived, and
+    geometries parsed and reprojected with <transformer>, a whole
+    batch at a time.
+    """
+    fid_column, geometry_column = arrow_columns
+    for batch in batches:
+        columns = {
+            name: batch.column(i).to_pylist()
+            for i, name in enumerate(batch.schema.names)
+        }
+        fids = columns[fid_column]
+        wgs84_geoms = reprojected_features(
+            enumerate(columns[geometry_column]),
+            transformer,
+            batch_size=len(fids),
+            geometry=lambda row: (
+                wkb.loads(bytes(row[1])) if row[1] is not None else None
+            ),
+            fid=lambda row: fids[row[0]],
+        )
+        strings = {
+            f: [_field_string(v) for v in columns[f]]
+            for f in layer_fields
+            if f in columns
+        }
+        batch_tags = _generate_tags_from_batch(
+            strings, layer_fields, len(fids), hstore_column=hstore_column
+        )
+
+        for (i, _), wgs84_geom in wgs84_geoms:
+            fid, feat_tags = fids[i], batch_tags[i]
+            # skip null geometries
+            if wgs84_geom is None:
+                logging.debug(f"feature {fid} has no geometry")
+                yield [], [], []
+                continue
+
+            try:  # want to log but skip most feature-level exceptions
+                existing_id = strings["osm_id"][i] if modify_only else None
+                yield _changes_for_feature(
+                    wgs84_geom,
+                    feat_tags,
+                    ids,
+                    feature_nodes.for_feature(fid),
+                    existing_id=existing_id,
+                    existing_nodes_for_ways=existing_nodes_for_ways,
+                    max_nodes_per_way=max_nodes_per_way,
+                    modify_only=modify_only,
+                    feature_nodes=feature_nodes,
+                )
+
+            except Exception as e:
+                logging.warning(
+                    f"Exception encountered processing a feature. [exception={repr(e)} fid={fid}]"
+                )
+                yield [], [], []
+
+
+def _max_ids_for_geometry(geometry):
+    """
+    Returns an upper bound on the number of IDs _changes_for_feature
+    can assign for ogr.Geometry <geometry>: at most one Node and one
+    Way per vertex, plus one Relation.
+    """
+
+    def _n_points(g):
+        return g.GetPointCount() + sum(
+            _n_points(g.GetGeometryRef(i)) for i in range(g.GetGeometryCount())
+        )
+
+    return 2 * _n_points(geometry) + 1
+
+
+def _feature_chunks(
+    feature_iter, layer_fields, id_allocator, hstore_column=None, modify_only=False
+):
+    """
+    Yields (id_start, [(fid, wkb, tags, existing_id)]) chunks of
+    FEATURE_CHUNK_SIZE features from <feature_iter>, where each chunk
+    owns the block of IDs starting at id_start (see _max_ids_for_geometry).
+    Blocks are reserved from <id_allocator> in feature order, so IDs
+    don't depend on how chunks are scheduled.
+    """
+    chunk, chunk_ids = [], 0
+    for feature in feature_iter:
+        geometry = feature.GetGeometryRef()
+        if not geometry:
+            logging.debug(f"feature {feature.GetFID()} has no geometry")
+            continue
+        existing_id = None
+        if modify_only:
+            existing_id = feature.GetFieldAsString(feature.GetFieldIndex("osm_id"))
+        chunk.append(
+            (
+                feature.GetFID(),
+                bytes(geometry.ExportToWkb()),
+                _generate_tags_from_feature(
+                    feature, layer_fields, hstore_column=hstore_column
+                ),
+                existing_id,
+            )
+        )
+        chunk_ids += _max_ids_for_geometry(geometry)
+        if len(chunk) >= FEATURE_CHUNK_SIZE:
+            yield id_allocator.reserve(chunk_ids), chunk
+            chunk, chunk_ids = [], 0
+    if chunk:
+        yield id_allocator.reserve(chunk_ids), chunk
+
+
+_feature_worker = {}
+
+
+def _init_feature_worker(
+    layer_epsg,
+    feature_nodes,
+    existing_nodes_for_ways,
+    neg_id,
+    max_nodes_per_way,
+    modify_only,
+):
+    """Sets up the (read-only) state shared by all chunks in a worker process."""
+    _feature_worker.update(
+        transformer=_transformer(layer_epsg),
+        feature_nodes=feature_nodes,
+        existing_nodes_for_ways=existing_nodes_for_ways,
+        neg_id=neg_id,
+        max_nodes_per_way=max_nodes_per_way,
+        modify_only=modify_only,
+    )
+
+
+def _changes_for_feature_chunk(id_start, chunk):
+    """Returns [(nodes, ways, relations)] for every feature in <chunk>,
+    assigning IDs from id_start. Runs in a worker process."""
+    ids = _id_gen(id_start, _feature_worker["neg_id"])
+    changes = []
+    wgs84_geoms = reprojected_features(
+        chunk,
+        _feature_worker["transformer"],
+        geometry=lambda item: wkb.loads(item[1]),
+        fid=lambda item: item[0],
+    )
+    for (fid, _, feat_tags, existing_id), wgs84_geom in wgs84_geoms:
+        try:
+            changes.append(
+                _changes_for_feature(
+                    wgs84_geom,
+                    feat_tags,
+                    ids,
+                    _feature_worker["feature_nodes"].for_feature(fid),
+                    existing_id=existing_id,
+                    existing_nodes_for_ways=_feature_worker["existing_nodes_for_ways"],
+                    max_nodes_per_way=_feature_worker["max_nodes_per_way"],
+                    modify_only=_feature_worker["modify_only"],
+                    feature_nodes=_feature_worker["feature_nodes"],
+                )
+            )
+        except Exception as e:
+            logging.warning(
+                f"Exception encountered processing a feature. [exception={repr(e)} fid={fid}]"
+            )
+            changes.append(([], [], []))
+    return changes
+
+
+def _changes_for_features_parallel(
+    feature_iter,
+    layer_fields,
+    layer_epsg,
+    id_allocator,
+    feature_nodes,
+    existing_nodes_for_ways,
+    workers,
+    neg_id=False,
+    hstore_column=None,
+    max_nodes_per_way=2000,
+    modify_only=False,
+):
+    """
+    Yields (nodes, ways, relations) for every feature in <feature_iter>,
+    like _changes_for_features, processing chunks of features in a pool
+    of <workers> processes. Each worker holds its own copy of
+    <feature_nodes>. Each chunk assigns IDs from its own block,
+    reserved from <id_allocator> (see _feature_chunks), and results are
+    yielded in feature order, so the output is deterministic.
+    """
+    # build the index once, so workers receive it with <feature_nodes>
+    feature_nodes.index
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_feature_worker,
+        initargs=(
+            layer_epsg,
+            feature_nodes,
+            existing_nodes_for_ways,
+            neg_id,
+            max_nodes_per_way,
+            modify_only,
+        ),
+    ) as pool:
+        # bound the number of chunks in flight (and in memory)
+        pending = deque()
+        for id_start, chunk in _feature_chunks(
+            feature_iter,
+            layer_fields,
+            id_allocator,
+            hstore_column=hstore_column,
+            modify_only=modify_only,
+        ):
+            pending.append(pool.submit(_changes_for_feature_chunk, id_start, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
 def generate_changes(
     table,
     others,
@@ -511,6 +1312,17 @@ def generate_changes(
     max_nodes_per_way=2000,
     modify_only=False,
     hstore_column=None,
+    way_node_map=None,
+    intersections=None,
+    deletion_way_ids=None,
+    workers=1,
+    id_allocator=None,
+    bbox=None,
+    tile_size=None,
+    server_reproject=False,
+    db_reader=None,
+    arrow_batch_size=None,
+    boundary_nodes_file=None,
 ):
     """
     Generate an osm changefile (outfile) based on features in <table>
@@ -529,332 +1341,331 @@ def generate_changes(
     for the intersecting features in <other> that shares a junction node with
     the intersecting feature in `table`.
 
+    The intersections of `table` (with `others`, and with itself if
+    `self_intersections`) are read with a single query per layer
+    (see `_query_intersections`), which also gives the IDs of the
+    intersecting Ways to be modified.
+
+    `way_node_map`, `intersections` and `deletion_way_ids` can be
+    provided when they have already been resolved for this run (see
+    `changegen.__main__`), in which case neither <osmsrc> nor the database
+    are queried for them again. `intersections` must then be those of
+    `table` within `bbox` (they are not used with `tile_size`), and
+    `way_node_map` must contain the Ways for `table` (if `modify_only`),
+    for the intersecting Ways of `table` within `bbox` (see
+    `_intersecting_ids` and `db.OGRDBReader.intersecting_ids`) and for
+    `deletion_way_ids`.
+
+    If `workers` > 1, features in `table` are processed by a pool of
+    `workers` processes. Each chunk of features is assigned its own block
+    of IDs, so IDs are not contiguous (but are deterministic).
+
+    New IDs are reserved in blocks from `id_allocator` (an IdAllocator)
+    if provided, e.g. to share one ID space between tables. Otherwise IDs
+    start at `id_offset`.
+
+    If `bbox` ([minx, miny, maxx, maxy] in the CRS of `table`) is provided,
+    only the features owned by `bbox` (see `db.bbox_filter`) are processed:
+    features of `table`, features of `others` that are modified, and
+    intersections involving either. Change files for a grid of bboxes can
+    be combined with `changegen.shards.merge_changes`.
+
+    If `tile_size` (in units of the CRS of `table`) is provided, features
+    and intersections are processed one tile of a grid over `table` at a
+    time (see `changegen.tiles`), so that memory use depends on the
+    density of tiles rather than the size of `table`. Intersections are
+    queried for each tile's bbox, and those on tile edges are shared
+    between tiles.
+
+    If `server_reproject`, geometries are reprojected to WGS84 by PostGIS
+    (ST_Transform) as they are read, instead of in Python (see
+    `changegen.reproject`). `bbox` and `tile_size` are still in the CRS
+    of `table`.
+
+    `db_reader` (an OGRDBReader, e.g. of a `changegen.session.Session`)
+    can be provided to reuse its connection and layer metadata, in which
+    case the connection parameters and `server_reproject` are ignored
+    (geometries are reprojected as `db_reader` is set up to).
+
+    If `arrow_batch_size` is provided (and `workers` is 1), features in
+    `table` are read in Arrow batches of that many features through
+    GDAL's Arrow stream interface (GDAL >= 3.6, requires pyarrow), see
+    `db.OGRDBReader.get_layer_batches`, and are processed a batch at a
+    time. Their geometries are always reprojected in Python.
+
+    If `boundary_nodes_file` is provided (with `bbox`), the IDs of the
+    intersection Nodes involving a feature not owned by `bbox` (which
+    the change file of the bbox owning that feature also creates) are
+    written to it, one per line (see `changegen.shards.merge_changes`).
+
 
     :param table: Database table name from which new features will be derived.
     :type table: str
 
     """
 
-    _global_node_id_all_ways = []
-    ids = _id_gen(id_offset, neg_id)
+    id_allocator = id_allocator or IdAllocator(id_offset)
+    ids = _allocated_id_gen(id_allocator, neg_id)
+    # Node usage counts are only logged when debugging.
+    node_counts = Counter() if logging.getLogger().isEnabledFor(logging.DEBUG) else None
 
     # <others> needs to be a list.
     others = [others] if isinstance(others, str) else others
 
-    db_reader = OGRDBReader(dbname, dbport, dbuser, dbpass, dbhost)
+    if db_reader is None:
+        db_reader = OGRDBReader(
+            dbname,
+            dbport,
+            dbuser,
+            dbpass,
+            dbhost,
+            transform_srid=4326 if server_reproject else None,
+        )
     change_writer = OSMChangeWriter(outfile, compress=compress)
 
-    new_feature_iter = db_reader.get_layer_iter(table)
     layer_fields = db_reader.get_layer_fields(table)
-    n_features = db_reader.get_num_features(table)
-
-    # generate intersection nodes
-    (
-        intersection_nodes,
-        intersection_db,
-        intersecting_idlists,
-    ) = _generate_intersection_db(
-        table, others, db_reader, ids, self=self_intersections
-    )
 
     # We need to reproject layer features from native CRS
-    # to OSM-compatible WGS84. <projection> can be used
-    # with shapely.ops.transform.
-    layer_epsg = db_reader.get_layer_epsg(table)
-    projection = pyproj.Transformer.from_crs(
-        pyproj.CRS(f"EPSG:{layer_epsg}"), WGS84, always_xy=True
-    ).transform
+    # to OSM-compatible WGS84 (see reproject), unless PostGIS
+    # already does.
+    layer_epsg = db_reader.get_geometry_epsg(table)
+    transformer = _transformer(layer_epsg)
     ## If we're creating "modify" nodes instead of create nodes,
     ## we need to go get the IDs of the nodes that make up
     ## any Ways that will be modified. Currently this only
     ## supports linestrings.
 
     existing_nodes_for_ways = []
-    if modify_only:
+    if modify_only and way_node_map is not None:
+        existing_nodes_for_ways = way_node_map
+    elif modify_only:
         existing_nodes_for_ways = _get_way_node_map(
-            osmsrc, db_reader.get_all_ids_for_layer(table)
+            osmsrc, db_reader.get_all_ids_for_layer(table, bbox=bbox)
         )
 
-    # Main work loop; features in <table> are work unit.
-    for feature in tqdm(
-        new_feature_iter,
-        desc="Processing New Features: ",
-        total=n_features,
-        unit="feature",
-    ):
-        try:  # want to log but skip most feature-level exceptions
-            # skip null geometries
-            if not feature.GetGeometryRef():
-                logging.debug(f"feature {feature.GetFID()} has no geometry")
-                continue
+    # Get existing Node IDs for all modified ways from intersecting
+    # layers and for all deletion ways, to save time.
+    # Without tiles, the intersections are read once here (and give the
+    # intersecting ids); tiled runs read them per tile, so only the
+    # intersecting ids are read up front.
+    if tile_size is None and intersections is None:
+        intersections = _query_intersections(
+            table, others, db_reader, self=self_intersections, bbox=bbox
+        )
+    if deletion_way_ids is None:
+        logging.info(f"Retrieving deletion nodes for tables: {deletions}")
+        deletion_way_ids = [
+            _get_deleted_way_ids(table, db_reader) for table in deletions
+        ]
+    if way_node_map is None:
+        logging.info(
+            f"Retrieving existing Node IDs for modified and deleted ways (file: {osmsrc})"
+        )
+        if tile_size is None:
+            intersecting_ids = [
+                _intersecting_ids(isects) for isects in intersections[: len(others)]
+            ]
+        else:
+            intersecting_ids = [
+                db_reader.intersecting_ids(table, other, bbox=bbox) for other in others
+            ]
+        way_node_map = _get_way_node_map(
+            osmsrc, list(chain.from_iterable(intersecting_ids + deletion_way_ids))
+        )
 
-            # compute intersections + extract geometry + tags + reproject
-            feat_geom = wkt.loads(feature.GetGeometryRef().ExportToWkt())
-            feat_tags = _generate_tags_from_feature(
-                feature, layer_fields, hstore_column=hstore_column
+    # Features are processed one tile at a time (or all at once
+    # without tile_size); see changegen.tiles.
+    if tile_size is not None:
+        grid = TileGrid(db_reader.get_layer_extent(table), tile_size)
+        tiles = [
+            (tile, clip_bbox(cell, bbox))
+            for tile, cell in enumerate(grid.cells)
+            if clip_bbox(cell, bbox) is not None
+        ]
+        shared_nodes = SharedNodes(grid, [tile for tile, _ in tiles])
+        logging.info(f"Processing {table} in {len(tiles)} tiles.")
+    else:
+        tiles = [(0, bbox)]
+        shared_nodes = None
+    boundary_nodes = set() if boundary_nodes_file and bbox is not None else None
+
+    for tile, tile_bbox in tiles:
+        if shared_nodes is not None:
+            shared_nodes.start_tile(tile)
+            logging.debug(f"Processing tile {tile}: {tile_bbox}")
+
+        # generate intersection nodes
+        # (from the intersections involving features of the tile)
+        if tile_size is not None:
+            tile_intersections = _query_intersections(
+                table, others, db_reader, self=self_intersections, bbox=tile_bbox
+            )
+        else:
+            tile_intersections = intersections
+        (
+            intersection_nodes,
+            feature_nodes,
+            tile_idlists,
+        ) = _generate_intersection_db(
+            table,
+            others,
+            db_reader,
+            ids,
+            self=self_intersections,
+            shared_nodes=shared_nodes,
+            intersections=tile_intersections,
+        )
+        if boundary_nodes is not None:
+            boundary_nodes.update(
+                _boundary_node_ids(tile_intersections, len(others), feature_nodes, bbox)
+            )
+        # each tile's intersections are dropped once its nodes are made
+        intersections = tile_intersections = None
+
+        # Main work loop; features in <table> are work unit.
+        n_features = db_reader.get_num_features(table, bbox=tile_bbox)
+        if arrow_batch_size is not None and workers == 1:
+            changes = _changes_for_batches(
+                db_reader.get_layer_batches(
+                    table, bbox=tile_bbox, batch_size=arrow_batch_size
+                ),
+                db_reader.get_arrow_columns(table),
+                layer_fields,
+                # Arrow batches are read in the CRS of the layer
+                _transformer(db_reader.get_layer_epsg(table)),
+                ids,
+                feature_nodes,
+                existing_nodes_for_ways,
+                hstore_column=hstore_column,
+                max_nodes_per_way=max_nodes_per_way,
+                modify_only=modify_only,
+            )
+        elif workers > 1:
+            new_feature_iter = db_reader.get_layer_iter(table, bbox=tile_bbox)
+            changes = _changes_for_features_parallel(
+                new_feature_iter,
+                layer_fields,
+                layer_epsg,
+                id_allocator,
+                feature_nodes,
+                existing_nodes_for_ways,
+                workers,
+                neg_id=neg_id,
+                hstore_column=hstore_column,
+                max_nodes_per_way=max_nodes_per_way,
+                modify_only=modify_only,
+            )
+        else:
+            changes = _changes_for_features(
+                db_reader.get_layer_iter(table, bbox=tile_bbox),
+                layer_fields,
+                transformer,
+                ids,
+                feature_nodes,
+                existing_nodes_for_ways,
+                hstore_column=hstore_column,
+                max_nodes_per_way=max_nodes_per_way,
+                modify_only=modify_only,
             )
 
-            wgs84_geom = transform(projection, feat_geom)
-
-            new_nodes = []
-            new_ways = []
-            new_relations = []
-
-            if isinstance(wgs84_geom, sg.MultiLineString) or isinstance(
-                wgs84_geom, sg.MultiPolygon
-            ):
-                raise NotImplementedError("Multi geometries not supported.")
-            if isinstance(wgs84_geom, sg.Point):
-                if modify_only:
-                    existing_id = feature.GetFieldAsString(
-                        feature.GetFieldIndex("osm_id")
-                    )
-
-                    new_nodes.append(
-                        Node(
-                            id=existing_id,
-                            version=2,
-                            lat=wgs84_geom.y,
-                            lon=wgs84_geom.x,
-                            tags=[tag for tag in feat_tags if tag.key != "osm_id"],
-                        )
-                    )
-                else:
-                    new_nodes.append(
-                        Node(
-                            id=next(ids),
-                            version=1,
-                            lat=wgs84_geom.y,
-                            lon=wgs84_geom.x,
-                            tags=feat_tags,
-                        )
-                    )
-
-            elif isinstance(wgs84_geom, sg.LineString):
-                ## NOTE that modify_only does not support modifying geometries.
-                if modify_only:
-                    existing_id = feature.GetFieldAsString(
-                        feature.GetFieldIndex("osm_id")
-                    )
-
-                    new_ways.append(
-                        Way(
-                            id=existing_id,
-                            version=2,
-                            nds=existing_nodes_for_ways[existing_id],
-                            tags=[tag for tag in feat_tags if tag.key != "osm_id"],
-                        )
-                    )
-                else:  # not modifying, just creating
-                    ways, nodes = _generate_ways_and_nodes(
-                        wgs84_geom,
-                        ids,
-                        feat_tags,
-                        intersection_db,
-                        max_nodes_per_way=max_nodes_per_way,
-                    )
-                    new_nodes.extend(nodes)
-                    new_ways.extend(ways)
-                    _global_node_id_all_ways.extend(
-                        chain.from_iterable([w.nds for w in ways])
-                    )
-            elif isinstance(wgs84_geom, sg.Polygon):
-                ## If we're taking all features to be newly-created (~modify_only)
-                ## we need to create ways and nodes for that feature.
-                ## IF we're only modifying existing features with features
-                ## in the table, we just create a new Way with existing ID and nodes and new tags.
-
-                ## NOTE that modify_only does not support modifying geometries.
-                if modify_only:
-                    existing_id = feature.GetFieldAsString(
-                        feature.GetFieldIndex("osm_id")
-                    )
-
-                    new_ways.append(
-                        Way(
-                            id=existing_id,
-                            version=2,
-                            nds=existing_nodes_for_ways[existing_id],
-                            tags=[tag for tag in feat_tags if tag.key != "osm_id"],
-                        )
-                    )
-                else:  # not modifying, just creating
-                    # simple polygons can be treated like Ways.
-                    if len(wgs84_geom.interiors) == 0:
-                        ways, nodes = _generate_ways_and_nodes(
-                            wgs84_geom.exterior,
-                            ids,
-                            feat_tags,
-                            intersection_db,
-                            max_nodes_per_way=max_nodes_per_way,
-                            closed=True,
-                        )
-                        new_nodes.extend(nodes)
-                        new_ways.extend(ways)
-                        _global_node_id_all_ways.extend(
-                            chain.from_iterable([w.nds for w in ways])
-                        )
-                        # !! In some cases when the outer ring of the Polygon
-                        # is longer than max_nodes_per_way, we create a Relation
-                        # to represent that way.
-                        if len(ways) > 1:
-                            new_relations.append(
-                                _generate_relation_for_ways(
-                                    ways,
-                                    ids,
-                                    ways[0].tags + [Tag("type", "multipolygon")],
-                                )
-                            )
-                    else:  # more complex polygons (w/ holes) need to be Relations
-                        outer_ways, outer_nodes = _generate_ways_and_nodes(
-                            # no tags on these ways, they belong on the relation
-                            wgs84_geom.exterior,
-                            ids,
-                            [],
-                            intersection_db,
-                            max_nodes_per_way=max_nodes_per_way,
-                            closed=True,
-                        )
-                        inner_ways, inner_nodes = [], []
-                        for hole in wgs84_geom.interiors:
-                            _ways, _nodes = _generate_ways_and_nodes(
-                                # no tags on any of these Ways
-                                hole,
-                                ids,
-                                [],
-                                intersection_db,
-                                max_nodes_per_way=max_nodes_per_way,
-                                closed=True,
-                            )
-                            inner_ways.extend(_ways)
-                            inner_nodes.extend(_nodes)
-                        # Build relation
-                        members = [
-                            RelationMember(ref=w.id, type="way", role="outer")
-                            for w in outer_ways
-                        ]
-                        members.extend(
-                            [
-                                RelationMember(ref=w.id, type="way", role="inner")
-                                for w in inner_ways
-                            ]
-                        )
-                        # add 'multipolygon' tag (even though it's not.)
-                        # https://wiki.openstreetmap.org/wiki/Relation:multipolygon#One_outer_and_one_inner_ring
-                        feat_tags.append(Tag(key="type", value="multipolygon"))
-                        relation = Relation(
-                            id=next(ids),
-                            version="1",
-                            members=members,
-                            tags=feat_tags,  # original polygon tags on relation
-                        )
-                        new_ways.extend(outer_ways + inner_ways)
-                        new_nodes.extend(outer_nodes + inner_nodes)
-                        new_relations.append(relation)
-
-            else:
-                raise RuntimeError(f"{type(wgs84_geom)} is not LineString or Polygon")
-
+        for new_nodes, new_ways, new_relations in tqdm(
+            changes,
+            desc="Processing New Features: ",
+            total=n_features,
+            unit="feature",
+        ):
             ## Write new ways and nodes to file
-            if len(new_ways) > 0 or len(new_nodes) > 0:
-                if modify_only:
-                    change_writer.add_modify(new_ways)
-                    change_writer.add_modify(new_nodes)
-                else:
-                    change_writer.add_create(new_nodes + new_ways)
-            if len(new_relations) > 0:
-                change_writer.add_create(new_relations)
-
-        except Exception as e:
-            logging.warning(
-                f"Exception encountered processing a feature. [exception={repr(e)} fid={feature.GetFID()}]"
+            _write_feature_changes(
+                change_writer, new_nodes, new_ways, new_relations, modify_only
             )
-            continue
-
-    # Write all modified ways with intersections
-    # Because we have to re-generate nodes for all points
-    # within the intersecting linestrings, we write
-    # those as new nodes. We also get deletion ways +
-    # their corresponding nodes here too, to save time.
-    logging.info(f"Retrieving deletion nodes for tables: {deletions}")
-    deletion_way_ids = [_get_deleted_way_ids(table, db_reader) for table in deletions]
-    logging.info(
-        f"Retrieving existing Node IDs for modified and deleted ways (file: {osmsrc})"
-    )
+            if node_counts is not None and not modify_only:
+                node_counts.update(chain.from_iterable([w.nds for w in new_ways]))
+
+        # Write all modified ways with intersections
+        # Because we have to re-generate nodes for all points
+        # within the intersecting linestrings, we write
+        # those as new nodes.
+        modified_ways = []
+
+        # only if there are intersections
+        if len(intersection_nodes) > 0:
+            # for all intersecting layers
+            for i, other_layer in enumerate(others):
+                # get fields + transformer
+                other_layer_fields = db_reader.get_layer_fields(other_layer)
+                other_transformer = _transformer(
+                    db_reader.get_geometry_epsg(other_layer)
+                )
 
-    modified_ways = []
-    way_node_map = _get_way_node_map(
-        osmsrc, list(chain.from_iterable(intersecting_idlists + deletion_way_ids))
-    )
+                # get list of intersecting IDS (already computed)
+                intersecting_ids = tile_idlists[i]
 
-    # only if there are intersections
-    if len(intersection_nodes) > 0:
-        # for all intersecting layers
-        for i, other_layer in enumerate(others):
-            # get fields, feature, + projection
-            other_layer_fields = db_reader.get_layer_fields(other_layer)
-            other_layer_epsg = db_reader.get_layer_epsg(other_layer)
-            projection = pyproj.Transformer.from_crs(
-                pyproj.CRS(f"EPSG:{other_layer_epsg}"), WGS84, always_xy=True
-            ).transform
-
-            # get list of intersecting IDS (already computed)
-            intersecting_ids = intersecting_idlists[i]
-
-            # modify all features with known intersections
-            # generate original OSM node ID database from source file
-            for id in tqdm(
-                intersecting_ids, desc=f"Processing {other_layer} intersections"
-            ):
-
-                # generate modified way and correspdoning nodes
-                _feat = db_reader.get_feature_by_id(other_layer, id, "osm_id")
-                _feat_tags = _generate_tags_from_feature(
-                    _feat, other_layer_fields, hstore_column=hstore_column
+                # modify all features with known intersections
+                # (fetched in batches, see db.get_features_by_ids)
+                other_features = reprojected_features(
+                    db_reader.get_features_by_ids(
+                        other_layer, intersecting_ids, "osm_id"
+                    ),
+                    other_transformer,
                 )
-                other_feat_geom = wkt.loads(_feat.GetGeometryRef().ExportToWkt())
-                other_feat_wgs84 = transform(projection, other_feat_geom)
-
-                try:
-                    existing_node_ids = way_node_map[id]
-                except KeyError as e:
-                    logging.error(f"Way with ID {id} not found. Is it a relation?")
-                    continue
-
-                # mod_ways, mod_nodes = _generate_ways_and_nodes(
-                #     other_feat_wgs84, ids, _feat_tags, intersection_db
-                # )
-                if isinstance(other_feat_wgs84, sg.LineString):
-                    # Linestrings we can directly modify
-                    mod_way = _modify_existing_way(
-                        other_feat_wgs84,
-                        id,
-                        existing_node_ids,
-                        _feat_tags,
-                        intersection_db,
+                for _feat, other_feat_wgs84 in tqdm(
+                    other_features,
+                    total=len(intersecting_ids),
+                    desc=f"Processing {other_layer} intersections",
+                ):
+                    id = _feat.GetFieldAsString(_feat.GetFieldIndex("osm_id"))
+
+                    # generate modified way and correspdoning nodes
+                    _feat_tags = _generate_tags_from_feature(
+                        _feat, other_layer_fields, hstore_column=hstore_column
                     )
-                if isinstance(other_feat_wgs84, sg.Polygon):
-                    # Polygons we need to modify the outermost ring of a polygon relation.
-                    # However, we need to be sure that the ID that's being referenced here is that of a
-                    # Way and not a Relation. This is complicated and likely not worth implementing
-                    # right now.
-                    logging.warning(
-                        (
-                            "Polygon Intersection Warning: a feature intersects "
-                            "With a polygon. Modifying this polygon to add an intersection "
-                            "node is not currently supported."
+
+                    try:
+                        existing_node_ids = way_node_map[id]
+                    except KeyError as e:
+                        logging.error(f"Way with ID {id} not found. Is it a relation?")
+                        continue
+
+                    # mod_ways, mod_nodes = _generate_ways_and_nodes(
+                    #     other_feat_wgs84, ids, _feat_tags, intersection_db
+                    # )
+                    if isinstance(other_feat_wgs84, sg.LineString):
+                        # Linestrings we can directly modify
+                        mod_way = _modify_existing_way(
+                            other_feat_wgs84,
+                            id,
+                            existing_node_ids,
+                            _feat_tags,
+                            feature_nodes.for_way(id),
+                        )
+                    if isinstance(other_feat_wgs84, sg.Polygon):
+                        # Polygons we need to modify the outermost ring of a polygon relation.
+                        # However, we need to be sure that the ID that's being referenced here is that of a
+                        # Way and not a Relation. This is complicated and likely not worth implementing
+                        # right now.
+                        logging.warning(
+                            (
+                                "Polygon Intersection Warning: a feature intersects "
+                                "With a polygon. Modifying this polygon to add an intersection "
+                                "node is not currently supported."
+                            )
                         )
-                    )
 
-                modified_ways.append(mod_way)
-                _global_node_id_all_ways.extend(mod_way.nds)
+                    modified_ways.append(mod_way)
+                    if node_counts is not None:
+                        node_counts.update(mod_way.nds)
 
-    if len(modified_ways) > 0:
-        # write any modified ways from intersecting layers
-        change_writer.add_modify(modified_ways)
+        if len(modified_ways) > 0:
+            # write any modified ways from intersecting layers
+            change_writer.add_modify(modified_ways)
 
-    # Write all intersecting nodes to file:
-    change_writer.add_create(intersection_nodes)
+        # Write all intersecting nodes to file
+        # (in a tiled run, only those not written by a previous tile):
+        if shared_nodes is not None:
+            change_writer.add_create(shared_nodes.created)
+            shared_nodes.finish_tile()
+        else:
+            change_writer.add_create(intersection_nodes)
 
     # Write deletions, including ways + nodes
     ids_to_delete = []
@@ -867,8 +1678,12 @@ def generate_changes(
 
     change_writer.close()
 
-    _node_counts = Counter(_global_node_id_all_ways)
-    logging.debug(f"Most common nodes (N=20): {_node_counts.most_common(20)}")
+    if boundary_nodes_file:
+        with open(boundary_nodes_file, "w") as f:
+            f.writelines(f"{node_id}\n" for node_id in sorted(boundary_nodes or []))
+
+    if node_counts is not None:
+        logging.debug(f"Most common nodes (N=20): {node_counts.most_common(20)}")
 
     return True
 
@@ -885,23 +1700,33 @@ def generate_deletions(
     outfile,
     compress=True,
     skip_nodes=True,
+    way_node_map=None,
+    deletion_way_ids=None,
+    db_reader=None,
 ):
     """
     Produce a changefile with <delete> nodes for all IDs in table.
     IDs are chosen via idfield.
 
+    `way_node_map` and `deletion_way_ids` can be provided when they have
+    already been resolved for this run, in which case neither <osmsrc>
+    nor the database are queried for them again. `db_reader` (an
+    OGRDBReader) can be provided to reuse its connection.
+
     TODO: provide an option to not delete Nodes (which could break intersections.)
 
     """
-    db_reader = OGRDBReader(dbname, dbport, dbuser, dbpass, dbhost)
+    if db_reader is None:
+        db_reader = OGRDBReader(dbname, dbport, dbuser, dbpass, dbhost)
     change_writer = OSMChangeWriter(outfile, compress=compress)
 
-    logging.info(f"Retrieving deletion nodes for table: {table}")
-    deletion_way_ids = set(_get_deleted_way_ids(table, db_reader, idfield))
-    logging.info(f"Retrieving existing Node IDs for deleted ways (file: {osmsrc})")
+    if deletion_way_ids is None:
+        logging.info(f"Retrieving deletion nodes for table: {table}")
+        deletion_way_ids = _get_deleted_way_ids(table, db_reader, idfield)
+    deletion_way_ids = set(deletion_way_ids)
 
-    way_node_map = []
-    if not skip_nodes:
+    if not skip_nodes and way_node_map is None:
+        logging.info(f"Retrieving existing Node IDs for deleted ways (file: {osmsrc})")
         way_node_map = _get_way_node_map(osmsrc, deletion_way_ids)
 
     # Write deletions, including ways + nodes
@@ -0,0 +1,137 @@
+import math
+
+import numpy as np
+
+"""
+nodeindex.py
+
+Static spatial index of intersection Nodes.
+
+The index is bulk-loaded once from coordinate arrays (Sort-Tile-Recursive
+packing) and queries return integer positions into its node array, so
+(unlike rtree with obj=) Nodes are never pickled on insert or unpickled
+on query.
+
+Classes:
+    NodeIndex: STR-packed point index returning positions into a node array.
+
+"""
+
+
+def _ranges(starts, ends):
+    """Returns the concatenation of np.arange(s, e) for s, e in zip(starts, ends)."""
+    counts = np.maximum(ends - starts, 0)
+    total = counts.sum()
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return np.arange(total, dtype=np.int64) + offsets
+
+
+class NodeIndex(object):
+    """
+    Spatial index of points, bulk-loaded once with Sort-Tile-Recursive
+    packing: points are sorted by x into vertical slices of
+    <capacity> * sqrt(len / <capacity>) points, and by y within each
+    slice. A query binary searches the slices overlapping its x range,
+    then the y range within each of those slices.
+
+    Queries return int64 positions into the input arrays
+    (and into <nodes>, if provided).
+    """
+
+    def __init__(self, lons, lats, nodes=None, capacity=16):
+        super(NodeIndex, self).__init__()
+        self.nodes = nodes if nodes is not None else []
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        n = len(lons)
+
+        n_leaves = math.ceil(n / capacity)
+        slice_size = max(capacity * math.ceil(math.sqrt(n_leaves)), 1)
+        by_x = np.argsort(lons, kind="stable")
+        slice_ids = np.arange(n) // slice_size
+        # sort by (slice, y), keeping x order as the tie breaker
+        self.order = by_x[np.lexsort((lats[by_x], slice_ids))]
+        self.x = lons[self.order]
+        self.y = lats[self.order]
+
+        self.slice_starts = np.arange(0, n, slice_size, dtype=np.int64)
+        self.slice_ends = np.minimum(self.slice_starts + slice_size, n)
+        if n > 0:
+            # slices partition the x order, so both are non-decreasing
+            self.slice_minx = np.minimum.reduceat(self.x, self.slice_starts)
+            self.slice_maxx = np.maximum.reduceat(self.x, self.slice_starts)
+            self.ymin, self.yrange = self.y.min(), np.ptp(self.y)
+        else:
+            self.slice_minx = self.slice_maxx = np.zeros(0)
+            self.ymin, self.yrange = 0.0, 0.0
+        # (slice, y) as a single sorted key, so the y ranges of many
+        # (point, slice) pairs can be binary searched at once
+        self.slice_span = self.yrange + 2
+        self.slice_y = (slice_ids * self.slice_span) + (self.y - self.ymin)
+
+    @classmethod
+    def from_nodes(cls, nodes, **kwargs):
+        """Builds a NodeIndex of <nodes> (objects with lon and lat)."""
+        nodes = list(nodes)
+        return cls(
+            [n.lon for n in nodes], [n.lat for n in nodes], nodes=nodes, **kwargs
+        )
+
+    def nearest_within(self, xs, ys, tolerance, among=None):
+        """For each point (xs[i], ys[i]), returns the position of the
+        nearest indexed point closer than <tolerance> to it, or -1.
+
+        If <among> (an array of positions) is provided, only
+        those indexed points are considered.
+
+        All points are queried at once. Returns an int64 array.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        nearest = np.full(len(xs), -1, dtype=np.int64)
+        if len(self) == 0 or len(xs) == 0:
+            return nearest
+
+        # (point, slice) pairs for every slice overlapping each point
+        first = np.searchsorted(self.slice_maxx, xs - tolerance, side="left")
+        last = np.searchsorted(self.slice_minx, xs + tolerance, side="right")
+        pair_pts = np.repeat(np.arange(len(xs)), np.maximum(last - first, 0))
+        base = _ranges(first, last) * self.slice_span
+        pair_ys = ys[pair_pts] - self.ymin
+        lo = np.searchsorted(
+            self.slice_y,
+            base + np.clip(pair_ys - tolerance, -0.5, self.yrange + 0.5),
+            side="left",
+        )
+        hi = np.searchsorted(
+            self.slice_y,
+            base + np.clip(pair_ys + tolerance, -0.5, self.yrange + 0.5),
+            side="right",
+        )
+
+        # candidates within the tolerance box of each point
+        candidates = _ranges(lo, hi)
+        cand_pts = np.repeat(pair_pts, np.maximum(hi - lo, 0))
+        d = np.hypot(
+            self.x[candidates] - xs[cand_pts], self.y[candidates] - ys[cand_pts]
+        )
+        within = d < tolerance
+        if among is not None:
+            within &= np.isin(self.order[candidates], among)
+        candidates, cand_pts, d = candidates[within], cand_pts[within], d[within]
+        if len(candidates) == 0:
+            return nearest
+
+        # nearest candidate of each point (lowest position on ties)
+        positions = self.order[candidates]
+        best = np.lexsort((positions, d, cand_pts))
+        cand_pts, positions = cand_pts[best], positions[best]
+        firsts = np.ones(len(cand_pts), dtype=bool)
+        firsts[1:] = cand_pts[1:] != cand_pts[:-1]
+        nearest[cand_pts[firsts]] = positions[firsts]
+        return nearest
+
+    def __len__(self):
+        return len(self.order)
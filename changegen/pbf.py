@@ -0,0 +1,150 @@
+import logging
+import math
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import osmium
+
+from .waynodes import WayNodeMap
+
+"""
+pbf.py
+
+Block-level access to OSM PBF files
+(https://wiki.openstreetmap.org/wiki/PBF_Format).
+
+A PBF file is a sequence of independently compressed blocks:
+one OSMHeader block followed by OSMData blocks. Any OSMHeader block
+followed by any subset of the OSMData blocks is itself a valid PBF,
+which lets block ranges be decoded in separate processes.
+
+Functions:
+    get_blocks: list the blocks of a PBF file.
+    get_way_node_map: parallel Way -> Node lookup over block ranges.
+
+"""
+
+BLOB_HEADER_SIZE = struct.Struct(">I")  # 4-byte big-endian BlobHeader length
+# Number of block ranges per worker, so slow ranges
+# (e.g. way-dense blocks) don't hold up the whole pool.
+RANGES_PER_WORKER = 4
+# Each worker holds its block range in memory, so ranges are capped in size.
+MAX_RANGE_BYTES = 256 * 1024 * 1024
+
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _parse_blob_header(buf):
+    """Returns (type, datasize) from a serialized BlobHeader message."""
+    blob_type, datasize = None, None
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            value, pos = buf[pos : pos + length], pos + length
+        else:
+            raise ValueError(f"Unexpected wire type {wire_type} in BlobHeader.")
+        if field == 1:
+            blob_type = value.decode("utf-8")
+        elif field == 3:
+            datasize = value
+    return blob_type, datasize
+
+
+def get_blocks(osm):
+    """
+    Returns a list of (type, offset, length) for every block in the
+    PBF file <osm>, where type is "OSMHeader" or "OSMData" and
+    offset/length delimit the complete block (header + blob) in the file.
+    """
+    blocks = []
+    with open(osm, "rb") as f:
+        offset = 0
+        while True:
+            size_bytes = f.read(BLOB_HEADER_SIZE.size)
+            if not size_bytes:
+                break
+            (header_size,) = BLOB_HEADER_SIZE.unpack(size_bytes)
+            blob_type, datasize = _parse_blob_header(f.read(header_size))
+            length = BLOB_HEADER_SIZE.size + header_size + datasize
+            blocks.append((blob_type, offset, length))
+            f.seek(datasize, 1)
+            offset += length
+    return blocks
+
+
+_worker_ids = None
+
+
+def _init_worker(ids):
+    global _worker_ids
+    _worker_ids = ids
+
+
+def _way_node_map_for_blocks(osm, header_block, data_blocks):
+    """Returns the Way -> Node map for the wanted ids found in
+    <data_blocks> of <osm>. Runs in a worker process."""
+    with open(osm, "rb") as f:
+        chunks = []
+        for _, offset, length in [header_block] + data_blocks:
+            f.seek(offset)
+            chunks.append(f.read(length))
+
+    ways = osmium.FileProcessor(
+        osmium.io.FileBuffer(b"".join(chunks), "pbf"), osmium.osm.WAY
+    ).with_filter(osmium.filter.IdFilter(_worker_ids))
+    return WayNodeMap.from_ways((w.id, (n.ref for n in w.nodes)) for w in ways)
+
+
+def get_way_node_map(osm, ids, workers):
+    """
+    Returns a WayNodeMap of osm_id : [node_ids] for all Ways
+    with (integer) ids in <ids> from the PBF file <osm>,
+    decoding ranges of blocks in <workers> processes.
+    """
+    blocks = get_blocks(osm)
+    header_block = blocks[0]
+    if header_block[0] != "OSMHeader":
+        raise ValueError(f"{osm} does not start with an OSMHeader block.")
+    data_blocks = [b for b in blocks if b[0] == "OSMData"]
+
+    n_ranges = max(
+        workers * RANGES_PER_WORKER,
+        math.ceil(sum(b[2] for b in data_blocks) / MAX_RANGE_BYTES),
+    )
+    n_ranges = max(1, min(len(data_blocks), n_ranges))
+    ranges = [
+        data_blocks[
+            i * len(data_blocks) // n_ranges : (i + 1) * len(data_blocks) // n_ranges
+        ]
+        for i in range(n_ranges)
+    ]
+    logging.debug(
+        f"Reading {len(data_blocks)} blocks in {n_ranges} ranges ({workers} workers)."
+    )
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(ids,)
+    ) as pool:
+        return WayNodeMap.merge(
+            pool.map(
+                _way_node_map_for_blocks,
+                [osm] * n_ranges,
+                [header_block] * n_ranges,
+                ranges,
+            )
+        )
@@ -0,0 +1,140 @@
+import logging
+from itertools import count
+
+import psycopg2
+from osgeo import ogr
+
+from .db import OGRDBReader
+
+"""
+pgcursor.py
+
+Streaming of features through a psycopg2 server-side (named) cursor.
+
+OGR's PostgreSQL driver reads features in small pages and decodes each
+row into an ogr.Feature. CursorDBReader instead selects geometries as
+WKB (ST_AsBinary) and columns as text, and fetches them in large
+batches, so reading a table is limited by the network rather than by
+per-row overhead. Features keep the parts of the ogr.Feature interface
+used by changegen.generator.
+
+Requires psycopg2, which is otherwise not a changegen dependency.
+
+Classes:
+    CursorFeature: a streamed row, with the ogr.Feature methods changegen uses.
+    CursorDBReader: OGRDBReader streaming features through a server-side cursor.
+
+"""
+
+# Number of rows fetched per round trip by CursorDBReader.
+CURSOR_BATCH_SIZE = 10000
+
+# Server-side cursors must have unique names within a connection.
+_cursor_names = count()
+
+
+class CursorFeature(object):
+    """
+    A feature streamed by CursorDBReader. Field values are strings
+    (or None for NULL) and the geometry is WKB (see db.feature_geometry).
+    """
+
+    __slots__ = ("fid", "field_index", "values", "wkb")
+
+    def __init__(self, fid, field_index, values, wkb):
+        self.fid = fid
+        self.field_index = field_index
+        self.values = values
+        self.wkb = wkb
+
+    def GetFID(self):
+        return self.fid
+
+    def GetFieldIndex(self, name):
+        return self.field_index.get(name, -1)
+
+    def GetFieldAsString(self, index):
+        if index < 0:
+            raise KeyError(f"No field with index {index}.")
+        value = self.values[index]
+        return value if value is not None else ""
+
+    def GetGeometryRef(self):
+        """Returns the geometry as an ogr.Geometry (decoded on each call)."""
+        if self.wkb is None:
+            return None
+        return ogr.CreateGeometryFromWkb(self.wkb)
+
+
+class CursorDBReader(OGRDBReader):
+    """
+    OGRDBReader whose features (get_layer_iter, get_features_by_ids)
+    are streamed through psycopg2 server-side cursors, <batch_size>
+    rows per fetch, as CursorFeatures. Other queries and layer metadata
+    go through OGR as usual.
+    """
+
+    def __init__(self, *args, batch_size=CURSOR_BATCH_SIZE, **kwargs):
+        super(CursorDBReader, self).__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self._pg = None
+
+    @property
+    def pg(self):
+        """The psycopg2 connection (opened on first use)."""
+        if self._pg is None:
+            self._pg = psycopg2.connect(
+                dbname=self.dbname,
+                host=self.dbhost,
+                user=self.dbuser,
+                password=self.dbpass,
+                port=self.dbport,
+            )
+        return self._pg
+
+    def clone(self):
+        reader = super(CursorDBReader, self).clone()
+        reader._pg = None
+        return reader
+
+    def _select_features(self, layer, where=None, geometry_field="geometry"):
+        fid_column = self.get_fid_column(layer)
+        fields = self.get_layer_fields(layer)
+        columns = (
+            [f'{layer}."{fid_column}"' if fid_column else "NULL"]
+            + [f'{layer}."{f}"::text' for f in fields]
+            + [f"ST_AsBinary({self._geometry_sql(f'{layer}.{geometry_field}')})"]
+        )
+        _q = f"SELECT {', '.join(columns)} FROM {layer}"
+        if where is not None:
+            _q += f" WHERE {where}"
+        logging.debug(f"Executing SQL (server-side cursor): {_q}")
+
+        field_index = {f: i for i, f in enumerate(fields)}
+        try:
+            with self.pg.cursor(name=f"changegen_{next(_cursor_names)}") as cursor:
+                cursor.itersize = self.batch_size
+                cursor.execute(_q)
+                while True:
+                    rows = cursor.fetchmany(self.batch_size)
+                    if len(rows) == 0:
+                        break
+                    for row in rows:
+                        yield CursorFeature(
+                            row[0],
+                            field_index,
+                            row[1:-1],
+                            bytes(row[-1]) if row[-1] is not None else None,
+                        )
+        finally:
+            # end the (read-only) transaction holding the cursor
+            self.pg.rollback()
+
+    def get_layer_iter(self, layer, bbox=None, geometry_field="geometry"):
+        """Return generator over features in layer
+        (only those owned by <bbox> if provided, see bbox_filter)."""
+        return self._select_features(
+            layer,
+            self._bbox_sql(layer, bbox, geometry_field),
+            geometry_field=geometry_field,
+        )
@@ -0,0 +1,156 @@
+import logging
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
+import pyproj
+import shapely.geometry as sg
+
+from .db import feature_geometry
+
+"""
+reproject.py
+
+Batched reprojection of shapely geometries to WGS84.
+
+The coordinates of many geometries are gathered into numpy arrays and
+transformed in a single pyproj call, instead of one Python callback per
+coordinate (as shapely.ops.transform does). Transformers are built once
+per EPSG code and process.
+
+Functions:
+    transformer: cached pyproj Transformer from an EPSG code to WGS84.
+    reproject_geometries: reproject many geometries at once.
+    reprojected_features: reproject the geometries of OGR features in batches.
+
+"""
+
+WGS84 = pyproj.CRS("EPSG:4326")
+# Number of features reprojected together by reprojected_features.
+REPROJECT_BATCH_SIZE = 500
+
+
+@lru_cache(maxsize=None)
+def _transformer(epsg):
+    return pyproj.Transformer.from_crs(
+        pyproj.CRS(f"EPSG:{epsg}"), WGS84, always_xy=True
+    )
+
+
+def transformer(epsg):
+    """Returns the (cached) pyproj Transformer from EPSG:<epsg> to WGS84,
+    or None if <epsg> is WGS84 (e.g. when geometries are reprojected in
+    PostGIS, see db.OGRDBReader)."""
+    if str(epsg) == "4326":
+        return None
+    return _transformer(str(epsg))
+
+
+def _sequences(geom):
+    """Returns the coordinate sequences of <geom> (a shapely geometry)."""
+    if geom.is_empty:
+        return []
+    if isinstance(geom, (sg.Point, sg.LineString, sg.LinearRing)):
+        return [geom.coords]
+    if isinstance(geom, sg.Polygon):
+        return [geom.exterior.coords] + [i.coords for i in geom.interiors]
+    return [seq for part in geom.geoms for seq in _sequences(part)]
+
+
+def _rebuild(geom, arrays):
+    """Returns a geometry like <geom>, with coordinate sequences
+    taken in order from the iterator <arrays> (see _sequences)."""
+    if geom.is_empty:
+        return geom
+    if isinstance(geom, (sg.Point, sg.LineString, sg.LinearRing)):
+        return type(geom)(next(arrays))
+    if isinstance(geom, sg.Polygon):
+        return sg.Polygon(next(arrays), [next(arrays) for _ in geom.interiors])
+    return type(geom)([_rebuild(part, arrays) for part in geom.geoms])
+
+
+def reproject_geometries(geoms, transformer):
+    """
+    Returns <geoms> (shapely geometries) reprojected with <transformer>
+    (a pyproj Transformer, or None to leave them as they are). The
+    coordinates of all <geoms> are transformed in one call; z coordinates
+    are kept as they are.
+    """
+    geoms = list(geoms)
+    if transformer is None:
+        return geoms
+    arrays = [np.array(seq, dtype=float) for geom in geoms for seq in _sequences(geom)]
+    if len(arrays) > 0:
+        xs, ys = transformer.transform(
+            np.concatenate([a[:, 0] for a in arrays]),
+            np.concatenate([a[:, 1] for a in arrays]),
+        )
+        start = 0
+        for a in arrays:
+            a[:, 0] = xs[start : start + len(a)]
+            a[:, 1] = ys[start : start + len(a)]
+            start += len(a)
+    arrays = iter(arrays)
+    return [_rebuild(geom, arrays) for geom in geoms]
+
+
+def _feature_fid(feature):
+    return feature.GetFID()
+
+
+def _log_skipped(fid, e):
+    logging.warning(
+        f"Exception encountered processing a feature. [exception={repr(e)} fid={fid}]"
+    )
+
+
+def _reproject_batch(batch, transformer):
+    """Returns [(feature, reprojected geometry or None)] for the
+    (feature, geometry or None) pairs of <batch>, see reprojected_features."""
+    reprojected = iter(
+        reproject_geometries([g for _, g in batch if g is not None], transformer)
+    )
+    return [(f, next(reprojected) if g is not None else None) for f, g in batch]
+
+
+def reprojected_features(
+    features,
+    transformer,
+    batch_size=REPROJECT_BATCH_SIZE,
+    geometry=feature_geometry,
+    fid=_feature_fid,
+):
+    """
+    Yields (feature, geometry) for every OGR feature in <features>,
+    where geometry is the feature's geometry as a shapely geometry
+    reprojected with <transformer>, or None if it has no geometry.
+    Geometries of <batch_size> features are reprojected at a time.
+
+    <features> can be any objects that <geometry> returns the shapely
+    geometry (or None) of, and <fid> the FID of (default: OGR features).
+
+    Features whose geometry can't be read or reprojected are logged
+    and skipped, like other feature-level errors: if a batch can't be
+    reprojected, its features are reprojected one at a time.
+    """
+    features = iter(features)
+    while True:
+        batch = list(islice(features, batch_size))
+        if len(batch) == 0:
+            return
+        decoded = []
+        for feature in batch:
+            try:
+                decoded.append((feature, geometry(feature)))
+            except Exception as e:
+                _log_skipped(fid(feature), e)
+        try:
+            results = _reproject_batch(decoded, transformer)
+        except Exception:
+            results = []
+            for item in decoded:
+                try:
+                    results.extend(_reproject_batch([item], transformer))
+                except Exception as e:
+                    _log_skipped(fid(item[0]), e)
+        yield from results
@@ -0,0 +1,134 @@
+import logging
+
+from .db import OGRDBReader
+from .filesource import OGRFileReader
+from .generator import _get_deleted_way_ids
+
+"""
+session.py
+
+State shared by all steps of a changegen run.
+
+A Session is created once per command and passed to every per-table
+step, so that they share one database connection (with its cached
+layer metadata, see db.OGRDBReader) and the IDs of Ways to delete are
+read from the database once. Reprojection transformers are cached per
+process by reproject.transformer.
+
+Classes:
+    Session: database connection and resolved IDs of a run.
+
+Functions:
+    clear_detached: forget the connections detached by a parent process.
+
+"""
+
+
+# Connections a forked process inherited and detached (see Session.detach).
+# They are only referenced here so that they are never garbage collected:
+# closing one would close the socket its parent process still uses.
+# Workers clear the list as they start (see clear_detached), so it only
+# holds the connections detached by the current process.
+_detached_db_readers = []
+
+
+def clear_detached():
+    """Forgets the connections detached by the parent process, whose
+    list a forked process inherits. Call at the start of a worker,
+    before Session.detach (the parent of a worker doesn't detach
+    connections, so none of them is closed)."""
+    _detached_db_readers.clear()
+
+
+class Session(object):
+    """
+    Database connection and resolved IDs shared by the steps of a run.
+
+    The OGRDBReader (db_reader) is opened on first use. If
+    <cursor_batch_size> is provided, it is a pgcursor.CursorDBReader
+    streaming features in batches of that many rows. If <sources>
+    (paths of files) are provided, it is a filesource.OGRFileReader
+    reading the layers of those files instead of the database.
+
+    A Session can be passed to worker processes (e.g. as a
+    ProcessPoolExecutor initializer argument). It is pickled without
+    its connection, but forked processes inherit the parent's open
+    connection, which must not be used from more than one process:
+    workers call detach, so each opens (and then reuses) its own.
+    """
+
+    def __init__(
+        self,
+        dbname,
+        dbport,
+        dbuser,
+        dbpass=None,
+        dbhost="localhost",
+        transform_srid=None,
+        cursor_batch_size=None,
+        sources=None,
+    ):
+        super(Session, self).__init__()
+        if sources and cursor_batch_size is not None:
+            raise ValueError("Features can't be read from files through a cursor.")
+        self.params = dict(
+            dbname=dbname,
+            dbport=dbport,
+            dbuser=dbuser,
+            dbpass=dbpass,
+            dbhost=dbhost,
+            transform_srid=transform_srid,
+        )
+        self.cursor_batch_size = cursor_batch_size
+        self.sources = list(sources or [])
+        self.deletion_way_ids = {}
+        self._db_reader = None
+
+    @property
+    def db_reader(self):
+        """The Session's OGRDBReader (opened on first use)."""
+        if self._db_reader is None and self.sources:
+            self._db_reader = OGRFileReader(
+                self.sources, transform_srid=self.params["transform_srid"]
+            )
+        elif self._db_reader is None and self.cursor_batch_size is not None:
+            # psycopg2 is only required for cursor streaming
+            from .pgcursor import CursorDBReader
+
+            self._db_reader = CursorDBReader(
+                **self.params, batch_size=self.cursor_batch_size
+            )
+        elif self._db_reader is None:
+            self._db_reader = OGRDBReader(**self.params)
+        return self._db_reader
+
+    def get_tables(self, suffixes):
+        """Returns the tables ending in any of <suffixes>."""
+        tables = []
+        for suffix in suffixes:
+            tables.extend(self.db_reader.get_tables(suffix))
+        logging.info(f"Found tables in db: {tables}")
+        return tables
+
+    def get_deletion_way_ids(self, table):
+        """Returns the OSM ids of the Ways to delete in <table>
+        (read from the database once per Session)."""
+        if table not in self.deletion_way_ids:
+            logging.info(f"Retrieving deletion nodes for table: {table}")
+            self.deletion_way_ids[table] = _get_deleted_way_ids(table, self.db_reader)
+        return self.deletion_way_ids[table]
+
+    def detach(self):
+        """Stops using the Session's connection, e.g. in a forked
+        process that inherited it. The connection is not closed
+        (which would end it for the process it belongs to), but kept
+        referenced until the process exits; the next use of db_reader
+        opens a new one."""
+        if self._db_reader is not None:
+            _detached_db_readers.append(self._db_reader)
+            self._db_reader = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_db_reader"] = None
+        return state
@@ -0,0 +1,299 @@
+import gzip
+import json
+import logging
+from array import array
+from itertools import groupby
+
+import numpy as np
+from lxml import etree
+
+from .changewriter import fixed
+from .changewriter import Node
+from .changewriter import OSMChangeWriter
+from .changewriter import Relation
+from .changewriter import RelationMember
+from .changewriter import Tag
+from .changewriter import Way
+
+"""
+shards.py
+
+Sharded changegen runs.
+
+A run is split into shards: one per table and cell of a grid laid
+over the table's extent (see tiles.grid_cells). Each shard owns the features whose bounding
+box centre lies within its cell (see db.bbox_filter) and a disjoint
+range of new IDs, so shards can be generated independently (e.g. on
+different machines) and their change files merged afterwards.
+
+Shards are described by a manifest (JSON):
+
+    {
+        "version": "1",
+        "options": {...},  # run options, see `changegen plan`
+        "shards": [
+            {
+                "table": "roads_new",
+                "kind": "changes",  # or "deletions"
+                "bbox": [minx, miny, maxx, maxy],  # None sides are unbounded
+                "id_offset": 0,
+                "id_limit": 100000000,
+                "deletions": true,  # whether the shard writes --deletions
+                "output": "roads_new.0000.osc"  # merged into roads_new.osc
+            },
+            ...
+        ]
+    }
+
+An intersection between features owned by different shards is found
+by each of those shards, and each creates a Node for it. Shards list
+the IDs of these Nodes next to their change file (see
+boundary_nodes_path), so that merging combines them into one Node.
+
+Functions:
+    plan_shards: produce the shard entries of a manifest.
+    write_manifest / read_manifest: manifest (de)serialization.
+    boundary_nodes_path: where a shard lists Nodes shared with other shards.
+    merge_changes: combine shard change files into a single change file.
+
+"""
+
+MANIFEST_VERSION = "1"
+
+
+def plan_shards(table_cells, deletions, id_offset, ids_per_shard):
+    """
+    Returns the manifest shard entries for <table_cells>, a dictionary
+    of table : [bbox], and the <deletions> tables.
+
+    Each shard is assigned its own range of <ids_per_shard> IDs,
+    starting at <id_offset>. Only the first shard of each table writes
+    deletions (like `generate`, which writes them to every table's
+    change file).
+    """
+    shards = []
+    for table, cells in table_cells.items():
+        for i, bbox in enumerate(cells):
+            shards.append(
+                {
+                    "table": table,
+                    "kind": "changes",
+                    "bbox": bbox,
+                    "deletions": i == 0,
+                    "output": f"{table}.{i:04d}.osc",
+                }
+            )
+    for table in deletions:
+        shards.append(
+            {
+                "table": table,
+                "kind": "deletions",
+                "bbox": None,
+                "deletions": True,
+                "output": f"{table}.0000.osc",
+            }
+        )
+
+    for i, shard in enumerate(shards):
+        shard["id_offset"] = id_offset + i * ids_per_shard
+        shard["id_limit"] = id_offset + (i + 1) * ids_per_shard
+    return shards
+
+
+def write_manifest(path, options, shards):
+    with open(path, "w") as f:
+        json.dump(
+            {"version": MANIFEST_VERSION, "options": options, "shards": shards},
+            f,
+            indent=2,
+        )
+
+
+def read_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(
+            f"Unsupported manifest version {manifest.get('version')} in {path}."
+        )
+    return manifest
+
+
+def boundary_nodes_path(output):
+    """Returns the path listing the Nodes of change file <output> that
+    other shards also create (see generator.generate_changes)."""
+    return f"{output}.boundary"
+
+
+def _read_boundary_nodes(path):
+    """Returns the set of Node ids listed for change file <path>
+    (none if it has no list, e.g. a deletions shard)."""
+    try:
+        with open(boundary_nodes_path(path)) as f:
+            return {int(line) for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def _open_changes(path):
+    """Opens a (possibly gzip-compressed) change file for reading."""
+    f = open(path, "rb")
+    compressed = f.read(2) == b"\x1f\x8b"
+    f.seek(0)
+    return gzip.GzipFile(fileobj=f) if compressed else f
+
+
+def _read_changes(path):
+    """
+    Yields (action, element) for every OSM element in change file <path>,
+    where action is "create", "modify" or "delete" and element is a
+    changewriter Node, Way or Relation.
+    """
+    with _open_changes(path) as f:
+        action = None
+        for event, elem in etree.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if elem.tag in ("create", "modify", "delete"):
+                    action = elem.tag
+                continue
+            if elem.tag not in ("node", "way", "relation"):
+                continue
+
+            tags = [Tag(key=t.get("k"), value=t.get("v")) for t in elem.iter("tag")]
+            if elem.tag == "node":
+                obj = Node(
+                    id=int(elem.get("id")),
+                    version=elem.get("version"),
+                    lat=elem.get("lat"),
+                    lon=elem.get("lon"),
+                    tags=tags,
+                )
+            elif elem.tag == "way":
+                obj = Way(
+                    id=int(elem.get("id")),
+                    version=elem.get("version"),
+                    nds=[int(nd.get("ref")) for nd in elem.iter("nd")],
+                    tags=tags,
+                )
+            else:
+                obj = Relation(
+                    id=int(elem.get("id")),
+                    version=elem.get("version"),
+                    members=[
+                        RelationMember(
+                            ref=int(m.get("ref")),
+                            type=m.get("type"),
+                            role=m.get("role"),
+                        )
+                        for m in elem.iter("member")
+                    ],
+                    tags=tags,
+                )
+            yield action, obj
+
+            # free parsed elements as we go
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+def _shared_node_ids(paths):
+    """
+    Returns a dictionary of node id : node id, mapping the boundary Nodes
+    (intersection Nodes of features owned by different shards, see
+    boundary_nodes_path) created in more than one of the change files
+    <paths> at the same location to the Node created by the first of
+    <paths>.
+
+    Other Nodes (e.g. vertices of Ways that happen to be at the same
+    location), and Nodes at the same location within one change file,
+    are left alone.
+    """
+    ids, lats, lons, files = array("q"), array("q"), array("q"), array("q")
+    for i, path in enumerate(paths):
+        boundary_nodes = _read_boundary_nodes(path)
+        if len(boundary_nodes) == 0:
+            continue
+        for action, obj in _read_changes(path):
+            if (
+                action == "create"
+                and isinstance(obj, Node)
+                and obj.id in boundary_nodes
+            ):
+                ids.append(obj.id)
+                lats.append(fixed(obj.lat))
+                lons.append(fixed(obj.lon))
+                files.append(i)
+    if len(ids) == 0:
+        return {}
+
+    ids, lats, lons, files = (np.asarray(a) for a in (ids, lats, lons, files))
+    order = np.lexsort((files, lons, lats))
+    lats, lons = lats[order], lons[order]
+    group_start = np.ones(len(order), dtype=bool)
+    group_start[1:] = (lats[1:] != lats[:-1]) | (lons[1:] != lons[:-1])
+    # position (in sort order) of the first Node at each Node's location
+    first = np.maximum.accumulate(np.where(group_start, np.arange(len(order)), 0))
+    canonical = order[first]
+    shared = files[order] != files[canonical]
+    return dict(zip(ids[order][shared].tolist(), ids[canonical][shared].tolist()))
+
+
+def _merged_changes(paths, shared_node_ids):
+    """Yields (action, element) for all elements in <paths>, with shared
+    Nodes replaced by their canonical Node and duplicate deletions removed."""
+    deleted = set()
+    for path in paths:
+        for action, obj in _read_changes(path):
+            if isinstance(obj, Node):
+                if action == "create" and obj.id in shared_node_ids:
+                    continue
+            elif isinstance(obj, Way):
+                obj = obj._replace(nds=[shared_node_ids.get(n, n) for n in obj.nds])
+            else:
+                obj = obj._replace(
+                    members=[
+                        m._replace(ref=shared_node_ids.get(m.ref, m.ref))
+                        if m.type == "node"
+                        else m
+                        for m in obj.members
+                    ]
+                )
+
+            if action == "delete":
+                key = (type(obj).__name__, obj.id)
+                if key in deleted:
+                    continue
+                deleted.add(key)
+            yield action, obj
+
+
+def merge_changes(paths, outfile, compress=False):
+    """
+    Combines the change files <paths> of the shards of a run into a
+    single change file <outfile>.
+
+    Shards that share an intersection each create a Node for it; these
+    are merged into one Node (see _shared_node_ids), and Ways and
+    Relations are updated to reference it. The boundary Node lists of
+    the shards (see boundary_nodes_path) must be next to <paths>. Elements deleted by more than
+    one shard are deleted once.
+
+    Returns the number of Nodes merged.
+    """
+    shared_node_ids = _shared_node_ids(paths)
+    logging.info(f"Merging {len(shared_node_ids)} nodes shared between shards.")
+
+    change_writer = OSMChangeWriter(outfile, compress=compress)
+    for action, changes in groupby(
+        _merged_changes(paths, shared_node_ids), key=lambda change: change[0]
+    ):
+        elements = (obj for _, obj in changes)
+        if action == "create":
+            change_writer.add_create(elements)
+        elif action == "modify":
+            change_writer.add_modify(elements)
+        else:
+            change_writer.add_delete(elements)
+    change_writer.close()
+    return len(shared_node_ids)
@@ -0,0 +1,185 @@
+import logging
+import os
+import sqlite3
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import osmium
+
+from .waynodes import WayNodeMap
+
+"""
+sourceindex.py
+
+Persistent sidecar index for an OSM source extract (.pbf).
+
+The index is a SQLite database stored next to the source extract
+(<osmsrc>.changegen-index) containing the node refs of every Way and
+the max node/way/relation IDs in the extract. It is keyed by the
+source extract's file size, mtime and header, and is ignored once the
+source extract changes.
+
+Classes:
+    SourceIndex: read access to a built index.
+
+Functions:
+    index_path: default sidecar path for a source extract.
+    build_index: build (or rebuild) the index for a source extract.
+    open_index: open the index for a source extract, if it's current.
+
+"""
+
+INDEX_SUFFIX = ".changegen-index"
+INDEX_VERSION = "1"
+# SQLite limits the number of host parameters per query.
+_QUERY_CHUNK_SIZE = 900
+_INSERT_BATCH_SIZE = 50000
+
+
+def index_path(osmsrc):
+    """Returns the default sidecar index path for <osmsrc>."""
+    return f"{osmsrc}{INDEX_SUFFIX}"
+
+
+def _source_key(osmsrc):
+    """
+    Returns a dictionary identifying the current state of <osmsrc>:
+    file size, mtime and header.
+    """
+    stat = os.stat(osmsrc)
+    header = osmium.FileProcessor(osmsrc, osmium.osm.NOTHING).header
+    header_str = "|".join(
+        [
+            str(header.box()),
+            header.get("generator"),
+            header.get("timestamp"),
+            header.get("osmosis_replication_timestamp"),
+            str(header.has_multiple_object_versions),
+        ]
+    )
+    return {
+        "version": INDEX_VERSION,
+        "size": str(stat.st_size),
+        "mtime": str(stat.st_mtime_ns),
+        "header": header_str,
+    }
+
+
+def build_index(osmsrc, path=None, get_max_ids=None):
+    """
+    Build the sidecar index for <osmsrc> at <path> (default: index_path(osmsrc)),
+    replacing any existing index.
+
+    <get_max_ids> is a callable taking <osmsrc> and returning a dictionary of
+    max IDs ({"nodes": .., "ways": .., "relations": ..}) to store in the index
+    (e.g. from `osmium fileinfo`). It is run concurrently with indexing Ways.
+    If not provided (or it returns None), max IDs are not stored.
+
+    Returns the index path.
+    """
+    path = path or index_path(osmsrc)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    # key the index on the state of osmsrc *before* reading it
+    key = _source_key(osmsrc)
+
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE ways (id INTEGER PRIMARY KEY, nodes BLOB)")
+
+    logging.info(f"Building source index for {osmsrc} at {path}")
+    n_ways = 0
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        max_ids = pool.submit(get_max_ids or (lambda _: None), osmsrc)
+
+        batch = []
+        for w in osmium.FileProcessor(osmsrc, osmium.osm.WAY):
+            batch.append((w.id, array("q", [n.ref for n in w.nodes]).tobytes()))
+            if len(batch) >= _INSERT_BATCH_SIZE:
+                conn.executemany("INSERT INTO ways VALUES (?, ?)", batch)
+                n_ways += len(batch)
+                batch = []
+        conn.executemany("INSERT INTO ways VALUES (?, ?)", batch)
+        n_ways += len(batch)
+
+        max_ids = max_ids.result()
+
+    if max_ids:
+        key.update({f"maxid.{k}": str(v) for k, v in max_ids.items()})
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", key.items())
+    conn.commit()
+    conn.close()
+
+    os.replace(tmp_path, path)
+    logging.info(f"Indexed {n_ways} ways.")
+    return path
+
+
+def open_index(osmsrc, path=None):
+    """
+    Returns a SourceIndex for <osmsrc> if an index exists at <path>
+    (default: index_path(osmsrc)) and it is current, otherwise None.
+    """
+    path = path or index_path(osmsrc)
+    if not os.path.exists(path):
+        return None
+
+    index = SourceIndex(path)
+    if index.meta.get("version") != INDEX_VERSION or any(
+        index.meta.get(k) != v for k, v in _source_key(osmsrc).items()
+    ):
+        logging.warning(
+            f"Source index {path} is out of date with {osmsrc}, ignoring it. "
+            "Run `changegen index` to rebuild it."
+        )
+        index.close()
+        return None
+
+    logging.debug(f"Using source index {path}")
+    return index
+
+
+class SourceIndex(object):
+    """Read Way node refs and max IDs from a source extract index."""
+
+    def __init__(self, path):
+        super(SourceIndex, self).__init__()
+        self.path = path
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        self.meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+
+    def close(self):
+        self.conn.close()
+
+    def get_max_ids(self):
+        """Returns a dictionary of max IDs, or None if they weren't indexed."""
+        try:
+            return {
+                idtype: int(self.meta[f"maxid.{idtype}"])
+                for idtype in ["ways", "nodes", "relations"]
+            }
+        except KeyError:
+            return None
+
+    def get_way_node_map(self, way_idlist):
+        """Returns a WayNodeMap of osm_id : [node_ids]
+        for all Ways specified with way_idlist
+        (same as generator._get_way_node_map).
+        """
+        ids = sorted({int(i) for i in way_idlist})
+        found_ids, counts, refs = array("q"), array("q"), array("q")
+        for start in range(0, len(ids), _QUERY_CHUNK_SIZE):
+            chunk = ids[start : start + _QUERY_CHUNK_SIZE]
+            rows = self.conn.execute(
+                f"SELECT id, nodes FROM ways WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for _id, nodes in rows:
+                found_ids.append(_id)
+                counts.append(len(nodes) // refs.itemsize)
+                refs.frombytes(nodes)
+        return WayNodeMap.from_arrays(found_ids, counts, refs)
@@ -0,0 +1,154 @@
+import math
+from bisect import bisect_right
+
+from .changewriter import fixed
+from .changewriter import Node
+
+"""
+tiles.py
+
+Spatial tiling of changegen runs.
+
+A grid of tiles is laid over a table's extent. Each tile owns the
+features whose bounding box centre lies within it (see db.bbox_filter),
+so features (and their intersections) can be processed tile by tile,
+holding one tile's intersections in memory at a time.
+
+Classes:
+    TileGrid: a grid of tiles, and the tile owning a point.
+    SharedNodes: intersection Nodes shared between the tiles of a run.
+
+Functions:
+    grid_cells: split an extent into a grid of bboxes.
+    clip_bbox: intersect two bboxes.
+    owns: whether a bbox owns a point.
+
+"""
+
+
+class TileGrid(object):
+    """
+    Grid of <tile_size> tiles covering <extent> ([minx, miny, maxx, maxy]).
+
+    The outer sides of the tiles on the edges of the grid are unbounded,
+    so that every point (including geometries of other tables outside
+    <extent>) is owned by exactly one tile.
+
+    Tiles are numbered row by row, from (minx, miny).
+    """
+
+    def __init__(self, extent, tile_size):
+        super(TileGrid, self).__init__()
+        minx, miny, maxx, maxy = extent
+        nx = max(1, math.ceil((maxx - minx) / tile_size))
+        ny = max(1, math.ceil((maxy - miny) / tile_size))
+        # interior tile boundaries
+        self.xs = [minx + i * tile_size for i in range(1, nx)]
+        self.ys = [miny + j * tile_size for j in range(1, ny)]
+
+    @property
+    def cells(self):
+        """bboxes [minx, miny, maxx, maxy] of all tiles, None sides unbounded."""
+        xs = [None] + self.xs + [None]
+        ys = [None] + self.ys + [None]
+        return [
+            [xs[i], ys[j], xs[i + 1], ys[j + 1]]
+            for j in range(len(ys) - 1)
+            for i in range(len(xs) - 1)
+        ]
+
+    def tile_of(self, x, y):
+        """Returns the number of the tile owning point (x, y)."""
+        return bisect_right(self.ys, y) * (len(self.xs) + 1) + bisect_right(self.xs, x)
+
+
+def grid_cells(extent, cell_size):
+    """Returns bboxes for a grid of <cell_size> cells covering <extent>
+    (see TileGrid)."""
+    return TileGrid(extent, cell_size).cells
+
+
+def owns(bbox, x, y):
+    """
+    Returns whether <bbox> (which may have unbounded (None) sides)
+    owns the point (<x>, <y>), like db.bbox_filter does for the centre
+    of a geometry's bounding box.
+    """
+    minx, miny, maxx, maxy = bbox
+    return (
+        (minx is None or x >= minx)
+        and (miny is None or y >= miny)
+        and (maxx is None or x < maxx)
+        and (maxy is None or y < maxy)
+    )
+
+
+def clip_bbox(bbox, clip):
+    """
+    Returns the intersection of <bbox> and <clip> (either may have
+    unbounded (None) sides, and <clip> may be None for no clipping),
+    or None if they don't intersect.
+    """
+    if clip is None:
+        return bbox
+    lower = [
+        a if b is None else b if a is None else max(a, b)
+        for a, b in zip(bbox[:2], clip[:2])
+    ]
+    upper = [
+        a if b is None else b if a is None else min(a, b)
+        for a, b in zip(bbox[2:], clip[2:])
+    ]
+    if any(l is not None and u is not None and l >= u for l, u in zip(lower, upper)):
+        return None
+    return lower + upper
+
+
+class SharedNodes(object):
+    """
+    Intersection Nodes of a tiled run, processed tile by tile in the order
+    of <tiles> (tile numbers of <grid>).
+
+    An intersection between features owned by different tiles is found
+    by each of those tiles. Its Node is created by the first of them, and
+    kept until the last of them has been processed, so that all tiles use
+    the same Node. Every other Node is dropped when its tile is finished,
+    so memory is bounded by the intersections of one tile, plus those
+    shared with tiles not processed yet.
+    """
+
+    def __init__(self, grid, tiles):
+        super(SharedNodes, self).__init__()
+        self.grid = grid
+        self.order = {tile: i for i, tile in enumerate(tiles)}
+        self.tile = None
+        self.nodes = {}  # fixed (lat, lon) : [Node, order of last tile using it]
+        self.created = []
+
+    def start_tile(self, tile):
+        self.tile = self.order[tile]
+        self.created = []
+
+    def node(self, lon, lat, owners, idgen):
+        """
+        Returns the Node for an intersection at (<lon>, <lat>) between
+        features with bounding box centres <owners> ([(x, y)], in the
+        CRS of the grid), creating it (with an ID from <idgen>) if no
+        tile has yet.
+        """
+        key = (fixed(lat), fixed(lon))
+        last = max(
+            [self.tile]
+            + [self.order.get(self.grid.tile_of(x, y), self.tile) for x, y in owners]
+        )
+        if key in self.nodes:
+            self.nodes[key][1] = max(self.nodes[key][1], last)
+        else:
+            node = Node(id=next(idgen), version="1", lat=lat, lon=lon, tags=[])
+            self.nodes[key] = [node, last]
+            self.created.append(node)
+        return self.nodes[key][0]
+
+    def finish_tile(self):
+        """Drops the Nodes no later tile uses."""
+        self.nodes = {k: v for k, v in self.nodes.items() if v[1] > self.tile}
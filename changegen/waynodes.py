@@ -0,0 +1,125 @@
+from array import array
+
+import numpy as np
+
+"""
+waynodes.py
+
+Compact Way ID -> Node IDs map.
+
+Classes:
+    WayNodeMap: Way -> Node map in compressed sparse row (CSR) layout.
+
+"""
+
+
+class WayNodeMap(object):
+    """
+    Map of Way ID -> Node IDs stored as three int64 arrays
+    (compressed sparse row layout):
+
+        ids: sorted Way IDs
+        offsets: len(ids) + 1 offsets into refs
+        refs: Node IDs of all Ways, flattened
+
+    The Node IDs of Way ids[i] are refs[offsets[i] : offsets[i + 1]].
+
+    Lookups are by binary search on ids, and accept integer or string
+    Way IDs. Lookups return int64 arrays (views into refs).
+    """
+
+    def __init__(self, ids=None, offsets=None, refs=None):
+        super(WayNodeMap, self).__init__()
+        self.ids = np.asarray(ids if ids is not None else [], dtype=np.int64)
+        self.offsets = np.asarray(
+            offsets if offsets is not None else [0], dtype=np.int64
+        )
+        self.refs = np.asarray(refs if refs is not None else [], dtype=np.int64)
+
+    @classmethod
+    def from_ways(cls, ways):
+        """Builds a WayNodeMap from an iterable of (way_id, [node_ids])."""
+        ids, counts, refs = array("q"), array("q"), array("q")
+        for way_id, nodes in ways:
+            n_refs = len(refs)
+            refs.extend(nodes)
+            ids.append(way_id)
+            counts.append(len(refs) - n_refs)
+        return cls.from_arrays(ids, counts, refs)
+
+    @classmethod
+    def from_arrays(cls, ids, counts, refs):
+        """
+        Builds a WayNodeMap from (not necessarily sorted) Way IDs,
+        the number of Node IDs of each Way, and the flattened Node IDs
+        of all Ways in the same order.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        refs = np.asarray(refs, dtype=np.int64)
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        if np.all(ids[1:] >= ids[:-1]):
+            return cls(ids, offsets, refs)
+
+        # move each Way's run of Node IDs to its sorted position
+        order = np.argsort(ids, kind="stable")
+        counts = counts[order]
+        sorted_offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=sorted_offsets[1:])
+        positions = np.arange(len(refs), dtype=np.int64) + np.repeat(
+            offsets[:-1][order] - sorted_offsets[:-1], counts
+        )
+        return cls(ids[order], sorted_offsets, refs[positions])
+
+    @classmethod
+    def merge(cls, maps):
+        """Returns a single WayNodeMap containing all Ways in <maps>."""
+        maps = list(maps)
+        if len(maps) == 0:
+            return cls()
+        return cls.from_arrays(
+            np.concatenate([m.ids for m in maps]),
+            np.concatenate([np.diff(m.offsets) for m in maps]),
+            np.concatenate([m.refs for m in maps]),
+        )
+
+    def _index(self, way_id):
+        """Returns the index of <way_id> in ids, or -1."""
+        try:
+            way_id = int(way_id)
+        except (TypeError, ValueError):
+            return -1
+        idx = np.searchsorted(self.ids, way_id)
+        if idx < len(self.ids) and self.ids[idx] == way_id:
+            return idx
+        return -1
+
+    def __getitem__(self, way_id):
+        idx = self._index(way_id)
+        if idx < 0:
+            raise KeyError(way_id)
+        return self.refs[self.offsets[idx] : self.offsets[idx + 1]]
+
+    def get(self, way_id, default=None):
+        idx = self._index(way_id)
+        if idx < 0:
+            return default
+        return self.refs[self.offsets[idx] : self.offsets[idx + 1]]
+
+    def __contains__(self, way_id):
+        return self._index(way_id) >= 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def keys(self):
+        return self.ids.tolist()
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.offsets.nbytes + self.refs.nbytes
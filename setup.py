@@ -12,14 +12,13 @@ setup(
     install_requires=[
         "click",
         "tqdm",
-        "shapely",
+        "shapely>=2.0",
         "gdal",
         "lxml",
-        "psycopg2",
         "pyproj",
-        "rtree",
-        "osmium"
+        "osmium>=3.7",
     ],
+    extras_require={"cursor": ["psycopg2"], "arrow": ["pyarrow"]},
     test_suite="test",
     entry_points="""
         [console_scripts]
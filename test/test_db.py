@@ -6,6 +6,7 @@ from osgeo import ogr
 
 gdal.UseExceptions()
 from changegen import db
+from changegen import pgcursor
 
 DBNAME = "conflate"
 DBUSER = "postgres"
@@ -42,8 +43,7 @@ class TestDB(unittest.TestCase):
         _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER)
         layers = _l.get_layers()
         intersections = _l.intersections(layers[0], layers[0])
-        isection = intersections.GetNextFeature()
-        self.assertTrue(isection)
+        self.assertTrue(len(intersections) > 0)
 
     def test_self_intersection_returns_intersection_point(self):
         _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER)
@@ -52,8 +52,10 @@ class TestDB(unittest.TestCase):
             layers[0],
             layers[0],
         )
-        ifeat = intersections.GetNextFeature()
-        self.assertEqual(ifeat.GetGeometryRef().GetGeometryType(), ogr.wkbPoint)
+        isection = intersections[0]
+        self.assertIsInstance(isection, db.Intersection)
+        self.assertIsInstance(isection.x, float)
+        self.assertIsInstance(isection.y, float)
 
     def test_id_return(self):
         _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER)
@@ -63,6 +65,32 @@ class TestDB(unittest.TestCase):
         )
         self.assertTrue(len(ids) > 0)
 
+    def test_id_return_matches_intersecting_ids(self):
+        """Ensure ids read with intersections are those of intersecting_ids."""
+        _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER)
+        intersections, ids = _l.intersections(
+            "trails_new", "osm_roads_trails", ids=True
+        )
+        self.assertEqual(
+            sorted(ids), sorted(_l.intersecting_ids("trails_new", "osm_roads_trails"))
+        )
+        self.assertTrue(len(intersections) > 0)
+
+    def test_get_features_by_ids(self):
+        """Ensure batched fetches return the features of get_feature_by_id,
+        in order."""
+        _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER)
+        ids = _l.intersecting_ids("trails_new", "osm_roads_trails")[:5]
+        features = list(
+            _l.get_features_by_ids("osm_roads_trails", ids, "osm_id", batch_size=2)
+        )
+        self.assertEqual(
+            [f.GetFieldAsString(f.GetFieldIndex("osm_id")) for f in features], ids
+        )
+        for id, feature in zip(ids, features):
+            expected = _l.get_feature_by_id("osm_roads_trails", id, "osm_id")
+            self.assertEqual(feature.GetFID(), expected.GetFID())
+
     def test_generator(self):
         """Test layer generator"""
         _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER)
@@ -72,3 +100,43 @@ class TestDB(unittest.TestCase):
         self.assertTrue(f1 != None)
         self.assertIsInstance(f1, ogr.Feature)
         self.assertNotEqual(f1, f2)
+
+    def test_cursor_layer_iter(self):
+        """Ensure features streamed through a server-side cursor match
+        those read through OGR."""
+        _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER)
+        _c = pgcursor.CursorDBReader(DBNAME, DBPORT, DBUSER, batch_size=3)
+        expected = list(_l.get_layer_iter("trails_new"))
+        features = list(_c.get_layer_iter("trails_new"))
+        self.assertEqual([f.GetFID() for f in features], [f.GetFID() for f in expected])
+        for feature, ogr_feature in zip(features, expected):
+            self.assertTrue(
+                db.feature_geometry(feature).equals(db.feature_geometry(ogr_feature))
+            )
+
+
+class TestFeatureGeometry(unittest.TestCase):
+    def test_feature_geometry(self):
+        """Ensure feature geometries are read with full precision."""
+        source = ogr.Open("./test/data/test_line.geojson")
+        feature = source.GetLayer().GetNextFeature()
+        geom = db.feature_geometry(feature)
+        self.assertEqual(
+            list(geom.coords), [p[:2] for p in feature.GetGeometryRef().GetPoints()]
+        )
+
+    def test_cursor_feature_geometry(self):
+        """Ensure geometries of streamed features are read from their WKB."""
+        source = ogr.Open("./test/data/test_line.geojson")
+        ogr_feature = source.GetLayer().GetNextFeature()
+        feature = pgcursor.CursorFeature(
+            1, {}, (), bytes(ogr_feature.GetGeometryRef().ExportToWkb())
+        )
+        self.assertEqual(
+            list(db.feature_geometry(feature).coords),
+            list(db.feature_geometry(ogr_feature).coords),
+        )
+        self.assertEqual(
+            feature.GetGeometryRef().GetPointCount(),
+            ogr_feature.GetGeometryRef().GetPointCount(),
+        )
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+
+from osgeo import gdal
+from osgeo import ogr
+from osgeo import osr
+
+gdal.UseExceptions()
+
+from changegen import filesource
+
+
+def _write_layer(data, name, rows):
+    """Writes a layer of LineStrings with an osm_id field to <data>."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(3857)
+    layer = data.CreateLayer(name, srs, ogr.wkbLineString)
+    layer.CreateField(ogr.FieldDefn("osm_id", ogr.OFTString))
+    for osm_id, wkt in rows:
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetField("osm_id", osm_id)
+        feature.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+        layer.CreateFeature(feature)
+
+
+class TestFileSource(unittest.TestCase):
+    """Test reading tables from local files"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "conflated.gpkg")
+        data = ogr.GetDriverByName("GPKG").CreateDataSource(self.path)
+        _write_layer(
+            data,
+            "trails_new",
+            [("", "LINESTRING (0 0, 10 0)"), ("", "LINESTRING (20 0, 30 0)")],
+        )
+        _write_layer(
+            data,
+            "roads",
+            [
+                ("100", "LINESTRING (5 -5, 5 5)"),
+                ("101", "LINESTRING (25 -5, 25 5)"),
+                ("102", "LINESTRING (0 0, 10 0)"),
+            ],
+        )
+        data = None
+        self.reader = filesource.OGRFileReader([self.path])
+
+    def tearDown(self):
+        self.reader = None
+        self.tmpdir.cleanup()
+
+    def test_tables(self):
+        """Ensure the layers of a source are its tables."""
+        self.assertEqual(self.reader.get_tables("_new"), ["trails_new"])
+        self.assertEqual(self.reader.get_layer_epsg("roads"), "3857")
+
+    def test_intersections(self):
+        """Ensure intersections are found, except with identical geometries."""
+        intersections, ids = self.reader.intersections(
+            "trails_new", "roads", ids=True, distance_buffer=0.001
+        )
+        self.assertEqual(
+            sorted((i.x, i.y, i.intersecting_id) for i in intersections),
+            [(5.0, 0.0, "100"), (25.0, 0.0, "101")],
+        )
+        self.assertEqual(sorted(ids), ["100", "101"])
+        self.assertEqual(
+            sorted(
+                self.reader.intersecting_ids(
+                    "trails_new", "roads", distance_buffer=0.001
+                )
+            ),
+            ["100", "101"],
+        )
+
+    def test_bbox(self):
+        """Ensure only features and intersections owned by a bbox are read."""
+        bbox = [15, None, None, None]
+        features = list(self.reader.get_layer_iter("trails_new", bbox=bbox))
+        self.assertEqual(len(features), 1)
+        self.assertEqual(self.reader.get_num_features("trails_new", bbox=bbox), 1)
+        intersections = self.reader.intersections(
+            "trails_new", "roads", distance_buffer=0.001, bbox=bbox, owners=True
+        )
+        self.assertEqual([(i.x, i.y) for i in intersections], [(25.0, 0.0)])
+        self.assertEqual(intersections[0].owners, [(25.0, 0.0), (25.0, 0.0)])
+
+    def test_get_features_by_ids(self):
+        """Ensure features are returned in the order of their ids."""
+        features = list(
+            self.reader.get_features_by_ids("roads", ["102", "100", "999"], "osm_id")
+        )
+        self.assertEqual(
+            [f.GetFieldAsString(f.GetFieldIndex("osm_id")) for f in features],
+            ["102", "100"],
+        )
+
+    def test_get_features_by_ids_batches(self):
+        """Ensure features are found across batches, by field and by FID."""
+        features = list(
+            self.reader.get_features_by_ids(
+                "roads", ["102", "it's", "100", "101"], "osm_id", batch_size=2
+            )
+        )
+        self.assertEqual(
+            [f.GetFieldAsString(f.GetFieldIndex("osm_id")) for f in features],
+            ["102", "100", "101"],
+        )
+        fid_column = self.reader.get_fid_column("roads")
+        features = list(
+            self.reader.get_features_by_ids(
+                "roads", ["3", "", "1"], fid_column, batch_size=2
+            )
+        )
+        self.assertEqual([f.GetFID() for f in features], [3, 1])
@@ -29,7 +29,10 @@ DBHOST = os.environ.get("DBHOST", "test-db")
 
 # check if there's a db running @ specified port
 testsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-is_db = testsock.connect_ex((DBHOST, int(DBPORT))) == 0
+try:
+    is_db = testsock.connect_ex((DBHOST, int(DBPORT))) == 0
+except socket.gaierror:
+    is_db = False
 
 
 @unittest.skipUnless(is_db, f"DB not running at {DBHOST}:{DBPORT}, skipping test")
@@ -40,27 +43,45 @@ class TestGenerator(unittest.TestCase):
         """
         _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER, dbhost=DBHOST)
         isections = _l.intersections("new_ways", "original_ways")
-        nodes = generator._nodes_for_intersections(isections, iter(range(100000)))
+        nodes = generator._nodes_for_intersections(
+            isections, _l.get_geometry_epsg("new_ways"), iter(range(100000))
+        )
         self.assertEqual(len(nodes), len(isections))
 
-    def test_rtree_generator(self):
-        """Ensures that the rtree can be build with intersection db.
-        We test this by ensuring that the rtree can return the nearest
-        point to another point."""
+    def test_feature_nodes_generator(self):
+        """Ensures that intersection Nodes are assigned to the features
+        they were found on: every intersecting Way has at least one."""
         _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER, dbhost=DBHOST)
-        nds, rt, _ids = generator._generate_intersection_db(
+        nds, feature_nodes, ids = generator._generate_intersection_db(
             "new_ways", ["original_ways"], _l, iter(range(100000))
         )
-        nearest_seattle = [
-            n.object
-            for n in rt.nearest((-122.33, 47.60, -122.33, 47.60), 1, objects=True)
-        ]
-        self.assertTrue(len(nearest_seattle) == 1)
+        self.assertTrue(len(ids[0]) > 0)
+        for osm_id in ids[0]:
+            self.assertTrue(len(feature_nodes.for_way(osm_id)) > 0)
+            self.assertTrue(all(n in nds for n in feature_nodes.for_way(osm_id)))
+
+    def test_concurrent_intersections(self):
+        """Ensures that intersection queries run concurrently produce
+        the same Nodes and assignments as queries run one at a time."""
+        _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER, dbhost=DBHOST)
+        others = ["original_ways", "original_ways"]
+        sequential = generator._generate_intersection_db(
+            "new_ways", others, _l, iter(range(100000)), self=True, query_workers=1
+        )
+        concurrent = generator._generate_intersection_db(
+            "new_ways", others, _l, iter(range(100000)), self=True, query_workers=3
+        )
+        self.assertEqual(sequential[0], concurrent[0])
+        self.assertEqual(sequential[2], concurrent[2])
+        self.assertEqual(
+            {k: list(v) for k, v in sequential[1].by_fid.items()},
+            {k: list(v) for k, v in concurrent[1].by_fid.items()},
+        )
 
     def test_way_node_generator(self):
         _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER, dbhost=DBHOST)
         id_gen = iter(range(100000))
-        nds, rt, _ids = generator._generate_intersection_db(
+        nds, feature_nodes, _ids = generator._generate_intersection_db(
             "new_ways", ["original_ways"], _l, id_gen
         )
 
@@ -71,9 +92,9 @@ class TestGenerator(unittest.TestCase):
         feat_geom = wkt.loads(feat.GetGeometryRef().ExportToWkt())
 
         # get expected node ID
-        isection_node_id = list(rt.intersection(feat_geom.bounds))[0]
+        isection_node_id = generator._on_geometry(nds, feat_geom)[0].id
         # ensure that node id is present in the resulting Way
-        ways, nodes = generator._generate_ways_and_nodes(feat_geom, id_gen, [], rt)
+        ways, nodes = generator._generate_ways_and_nodes(feat_geom, id_gen, [], nds)
         self.assertIn(isection_node_id, ways[0].nds)
 
     def test_waysplitter(self):
@@ -161,6 +182,124 @@ class TestGenerator(unittest.TestCase):
 
         os.remove(changefile_output.name)
 
+    def test_generate_changes_with_resolved_way_ids(self):
+        """Ensure that providing Way IDs and Node IDs resolved for
+        the whole run (as the CLI does) produces the same changefile."""
+        _l = db.OGRDBReader(DBNAME, DBPORT, DBUSER, dbhost=DBHOST)
+        intersections = generator._query_intersections(
+            "new_ways", ["original_ways"], _l
+        )
+        way_node_map = generator._get_way_node_map(
+            "test/data/osmdata.osm.pbf", generator._intersecting_ids(intersections[0])
+        )
+
+        outputs = []
+        for resolved in [{}, {"way_node_map": way_node_map}]:
+            changefile_output = tempfile.NamedTemporaryFile(delete=False)
+            if resolved:
+                resolved["intersections"] = intersections
+                resolved["deletion_way_ids"] = []
+            generator.generate_changes(
+                "new_ways",
+                "original_ways",
+                [],
+                DBNAME,
+                DBPORT,
+                DBUSER,
+                None,
+                DBHOST,
+                "test/data/osmdata.osm.pbf",
+                changefile_output.name,
+                compress=False,
+                **resolved,
+            )
+            with open(changefile_output.name, "r") as cf:
+                doc = etree.parse(cf)
+                outputs.append(
+                    (
+                        doc.xpath("count(//create/way)"),
+                        doc.xpath("count(//modify/way)"),
+                        doc.xpath("count(//modify/way/nd)"),
+                    )
+                )
+            os.remove(changefile_output.name)
+
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_generate_changes_parallel(self):
+        """Ensure processing features in a process pool produces the same
+        changes, deterministically, with unique IDs."""
+        outputs = []
+        for workers in [1, 2, 2]:
+            changefile_output = tempfile.NamedTemporaryFile(delete=False)
+            generator.generate_changes(
+                "new_ways",
+                "original_ways",
+                [],
+                DBNAME,
+                DBPORT,
+                DBUSER,
+                None,
+                DBHOST,
+                "test/data/osmdata.osm.pbf",
+                changefile_output.name,
+                self_intersections=True,
+                compress=False,
+                workers=workers,
+            )
+            with open(changefile_output.name, "r") as cf:
+                doc = etree.parse(cf)
+                ids = doc.xpath("//create/*/@id")
+                self.assertEqual(len(ids), len(set(ids)))
+                outputs.append(
+                    (
+                        doc.xpath("count(//create/way)"),
+                        doc.xpath("count(//create/node)"),
+                        doc.xpath("count(//modify/way)"),
+                        sorted(ids),
+                    )
+                )
+            os.remove(changefile_output.name)
+
+        self.assertEqual(outputs[0][:3], outputs[1][:3])
+        self.assertEqual(outputs[1], outputs[2])
+
+    def test_generate_changes_tiled(self):
+        """Ensure processing features tile by tile produces the same
+        changes, with intersections on tile edges shared between tiles."""
+        outputs = []
+        for tile_size in [None, 2000]:
+            changefile_output = tempfile.NamedTemporaryFile(delete=False)
+            generator.generate_changes(
+                "new_ways",
+                "original_ways",
+                [],
+                DBNAME,
+                DBPORT,
+                DBUSER,
+                None,
+                DBHOST,
+                "test/data/osmdata.osm.pbf",
+                changefile_output.name,
+                self_intersections=True,
+                compress=False,
+                tile_size=tile_size,
+            )
+            with open(changefile_output.name, "r") as cf:
+                doc = etree.parse(cf)
+                ids = doc.xpath("//create/*/@id")
+                self.assertEqual(len(ids), len(set(ids)))
+                outputs.append(
+                    (
+                        doc.xpath("count(//create/way)"),
+                        doc.xpath("count(//create/node)"),
+                        doc.xpath("count(//modify/way)"),
+                    )
+                )
+            os.remove(changefile_output.name)
+
+        self.assertEqual(outputs[0], outputs[1])
+
     def test_generate_changes_create_new_points(self):
         """Test whether points generated from the DB table are present in changefile."""
 
@@ -245,8 +384,151 @@ class TestGenerator(unittest.TestCase):
         feat = nl_layer.GetNextFeature()
         feat_geom = wkt.loads(feat.GetGeometryRef().ExportToWkt())
 
-        idx = generator._get_point_insertion_index(
-            feat_geom, sg.Point(-13176331.8, 6216657.1)
-        )
+        idx = generator._get_point_insertion_indices(
+            feat_geom, [sg.Point(-13176331.8, 6216657.1)]
+        )[0]
 
         self.assertEqual(idx, CORRECT_INSERTION_INDEX)
+
+
+class TestGeneratorLogic(unittest.TestCase):
+    """Tests of generator functions that don't need a database."""
+
+    def test_get_way_node_map(self):
+        """Ensure that only requested Ways are returned, with their node refs."""
+        way_node_map = generator._get_way_node_map(
+            "test/data/osmdata.osm.pbf", ["5878084", 5878104, "1"]
+        )
+        self.assertEqual(set(way_node_map.keys()), {5878084, 5878104})
+        self.assertEqual(list(way_node_map["5878084"][:2]), [47673411, 47673412])
+        self.assertEqual(
+            len(generator._get_way_node_map("test/data/osmdata.osm.pbf", [])), 0
+        )
+
+    def test_max_ids_for_geometry(self):
+        """Ensure the ID bound covers every vertex of every ring."""
+        polygon = ogr.CreateGeometryFromWkt(
+            "POLYGON ((0 0, 1 0, 1 1, 0 0), (0.1 0.1, 0.5 0.1, 0.5 0.2, 0.1 0.1))"
+        )
+        self.assertEqual(generator._max_ids_for_geometry(polygon), 17)
+
+    def test_id_allocator_blocks_are_disjoint(self):
+        """Ensure IDs from a shared IdAllocator never repeat."""
+        allocator = generator.IdAllocator(100)
+        ids_a = generator._allocated_id_gen(allocator, False, block_size=3)
+        ids_b = generator._allocated_id_gen(allocator, False, block_size=3)
+        generated = [next(ids) for _ in range(5) for ids in (ids_a, ids_b)]
+        self.assertEqual(len(set(generated)), len(generated))
+        self.assertTrue(all(i >= 100 for i in generated))
+
+    def test_point_insertion_many(self):
+        """Ensure that batched point insertion matches single insertion."""
+        line = sg.LineString([(0, 0), (1, 0), (2, 0), (2, 2)])
+        points = [
+            sg.Point(0.5, 0),
+            sg.Point(1.5, 0.1),
+            sg.Point(2, 1),
+            sg.Point(2, 2),
+            sg.Point(-1, 0),
+        ]
+
+        idxs = generator._get_point_insertion_indices(line, points)
+
+        self.assertEqual(list(idxs), [1, 2, 3, 3, 1])
+
+    def test_snap_to_nodes_with_feature_nodes(self):
+        """Ensure snapping with the index of a FeatureNodes only
+        snaps to the given Nodes, like an index of those Nodes."""
+        nodes = [
+            Node(id=-(i + 1), version=1, lat=0.0, lon=i * 0.001, tags=[])
+            for i in range(10)
+        ]
+        feature_nodes = generator.FeatureNodes()
+        for i, node in enumerate(nodes):
+            feature_nodes.add(node, fid=i % 2)
+        feature = feature_nodes.for_feature(1)
+        xs, ys = [0.00301, 0.00402, 0.1], [0.0, 0.0, 0.0]
+        self.assertEqual(
+            list(generator._snap_to_nodes(xs, ys, feature, feature_nodes)),
+            list(generator._snap_to_nodes(xs, ys, feature)),
+        )
+        self.assertEqual(
+            list(generator._snap_to_nodes(xs, ys, feature, feature_nodes)),
+            [1, -1, -1],
+        )
+
+    def test_merge_intersection_nodes(self):
+        """Ensure that intersection nodes are merged in order along the way,
+        replacing nodes that already exist on it."""
+        coords = [(0, 0), (1, 0), (2, 0), (2, 2)]
+        add_nodes = [
+            Node(id=10, lat=0, lon=1.5, version=1, tags=[]),
+            Node(id=11, lat=0, lon=0.2, version=1, tags=[]),
+            Node(id=12, lat=0, lon=0.7, version=1, tags=[]),
+            Node(id=13, lat=2, lon=2, version=1, tags=[]),
+        ]
+
+        nds, replaced = generator._merge_intersection_nodes(
+            coords, [1, 2, 3, 4], add_nodes
+        )
+
+        self.assertEqual(nds, [1, 11, 12, 2, 10, 3, 13])
+        self.assertEqual(replaced, {4: 13})
+
+    def test_feature_nodes(self):
+        """Ensure that each feature gets its own intersection Nodes,
+        once each and in the order they were assigned."""
+        a = Node(id=10, lat=0, lon=1, version=1, tags=[])
+        b = Node(id=11, lat=1, lon=1, version=1, tags=[])
+        feature_nodes = generator.FeatureNodes()
+        feature_nodes.add(a, fid=1, osm_id="100")
+        feature_nodes.add(b, fid=1, osm_id=101)
+        feature_nodes.add(a, fid=2, osm_id="101")
+        feature_nodes.add(a, fid=1)
+
+        self.assertEqual(feature_nodes.for_feature(1), [a, b])
+        self.assertEqual(feature_nodes.for_feature(2), [a])
+        self.assertEqual(feature_nodes.for_feature(3), [])
+        self.assertEqual(feature_nodes.for_way("100"), [a])
+        self.assertEqual(feature_nodes.for_way(101), [b, a])
+
+    def test_ways_and_nodes_with_feature_nodes(self):
+        """Ensure that a feature's intersection Nodes are snapped to
+        or inserted in its Way, and that other Nodes are not."""
+        line = sg.LineString([(0, 0), (1, 0), (2, 0)])
+        feature_nodes = [
+            Node(id=-1, lat=0, lon=1.00001, version=1, tags=[]),
+            Node(id=-2, lat=0.00001, lon=1.5, version=1, tags=[]),
+            Node(id=-3, lat=1, lon=1, version=1, tags=[]),
+        ]
+        ways, nodes = generator._generate_ways_and_nodes(
+            line, iter(range(100, 200)), [], feature_nodes
+        )
+        self.assertEqual(ways[0].nds, [100, -1, -2, 101])
+        self.assertEqual([n.id for n in nodes], [100, 101])
+
+    def test_tags_from_batch(self):
+        """Ensure tags derived from a batch of columns match tags
+        derived one feature at a time."""
+        columns = {
+            "name": ["a", "b"],
+            "width": [generator._field_string(1.5), generator._field_string(None)],
+            "tags": ['"surface"=>"dirt", "name"=>"c"', ""],
+        }
+        tags = generator._generate_tags_from_batch(
+            columns, ["name", "width", "tags"], 2, hstore_column="tags"
+        )
+        self.assertEqual(
+            tags,
+            [
+                [
+                    generator.Tag(key="name", value="a"),
+                    generator.Tag(key="width", value="1.5"),
+                    generator.Tag(key="surface", value="dirt"),
+                ],
+                [
+                    generator.Tag(key="name", value="b"),
+                    generator.Tag(key="width", value=""),
+                ],
+            ],
+        )
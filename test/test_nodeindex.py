@@ -0,0 +1,58 @@
+import math
+import pickle
+import unittest
+
+from changegen.changewriter import Node
+from changegen.nodeindex import NodeIndex
+
+test_nodes = [
+    Node(id=-(i + 1), version=1, lat=(i * 7 % 13) / 13.0, lon=i / 50.0, tags=[])
+    for i in range(50)
+]
+
+
+class TestNodeIndex(unittest.TestCase):
+    """Test bulk-loaded intersection node index"""
+
+    def test_nearest_within(self):
+        """Ensure every point snaps to its nearest point within tolerance."""
+        index = NodeIndex.from_nodes(test_nodes, capacity=4)
+        xs = [test_nodes[3].lon + 0.00005, test_nodes[40].lon, 5.0]
+        ys = [test_nodes[3].lat, test_nodes[40].lat - 0.00002, 5.0]
+        self.assertEqual(list(index.nearest_within(xs, ys, 0.0001)), [3, 40, -1])
+        self.assertEqual(list(index.nearest_within(xs, ys, 0.00001)), [-1, -1, -1])
+
+    def test_nearest_within_brute_force(self):
+        """Ensure snapping matches a brute force search."""
+        index = NodeIndex.from_nodes(test_nodes, capacity=4)
+        xs = [i / 37.0 for i in range(40)]
+        ys = [(i * 5 % 11) / 11.0 for i in range(40)]
+        expected = []
+        for x, y in zip(xs, ys):
+            d = [math.hypot(n.lon - x, n.lat - y) for n in test_nodes]
+            expected.append(d.index(min(d)) if min(d) < 0.05 else -1)
+        self.assertEqual(list(index.nearest_within(xs, ys, 0.05)), expected)
+
+    def test_nearest_within_among(self):
+        """Ensure only the given positions are considered."""
+        index = NodeIndex.from_nodes(test_nodes, capacity=4)
+        n = test_nodes[20]
+        self.assertEqual(list(index.nearest_within([n.lon], [n.lat], 0.1)), [20])
+        self.assertEqual(
+            list(index.nearest_within([n.lon], [n.lat], 0.1, among=[16, 22])), [22]
+        )
+        self.assertEqual(
+            list(index.nearest_within([n.lon], [n.lat], 0.1, among=[0])), [-1]
+        )
+
+    def test_empty(self):
+        """Ensure an empty index can be queried."""
+        index = NodeIndex.from_nodes([])
+        self.assertEqual(len(index), 0)
+        self.assertEqual(list(index.nearest_within([0], [0], 1)), [-1])
+
+    def test_pickle(self):
+        """Ensure indexes can be sent between processes."""
+        index = pickle.loads(pickle.dumps(NodeIndex.from_nodes(test_nodes)))
+        self.assertEqual(list(index.nearest_within([0], [0], 0.001)), [0])
+        self.assertEqual(index.nodes, test_nodes)
@@ -0,0 +1,35 @@
+import os
+import unittest
+
+import osmium
+
+from changegen import pbf
+
+OSMSRC = "test/data/osmdata.osm.pbf"
+
+
+class TestPBF(unittest.TestCase):
+    """Test block-level PBF access"""
+
+    def test_get_blocks(self):
+        """Ensure blocks start with a header and cover the whole file."""
+        blocks = pbf.get_blocks(OSMSRC)
+        self.assertEqual(blocks[0][0], "OSMHeader")
+        self.assertTrue(all(b[0] == "OSMData" for b in blocks[1:]))
+        offset = 0
+        for _, block_offset, length in blocks:
+            self.assertEqual(block_offset, offset)
+            offset += length
+        self.assertEqual(offset, os.path.getsize(OSMSRC))
+
+    def test_parallel_way_node_map(self):
+        """Ensure the parallel lookup finds the same Ways as a serial scan."""
+        ids = {w.id for w in osmium.FileProcessor(OSMSRC, osmium.osm.WAY)}
+        wanted = set(sorted(ids)[::10])
+        serial = {
+            w.id: [n.ref for n in w.nodes]
+            for w in osmium.FileProcessor(OSMSRC, osmium.osm.WAY)
+            if w.id in wanted
+        }
+        parallel = pbf.get_way_node_map(OSMSRC, wanted, 2)
+        self.assertEqual({k: list(parallel[k]) for k in parallel}, serial)
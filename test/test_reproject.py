@@ -0,0 +1,94 @@
+import unittest
+
+import shapely.geometry as sg
+from shapely.ops import transform
+
+from changegen import reproject
+
+test_geoms = [
+    sg.Point(-13176331.8, 6216657.1),
+    sg.LineString([(-13176331.8, 6216657.1), (-13176000.0, 6216000.0)]),
+    sg.Polygon(
+        [(0, 0), (100000, 0), (100000, 100000)],
+        [[(10000, 1000), (50000, 1000), (50000, 40000)]],
+    ),
+    sg.MultiLineString([[(0, 0), (1, 1)], [(5, 5), (6, 6)]]),
+    sg.LineString(),
+]
+
+
+class _FailingTransformer(object):
+    """Wraps a Transformer, failing to transform the point <bad>."""
+
+    def __init__(self, transformer, bad):
+        self.transformer = transformer
+        self.bad = bad
+
+    def transform(self, xs, ys):
+        if any((x, y) == self.bad for x, y in zip(xs, ys)):
+            raise ValueError("can't transform")
+        return self.transformer.transform(xs, ys)
+
+
+class TestReproject(unittest.TestCase):
+    """Test batched reprojection"""
+
+    def test_transformer_cached(self):
+        """Ensure one Transformer is built per EPSG code."""
+        self.assertIs(reproject.transformer(3857), reproject.transformer("3857"))
+
+    def test_reproject_geometries(self):
+        """Ensure batched reprojection matches per-coordinate reprojection."""
+        transformer = reproject.transformer(3857)
+        reprojected = reproject.reproject_geometries(test_geoms, transformer)
+        for geom, expected in zip(reprojected, test_geoms):
+            expected = transform(transformer.transform, expected)
+            self.assertEqual(geom.geom_type, expected.geom_type)
+            self.assertTrue(geom.equals_exact(expected, 1e-9))
+
+    def test_reproject_wgs84(self):
+        """Ensure geometries already in WGS84 are left as they are."""
+        self.assertIsNone(reproject.transformer(4326))
+        reprojected = reproject.reproject_geometries(test_geoms, None)
+        self.assertEqual(reprojected, test_geoms)
+
+    def test_reprojected_features_skips_bad_geometries(self):
+        """Ensure a feature whose geometry can't be read or reprojected
+        is skipped, and the rest of its batch is reprojected."""
+        transformer = reproject.transformer(3857)
+        features = [(1, test_geoms[0]), (2, "bad"), (3, None), (4, test_geoms[1])]
+
+        def _geometry(feature):
+            if feature[1] == "bad":
+                raise ValueError("bad geometry")
+            return feature[1]
+
+        with self.assertLogs(level="WARNING"):
+            reprojected = list(
+                reproject.reprojected_features(
+                    features,
+                    transformer,
+                    geometry=_geometry,
+                    fid=lambda feature: feature[0],
+                )
+            )
+        self.assertEqual([f[0] for f, _ in reprojected], [1, 3, 4])
+        self.assertIsNone(reprojected[1][1])
+        self.assertTrue(
+            reprojected[2][1].equals_exact(
+                transform(transformer.transform, test_geoms[1]), 1e-9
+            )
+        )
+
+        # a geometry that fails only when reprojected
+        features = [(1, test_geoms[0]), (2, sg.Point(0, 0)), (4, test_geoms[1])]
+        with self.assertLogs(level="WARNING"):
+            reprojected = list(
+                reproject.reprojected_features(
+                    features,
+                    _FailingTransformer(transformer, (0, 0)),
+                    geometry=_geometry,
+                    fid=lambda feature: feature[0],
+                )
+            )
+        self.assertEqual([f[0] for f, _ in reprojected], [1, 4])
@@ -0,0 +1,95 @@
+import pickle
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from changegen import __main__ as cli
+from changegen import session as session_module
+from changegen.generator import IdAllocator
+from changegen.session import Session
+
+
+class FakeFeature(object):
+    def __init__(self, osm_id):
+        self.osm_id = osm_id
+
+    def GetFieldIndex(self, field):
+        return field
+
+    def GetFieldAsString(self, index):
+        return self.osm_id
+
+
+class FakeDBReader(object):
+    def __init__(self, ids):
+        self.ids = ids
+        self.reads = 0
+
+    def get_layer_iter(self, layer):
+        self.reads += 1
+        return (FakeFeature(i) for i in self.ids)
+
+
+def _worker_session_state():
+    session = cli._table_worker_session
+    return session._db_reader, session.deletion_way_ids
+
+
+def _worker_detached_db_readers():
+    return [r.ids for r in session_module._detached_db_readers]
+
+
+class TestSession(unittest.TestCase):
+    """Test state shared by the steps of a run"""
+
+    def test_deletion_way_ids_read_once(self):
+        """Ensure deletion IDs are read from the database once per table."""
+        session = Session("db", 5432, "user")
+        session._db_reader = FakeDBReader(["1", "2"])
+        self.assertEqual(session.get_deletion_way_ids("trails_deletions"), ["1", "2"])
+        self.assertEqual(session.get_deletion_way_ids("trails_deletions"), ["1", "2"])
+        self.assertEqual(session._db_reader.reads, 1)
+
+    def test_pickle_without_connection(self):
+        """Ensure a pickled Session keeps its parameters and resolved IDs,
+        but not its connection."""
+        session = Session("db", 5432, "user", transform_srid=4326)
+        session._db_reader = FakeDBReader(["1"])
+        session.get_deletion_way_ids("trails_deletions")
+
+        copy = pickle.loads(pickle.dumps(session))
+        self.assertIsNone(copy._db_reader)
+        self.assertEqual(copy.params, session.params)
+        self.assertEqual(copy.deletion_way_ids, {"trails_deletions": ["1"]})
+        self.assertIs(session._db_reader.__class__, FakeDBReader)
+
+    def test_table_workers_open_own_connection(self):
+        """Ensure table worker processes don't use the Session's
+        open connection (inherited when forked)."""
+        session = Session("db", 5432, "user")
+        session._db_reader = FakeDBReader(["1"])
+        session.get_deletion_way_ids("trails_deletions")
+        with ProcessPoolExecutor(
+            max_workers=1,
+            initializer=cli._init_table_worker,
+            initargs=(IdAllocator(), session),
+        ) as pool:
+            db_reader, deletion_way_ids = pool.submit(_worker_session_state).result()
+        self.assertIsNone(db_reader)
+        self.assertEqual(deletion_way_ids, {"trails_deletions": ["1"]})
+
+    def test_table_workers_clear_detached(self):
+        """Ensure a table worker only keeps the connection it inherited
+        itself, not those detached by its parent."""
+        session = Session("db", 5432, "user")
+        session._db_reader = FakeDBReader(["1"])
+        session_module._detached_db_readers.append(FakeDBReader(["parent"]))
+        try:
+            with ProcessPoolExecutor(
+                max_workers=1,
+                initializer=cli._init_table_worker,
+                initargs=(IdAllocator(), session),
+            ) as pool:
+                detached = pool.submit(_worker_detached_db_readers).result()
+        finally:
+            session_module._detached_db_readers.clear()
+        self.assertEqual(detached, [["1"]])
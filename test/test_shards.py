@@ -0,0 +1,135 @@
+import os
+import tempfile
+import unittest
+
+from lxml import etree
+
+from changegen import shards
+from changegen.changewriter import Node
+from changegen.changewriter import OSMChangeWriter
+from changegen.changewriter import Relation
+from changegen.changewriter import RelationMember
+from changegen.changewriter import Tag
+from changegen.changewriter import Way
+
+
+class TestShards(unittest.TestCase):
+    """Test shard planning and merging"""
+
+    def test_plan_shards_id_ranges(self):
+        """Ensure every shard has its own ID range."""
+        planned = shards.plan_shards(
+            {"a_new": [[None, None, 10, None], [10, None, None, None]]},
+            ["deletions"],
+            id_offset=1000,
+            ids_per_shard=100,
+        )
+        self.assertEqual(
+            [(s["id_offset"], s["id_limit"]) for s in planned],
+            [(1000, 1100), (1100, 1200), (1200, 1300)],
+        )
+        self.assertEqual([s["deletions"] for s in planned], [True, False, True])
+        self.assertEqual(len({s["output"] for s in planned}), len(planned))
+
+    def _write_shards(self, shard_changes):
+        """Writes change files (with their boundary node lists) for
+        [(creates, boundary node ids, compress)], and returns their paths."""
+        tmpdir = tempfile.mkdtemp()
+        paths = []
+        for i, (creates, boundary_nodes, compress) in enumerate(shard_changes):
+            paths.append(os.path.join(tmpdir, f"t.{i:04d}.osc"))
+            writer = OSMChangeWriter(paths[-1], compress=compress)
+            writer.add_create(creates)
+            writer.add_delete([Way(id=99, version=99, nds=[], tags=[])])
+            writer.close()
+            with open(shards.boundary_nodes_path(paths[-1]), "w") as f:
+                f.writelines(f"{n}\n" for n in boundary_nodes)
+        return paths, os.path.join(tmpdir, "t.osc")
+
+    def test_merge_changes(self):
+        """Ensure boundary nodes created by several shards at the same
+        location are merged, and deletions are written once."""
+        paths, outfile = self._write_shards(
+            [
+                (
+                    [
+                        Node(id=1, version=1, lat=10.0, lon=20.0, tags=[]),
+                        Node(id=2, version=1, lat=10.5, lon=20.5, tags=[]),
+                        Way(id=3, version=1, nds=[1, 2], tags=[Tag("highway", "path")]),
+                    ],
+                    [2],
+                    False,
+                ),
+                (
+                    [
+                        Node(id=101, version=1, lat=10.5, lon=20.5, tags=[]),
+                        Node(id=102, version=1, lat=11.0, lon=21.0, tags=[]),
+                        Way(id=103, version=1, nds=[101, 102], tags=[]),
+                    ],
+                    [101],
+                    True,
+                ),
+            ]
+        )
+        self.assertEqual(shards.merge_changes(paths, outfile), 1)
+
+        doc = etree.parse(outfile)
+        self.assertEqual(doc.xpath("//create/node/@id"), ["1", "2", "102"])
+        self.assertEqual(doc.xpath("//way[@id='103']/nd/@ref"), ["2", "102"])
+        self.assertEqual(doc.xpath("count(//delete/way)"), 1)
+
+    def test_merge_changes_only_boundary_nodes(self):
+        """Ensure Nodes that shards don't list as boundary nodes
+        (e.g. way vertices at the same location) are not merged."""
+        paths, outfile = self._write_shards(
+            [
+                (
+                    [
+                        Node(id=1, version=1, lat=10.0, lon=20.0, tags=[]),
+                        Way(id=2, version=1, nds=[1], tags=[]),
+                    ],
+                    [],
+                    False,
+                ),
+                (
+                    [
+                        Node(id=101, version=1, lat=10.0, lon=20.0, tags=[]),
+                        Way(id=102, version=1, nds=[101], tags=[]),
+                    ],
+                    [101],
+                    False,
+                ),
+            ]
+        )
+        self.assertEqual(shards.merge_changes(paths, outfile), 0)
+
+        doc = etree.parse(outfile)
+        self.assertEqual(doc.xpath("//create/node/@id"), ["1", "101"])
+
+    def test_merge_changes_relations(self):
+        """Ensure relation members referencing merged Nodes are updated."""
+        paths, outfile = self._write_shards(
+            [
+                ([Node(id=1, version=1, lat=10.0, lon=20.0, tags=[])], [1], False),
+                (
+                    [
+                        Node(id=101, version=1, lat=10.0, lon=20.0, tags=[]),
+                        Relation(
+                            id=102,
+                            version=1,
+                            members=[
+                                RelationMember(ref=101, type="node", role="via"),
+                                RelationMember(ref=101, type="way", role="from"),
+                            ],
+                            tags=[],
+                        ),
+                    ],
+                    [101],
+                    False,
+                ),
+            ]
+        )
+        self.assertEqual(shards.merge_changes(paths, outfile), 1)
+
+        doc = etree.parse(outfile)
+        self.assertEqual(doc.xpath("//relation[@id='102']/member/@ref"), ["1", "101"])
@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from changegen import sourceindex
+
+OSMSRC = "test/data/osmdata.osm.pbf"
+MAX_IDS = {"nodes": 1, "ways": 2, "relations": 3}
+
+
+class TestSourceIndex(unittest.TestCase):
+    """Test the source extract sidecar index"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.osmsrc = os.path.join(self.tmpdir, "osmdata.osm.pbf")
+        shutil.copyfile(OSMSRC, self.osmsrc)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_missing_index(self):
+        """Ensure no index is opened if one hasn't been built."""
+        self.assertIsNone(sourceindex.open_index(self.osmsrc))
+
+    def test_way_node_map(self):
+        """Ensure way node refs are read from the index."""
+        sourceindex.build_index(self.osmsrc)
+        index = sourceindex.open_index(self.osmsrc)
+        way_node_map = index.get_way_node_map(["5878084", 5878104, "1"])
+        index.close()
+        self.assertEqual(set(way_node_map.keys()), {5878084, 5878104})
+        self.assertEqual(list(way_node_map["5878084"][:2]), [47673411, 47673412])
+
+    def test_max_ids(self):
+        """Ensure max ids are only available when indexed."""
+        sourceindex.build_index(self.osmsrc)
+        index = sourceindex.open_index(self.osmsrc)
+        self.assertIsNone(index.get_max_ids())
+        index.close()
+
+        sourceindex.build_index(self.osmsrc, get_max_ids=lambda _: MAX_IDS)
+        index = sourceindex.open_index(self.osmsrc)
+        self.assertEqual(index.get_max_ids(), MAX_IDS)
+        index.close()
+
+    def test_stale_index(self):
+        """Ensure the index is ignored once the source extract changes."""
+        sourceindex.build_index(self.osmsrc)
+        os.utime(self.osmsrc, ns=(0, 0))
+        self.assertIsNone(sourceindex.open_index(self.osmsrc))
@@ -0,0 +1,61 @@
+import unittest
+
+from changegen import tiles
+
+
+class TestTiles(unittest.TestCase):
+    """Test tile grids and Nodes shared between tiles"""
+
+    def test_grid_cells(self):
+        """Ensure the grid covers the extent and is unbounded at its edges."""
+        cells = tiles.grid_cells([0, 0, 25, 10], 10)
+        self.assertEqual(
+            cells,
+            [[None, None, 10, None], [10, None, 20, None], [20, None, None, None]],
+        )
+
+    def test_tile_of(self):
+        """Ensure points are owned by the tile containing them,
+        including points outside the grid's extent."""
+        grid = tiles.TileGrid([0, 0, 20, 20], 10)
+        self.assertEqual(grid.tile_of(5, 5), 0)
+        self.assertEqual(grid.tile_of(10, 5), 1)
+        self.assertEqual(grid.tile_of(5, 15), 2)
+        self.assertEqual(grid.tile_of(-100, 100), 2)
+        self.assertEqual(grid.tile_of(100, 100), 3)
+
+    def test_clip_bbox(self):
+        """Ensure bboxes with unbounded sides are clipped."""
+        self.assertEqual(
+            tiles.clip_bbox([None, None, 10, None], [5, 0, 20, 20]), [5, 0, 10, 20]
+        )
+        self.assertEqual(
+            tiles.clip_bbox([10, None, None, None], None), [10, None, None, None]
+        )
+        self.assertIsNone(tiles.clip_bbox([None, None, 10, None], [10, 0, 20, 20]))
+
+    def test_owns(self):
+        """Ensure bboxes own points on their lower, not upper, bounds."""
+        self.assertTrue(tiles.owns([0, 0, 10, 10], 0, 5))
+        self.assertFalse(tiles.owns([0, 0, 10, 10], 10, 5))
+        self.assertTrue(tiles.owns([None, None, 10, None], -100, 100))
+
+    def test_shared_nodes(self):
+        """Ensure intersections between features owned by different tiles
+        share a Node, and Nodes are dropped once no tile needs them."""
+        grid = tiles.TileGrid([0, 0, 20, 10], 10)
+        shared_nodes = tiles.SharedNodes(grid, [0, 1])
+        ids = iter(range(100))
+
+        shared_nodes.start_tile(0)
+        shared = shared_nodes.node(1.0, 2.0, [(5, 5), (15, 5)], ids)
+        local = shared_nodes.node(3.0, 4.0, [(5, 5), (6, 5)], ids)
+        self.assertEqual(shared_nodes.created, [shared, local])
+        shared_nodes.finish_tile()
+        self.assertEqual(len(shared_nodes.nodes), 1)
+
+        shared_nodes.start_tile(1)
+        self.assertIs(shared_nodes.node(1.0, 2.0, [(15, 5), (5, 5)], ids), shared)
+        self.assertEqual(shared_nodes.created, [])
+        shared_nodes.finish_tile()
+        self.assertEqual(len(shared_nodes.nodes), 0)
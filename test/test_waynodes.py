@@ -0,0 +1,48 @@
+import pickle
+import unittest
+
+from changegen.waynodes import WayNodeMap
+
+test_ways = [(30, [7, 8, 9]), (10, [1, 2]), (20, []), (-5, [4])]
+
+
+class TestWayNodeMap(unittest.TestCase):
+    """Test compact Way -> Node map"""
+
+    def test_lookup(self):
+        """Ensure every Way's node ids are returned, by int or str id."""
+        m = WayNodeMap.from_ways(test_ways)
+        self.assertEqual(len(m), len(test_ways))
+        for way_id, nodes in test_ways:
+            self.assertEqual(list(m[way_id]), nodes)
+            self.assertEqual(list(m[str(way_id)]), nodes)
+            self.assertIn(str(way_id), m)
+
+    def test_sorted(self):
+        """Ensure Way ids are sorted regardless of input order."""
+        m = WayNodeMap.from_ways(test_ways)
+        self.assertEqual(list(m), sorted(w[0] for w in test_ways))
+
+    def test_missing(self):
+        """Ensure missing Ways raise KeyError like a dictionary."""
+        m = WayNodeMap.from_ways(test_ways)
+        self.assertNotIn(11, m)
+        self.assertNotIn("not an id", m)
+        self.assertIsNone(m.get(11))
+        with self.assertRaises(KeyError):
+            m["11"]
+        with self.assertRaises(KeyError):
+            WayNodeMap()[1]
+
+    def test_merge(self):
+        """Ensure merged maps contain all Ways."""
+        m = WayNodeMap.merge(
+            [WayNodeMap.from_ways(test_ways[:2]), WayNodeMap.from_ways(test_ways[2:])]
+        )
+        for way_id, nodes in test_ways:
+            self.assertEqual(list(m[way_id]), nodes)
+
+    def test_pickle(self):
+        """Ensure maps can be sent between processes."""
+        m = pickle.loads(pickle.dumps(WayNodeMap.from_ways(test_ways)))
+        self.assertEqual(list(m[30]), [7, 8, 9])
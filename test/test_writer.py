@@ -239,3 +239,12 @@ class TestWriter(unittest.TestCase):
         parsedRoot = parsed.getroot()
         self.assertTrue(parsedRoot.tag == "osmChange")
         xmloutput.close()
+
+    def test_coordinates(self):
+        """Ensure coordinates are written at 1e-7 degree resolution."""
+        self.assertEqual(changewriter.fixed(-122.33000004), -1223300000)
+        self.assertEqual(changewriter.fixed("47.6062095"), 476062095)
+        self.assertEqual(changewriter.format_coordinate(-122.33000004), "-122.33")
+        self.assertEqual(changewriter.format_coordinate(47.606209512), "47.6062095")
+        self.assertEqual(changewriter.format_coordinate(-0.00000001), "0")
+        self.assertEqual(changewriter.format_coordinate("47.60620951"), "47.60620951")